@@ -0,0 +1,273 @@
+"""Per-user running totals behind the productivity and profile pages.
+
+user_aggregates holds one row per user, kept current by the task routes
+inside the same transaction as the change itself: task counts and minutes,
+plus the completion streak and best day derived from user_stats. Run this module to
+rebuild the table from the base tables and report any drift:
+
+    python aggregates.py            # report drift and fix it
+    python aggregates.py --dry-run  # report only
+"""
+
+import sys
+import sqlite3
+
+from datetime import date, datetime, timedelta
+
+FIELDS = ("active_count", "completed_count", "total_estimated", "total_actual",
+          "current_streak", "longest_streak", "last_active_date", "best_day", "best_day_count")
+
+STREAK_FIELDS = ("current_streak", "longest_streak", "last_active_date", "best_day", "best_day_count")
+
+# Streak and best day per user from user_stats in one grouped pass.
+# Consecutive dates share the same julianday(date) - row_number, which
+# identifies each run ("gaps and islands"). {user_filter} is either empty
+# or "AND user_id = ?" (bound twice).
+STREAK_STATS_SQL = '''
+    WITH active AS (
+        SELECT user_id, date,
+               julianday(date) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date) AS run
+        FROM user_stats
+        WHERE tasks_completed > 0 {user_filter}
+    ),
+    runs AS (
+        SELECT user_id, COUNT(*) AS length, MAX(date) AS end_date
+        FROM active GROUP BY user_id, run
+    ),
+    latest AS (
+        SELECT user_id, MAX(length) AS longest_streak, MAX(end_date) AS last_active_date
+        FROM runs GROUP BY user_id
+    ),
+    ranked AS (
+        SELECT user_id, date, tasks_completed,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY tasks_completed DESC, date ASC) AS rank
+        FROM user_stats
+        WHERE tasks_completed > 0 {user_filter}
+    )
+    SELECT l.user_id, r.length AS current_streak, l.longest_streak, l.last_active_date,
+           b.date AS best_day, b.tasks_completed AS best_day_count
+    FROM latest l
+    JOIN runs r ON r.user_id = l.user_id AND r.end_date = l.last_active_date
+    JOIN ranked b ON b.user_id = l.user_id AND b.rank = 1
+'''
+
+# What user_aggregates should contain, computed from scratch in one pass
+EXPECTED_AGGREGATES_SQL = '''
+    SELECT u.id AS user_id,
+           COALESCE(t.active_count, 0) AS active_count,
+           COALESCE(c.completed_count, 0) AS completed_count,
+           COALESCE(c.total_estimated, 0) AS total_estimated,
+           COALESCE(c.total_actual, 0) AS total_actual,
+           COALESCE(s.current_streak, 0) AS current_streak,
+           COALESCE(s.longest_streak, 0) AS longest_streak,
+           s.last_active_date,
+           s.best_day,
+           COALESCE(s.best_day_count, 0) AS best_day_count
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS active_count
+        FROM tasks GROUP BY user_id
+    ) t ON t.user_id = u.id
+    LEFT JOIN (
+        -- Hot rows plus the rollups of the ones archive.py moved out
+        SELECT user_id, SUM(n) AS completed_count,
+               SUM(estimated) AS total_estimated,
+               SUM(actual) AS total_actual
+        FROM (
+            SELECT user_id, COUNT(*) AS n, SUM(estimated_time) AS estimated, SUM(actual_time) AS actual
+            FROM completed_tasks GROUP BY user_id
+            UNION ALL
+            SELECT user_id, SUM(completed_count), SUM(total_estimated), SUM(total_actual)
+            FROM completed_rollups GROUP BY user_id
+        ) GROUP BY user_id
+    ) c ON c.user_id = u.id
+    LEFT JOIN (''' + STREAK_STATS_SQL.format(user_filter="") + ''') s ON s.user_id = u.id
+'''
+
+
+def bump_aggregates(cur, user_id, active=0, completed=0, estimated=0, actual=0):
+    """Apply deltas to a user's totals. Call it on the cursor doing the
+    write so both land in the same transaction."""
+    cur.execute('''
+        INSERT INTO user_aggregates (user_id, active_count, completed_count, total_estimated, total_actual)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            active_count = active_count + excluded.active_count,
+            completed_count = completed_count + excluded.completed_count,
+            total_estimated = total_estimated + excluded.total_estimated,
+            total_actual = total_actual + excluded.total_actual
+    ''', (user_id, active, completed, estimated, actual))
+
+
+def read_counters(cur, user_id):
+    """The user's current totals as a dict, for JSON responses. The streak
+    only counts if it runs up to today, as on /profile."""
+    cur.execute('''
+        SELECT active_count, completed_count, total_estimated, total_actual,
+               current_streak, last_active_date, data_version
+        FROM user_aggregates WHERE user_id = ?
+    ''', (user_id,))
+    row = cur.fetchone()
+    if row is None:
+        return {'active_count': 0, 'completed_count': 0, 'total_estimated': 0, 'total_actual': 0,
+                'current_streak': 0, 'data_version': 0}
+    today = datetime.now().strftime("%Y-%m-%d")
+    return {
+        'active_count': row['active_count'],
+        'completed_count': row['completed_count'],
+        'total_estimated': row['total_estimated'],
+        'total_actual': row['total_actual'],
+        'current_streak': row['current_streak'] if row['last_active_date'] == today else 0,
+        'data_version': row['data_version'],
+    }
+
+
+def _day_before(day):
+    return (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+
+
+def _days_between(earlier, later):
+    return (date.fromisoformat(later) - date.fromisoformat(earlier)).days
+
+
+def streak_fields(day_counts):
+    """(current_streak, longest_streak, last_active_date, best_day,
+    best_day_count) from {YYYY-MM-DD: tasks_completed}, as STREAK_STATS_SQL
+    computes them from user_stats."""
+    days = sorted(day for day, count in day_counts.items() if count > 0)
+    if not days:
+        return 0, 0, None, None, 0
+    run = longest = 1
+    for previous, day in zip(days, days[1:]):
+        run = run + 1 if _day_before(day) == previous else 1
+        longest = max(longest, run)
+    best_count = max(day_counts[day] for day in days)
+    best_day = next(day for day in days if day_counts[day] == best_count)
+    return run, longest, days[-1], best_day, best_count
+
+
+def _streak_row(cur, user_id):
+    cur.execute("SELECT " + ", ".join(STREAK_FIELDS) + " FROM user_aggregates WHERE user_id = ?", (user_id,))
+    return tuple(cur.fetchone())
+
+
+def _save_streak_row(cur, user_id, values):
+    cur.execute("UPDATE user_aggregates SET " + ", ".join(f"{field} = ?" for field in STREAK_FIELDS)
+                + " WHERE user_id = ?", (*values, user_id))
+
+
+def recompute_streaks(cur, user_id):
+    """Rebuild one user's streak and best-day fields from user_stats."""
+    cur.execute(STREAK_STATS_SQL.format(user_filter="AND user_id = ?"), (user_id, user_id))
+    row = cur.fetchone()
+    _save_streak_row(cur, user_id, tuple(row[1:]) if row else (0, 0, None, None, 0))
+
+
+def record_day_completed(cur, user_id, day, day_count, added=1):
+    """Update streak and best day after `added` completions brought `day`
+    (YYYY-MM-DD, as stored in user_stats) to `day_count` tasks."""
+    bump_aggregates(cur, user_id)  # make sure the row exists
+    current, longest, last_active, best_day, best_count = _streak_row(cur, user_id)
+
+    if day_count == added:  # the day just became active
+        if last_active is None or day > last_active:
+            current = current + 1 if last_active == _day_before(day) else 1
+            last_active = day
+            longest = max(longest, current)
+        else:
+            # A newly active day behind the latest one can join two runs
+            recompute_streaks(cur, user_id)
+            return
+
+    # Earliest date wins a tie, as in a scan over the days in order
+    if day_count > best_count or (day_count == best_count and day < best_day):
+        best_day, best_count = day, day_count
+
+    _save_streak_row(cur, user_id, (current, longest, last_active, best_day, best_count))
+
+
+def record_day_uncompleted(cur, user_id, day, day_count):
+    """Update streak and best day after an unmark left `day` with
+    `day_count` tasks (0 when its user_stats row was removed)."""
+    current, longest, last_active, best_day, best_count = _streak_row(cur, user_id)
+
+    if day_count == 0:
+        in_current_run = last_active is not None and 0 <= _days_between(day, last_active) < current
+        # When the current run is shorter than the longest one, the longest
+        # is untouched and the current run can be patched without a rescan
+        if in_current_run and current < longest and day == last_active and current > 1:
+            # The run just gets one day shorter from the end
+            current, last_active = current - 1, _day_before(day)
+        elif in_current_run and current < longest and day != last_active:
+            # Only the days after the gap still count
+            current = _days_between(day, last_active)
+        else:
+            # The broken run may have been the longest, or the current
+            # one disappears entirely: rescan this user's days
+            recompute_streaks(cur, user_id)
+            return
+
+    if day == best_day:
+        # Best day lost a task; another day may now be ahead of it
+        cur.execute('''
+            SELECT date, tasks_completed FROM user_stats
+            WHERE user_id = ? AND tasks_completed > 0
+            ORDER BY tasks_completed DESC, date ASC LIMIT 1
+        ''', (user_id,))
+        row = cur.fetchone()
+        best_day, best_count = (row[0], row[1]) if row else (None, 0)
+
+    _save_streak_row(cur, user_id, (current, longest, last_active, best_day, best_count))
+
+
+def reconcile(connection, fix=True):
+    """Compare user_aggregates with the base tables.
+
+    Returns a list of (user_id, field, stored, expected) for every value
+    that drifted. With fix=True the table is rebuilt in one transaction.
+    """
+    expected = {row[0]: row[1:] for row in connection.execute(EXPECTED_AGGREGATES_SQL)}
+    stored = {row[0]: row[1:] for row in connection.execute(
+        "SELECT user_id, " + ", ".join(FIELDS) + " FROM user_aggregates")}
+
+    drift = []
+    for user_id in sorted(expected.keys() | stored.keys()):
+        # No row reads the same as a fresh one: zero counts, no dates
+        empty = tuple(None if field.endswith(("_date", "_day")) else 0 for field in FIELDS)
+        want = expected.get(user_id, empty)
+        have = stored.get(user_id, empty)
+        for field, stored_value, expected_value in zip(FIELDS, have, want):
+            if stored_value != expected_value:
+                drift.append((user_id, field, stored_value, expected_value))
+
+    if fix and drift:
+        # Upsert rather than rebuild so other columns survive, and bump
+        # data_version so cached pages pick up the corrected values
+        with connection:
+            connection.execute(
+                "INSERT INTO user_aggregates (user_id, " + ", ".join(FIELDS) + ") "
+                "SELECT * FROM (" + EXPECTED_AGGREGATES_SQL + ") WHERE true "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                + ", ".join(f"{field} = excluded.{field}" for field in FIELDS)
+                + ", data_version = data_version + 1")
+    return drift
+
+
+if __name__ == '__main__':
+    from config import Config
+    from shards import data_stores
+
+    fix = "--dry-run" not in sys.argv[1:]
+    drift = []
+    for path, _archive_path in data_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT):
+        connection = sqlite3.connect(path)
+        drift += reconcile(connection, fix=fix)
+        connection.close()
+    for user_id, field, stored_value, expected_value in drift:
+        print(f"user {user_id}: {field} stored={stored_value} expected={expected_value}")
+    if not drift:
+        print("user_aggregates is in sync.")
+    elif fix:
+        print(f"Rebuilt user_aggregates ({len(drift)} drifted values).")
+    else:
+        print(f"{len(drift)} drifted values (dry run, nothing changed).")
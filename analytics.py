@@ -0,0 +1,85 @@
+"""Completion trends for the charts on /productivity.
+
+One grouped query reads a year of one user's history from three places:
+
+    user_stats        -- tasks completed per day (the same counts behind
+                         the streaks)
+    completed_tasks   -- estimated/actual minutes of the hot rows
+    completed_rollups -- the same minutes for rows already archived
+
+and returns a row per active day. Everything else -- zero-filling quiet
+days, bucketing into weeks, laying out the heatmap -- is done in Python
+over those few hundred rows. The endpoint serving the result is wrapped in
+@cached_page, so it is computed again only after the user's data_version
+moves (completing or unmarking a task, among other writes) or the day
+changes.
+"""
+
+from datetime import date, timedelta
+
+from timecodec import local_date_sql, local_day_start_epoch
+
+DAILY_DAYS = 30
+WEEKLY_WEEKS = 26
+HEATMAP_WEEKS = 53
+
+# Completions are grouped by server-local day, as user_stats counts them
+SERIES_SQL = f'''
+    SELECT day, SUM(completed), SUM(estimated), SUM(actual)
+    FROM (
+        SELECT date AS day, tasks_completed AS completed, 0 AS estimated, 0 AS actual
+        FROM user_stats WHERE user_id = ? AND date >= ?
+        UNION ALL
+        SELECT {local_date_sql('completed_ts')}, 0, estimated_time, COALESCE(actual_time, 0)
+        FROM completed_tasks WHERE user_id = ? AND completed_ts >= ?
+        UNION ALL
+        SELECT date, 0, total_estimated, total_actual
+        FROM completed_rollups WHERE user_id = ? AND date >= ?
+    )
+    GROUP BY day
+'''
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def trend_series(cur, user_id, today):
+    """Daily completions, weekly estimated vs actual minutes and a heatmap
+    of completions for the weeks up to `today`, as plain JSON-able dicts."""
+    # The heatmap reaches furthest back, and starts on a Monday
+    first = _week_start(today) - timedelta(weeks=HEATMAP_WEEKS - 1)
+    since = first.isoformat()
+    cur.execute(SERIES_SQL, (user_id, since, user_id, local_day_start_epoch(first), user_id, since))
+    by_day = {row[0]: (row[1], row[2], row[3]) for row in cur.fetchall()}
+
+    def completed_on(day):
+        return by_day.get(day.isoformat(), (0, 0, 0))[0]
+
+    daily = [{"date": day.isoformat(), "completed": completed_on(day)}
+             for day in (today - timedelta(days=i) for i in range(DAILY_DAYS - 1, -1, -1))]
+
+    weekly_from = _week_start(today) - timedelta(weeks=WEEKLY_WEEKS - 1)
+    weeks = {weekly_from + timedelta(weeks=i): [0, 0, 0] for i in range(WEEKLY_WEEKS)}
+    for key, values in by_day.items():
+        bucket = weeks.get(_week_start(date.fromisoformat(key)))
+        if bucket is not None:
+            for i, value in enumerate(values):
+                bucket[i] += value
+    weekly = [{"week": week.isoformat(), "completed": c, "estimated": e, "actual": a}
+              for week, (c, e, a) in weeks.items()]
+
+    # One column per week, Monday first; days after today are left out
+    heatmap = []
+    for w in range(HEATMAP_WEEKS):
+        start = first + timedelta(weeks=w)
+        heatmap.append([completed_on(start + timedelta(days=d))
+                        for d in range(7) if start + timedelta(days=d) <= today])
+
+    return {
+        "today": today.isoformat(),
+        "daily": daily,
+        "weekly": weekly,
+        "heatmap": {"start": since, "weeks": heatmap},
+    }
+
@@ -1,11 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+import time
+IMPORT_STARTED = time.perf_counter()  # cold start is measured from here to the first response
+
+import hmac
+import queue
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, stream_with_context, g, jsonify, abort
+from werkzeug.utils import import_string
 from datetime import datetime, timezone , timedelta
 from functools import wraps
-import sqlite3
-import os
 from init_db import create_tables
-import pytz
-from math import ceil
+from db import get_db_connection, get_directory_connection, get_pool, user_store, init_app as init_db_pool
+from scheduler import select_tasks
+from estimates import adjust as adjust_estimates
+from planner import METHODS as PLAN_METHODS, plan_days
+from analytics import trend_series
+from search import search_tasks
+from repository import completed_filter_sql
+from shards import copy_user, shard_stores
+from writer import run_write
+from import_tasks import READERS as IMPORT_READERS, guess_format as guess_import_format, import_stream
+from export import EXPORT_COLUMNS, ENCODERS, MIMETYPES, ChainedCursor, export_stream
+from cache import cached_page, get_fragment_cache
+from task_actions import MAX_BATCH, parse_task_fields
+from timecodec import now_epoch, to_epoch, to_text, day_start_epoch, format_epoch
+import events
+import metrics
 
 def login_required(f):
     @wraps(f)
@@ -15,37 +33,118 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def parse_timestamp(ts):
-    if ts is None or ts == "":
-        return None
-    try:
-        return datetime.strptime(ts, "%Y-%m-%d %H:%M:%S.%f")
-    except ValueError:
-        # fallback if no microseconds part
-        return datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
+def api_login_required(f):
+    """login_required for the JSON API: a 401 instead of a redirect."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify(error="Login required."), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def monitoring_token_required(f):
+    """For the monitoring endpoints: a 404, as if they didn't exist, unless
+    METRICS_TOKEN is set and the request sends it as a bearer token."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = app.config['METRICS_TOKEN']
+        auth = request.authorization
+        if (not token or auth is None or auth.type != 'bearer'
+                or not hmac.compare_digest((auth.token or '').encode(), token.encode())):
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
+
+def completed_range(filter_option):
+    """(since_ts, until_ts) epoch bounds for the completed-task date filter."""
+    today = datetime.now().date()
+    if filter_option == 'today':
+        return day_start_epoch(today), day_start_epoch(today + timedelta(days=1))
+    if filter_option == 'last7':
+        return day_start_epoch(today - timedelta(days=7)), None
+    if filter_option == 'last30':
+        return day_start_epoch(today - timedelta(days=30)), None
+    return None, None
+
+
+def repository(cur=None):
+    """The storage interface (see repository.py) that the REPOSITORY setting
+    builds, on `cur` or else the request's connection."""
+    return app.extensions['repository'](cur if cur is not None else get_db_connection().cursor())
+
+
+def _repository_write(cur, method, *args):
+    return getattr(repository(cur), method)(*args)
+
+
+def repository_write(method, *args):
+    """Call the repository write `method` and return its result. It runs
+    through run_write, so it commits (or group-commits) as before."""
+    return run_write(_repository_write, method, *args)
+
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Replace with a strong key in production
-create_tables()
+app.config.from_object('config.Config')
+
+
+def create_app(config=None):
+    """Finish setting up the app and return it.
+
+    Importing this module only defines the routes. Migrations, the pool
+    teardown and the metrics hooks are set up here, once per process that
+    calls it: under gunicorn.conf.py that is the master (preload_app), so
+    the schema check runs once before the workers fork, not in each of
+    them. `config` is a mapping or object of settings applied over
+    config.Config. The routes live on the module-level app, so every call
+    returns that same app; only the first one does the setup.
+    """
+    if config is not None:
+        if isinstance(config, dict):
+            app.config.from_mapping(config)
+        else:
+            app.config.from_object(config)
+    if 'taskcrafter' in app.extensions:
+        return app
+    app.extensions['taskcrafter'] = True
+
+    factory = app.config['REPOSITORY']
+    app.extensions['repository'] = import_string(factory) if isinstance(factory, str) else factory
+
+    create_tables(app.config['DB_PATH'])
+    for path, _archive_path in shard_stores(app.config['DB_PATH'], app.config['ARCHIVE_DB_PATH'],
+                                            app.config['SHARD_COUNT']):
+        create_tables(path)
+    if app.config['METRICS_ENABLED']:
+        metrics.init_app(app, started=IMPORT_STARTED)
+        init_db_pool(app, on_query=metrics.record_query)
+    else:
+        init_db_pool(app)
+    return app
+
+
+@app.before_request
+def require_create_app():
+    # `gunicorn app:app` and `flask run` find the module-level app without
+    # calling the factory: no schema check, and connections would never go
+    # back to the pool. Refuse to serve rather than run half set up.
+    if 'taskcrafter' not in app.extensions:
+        raise RuntimeError("app.create_app() was never called; serve 'app:create_app()' "
+                           "(gunicorn -c gunicorn.conf.py, or flask --app 'app:create_app()' run)")
 
-def get_db_connection():
-    conn = sqlite3.connect(os.getenv("DB_PATH", "taskcrafter.db"))
-    conn.row_factory = sqlite3.Row
-    return conn
 
 # ------------------------ AUTH ROUTES ------------------------
 
 @app.template_filter('to_ist')
 def to_ist(value, format="%d %b %Y %I:%M %p"):
+    """Render an epoch (or a legacy UTC text timestamp) in IST."""
     if value is None:
         return "N/A"
     try:
-        utc = pytz.utc
-        ist = pytz.timezone("Asia/Kolkata")
-        dt = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
-        dt_utc = utc.localize(dt)
-        dt_ist = dt_utc.astimezone(ist)
-        return dt_ist.strftime(format)
+        ts = to_epoch(value) if isinstance(value, str) else value
+        # Per-request memo: a page often repeats the same timestamps
+        memo = g.setdefault('rendered_times', {})
+        return format_epoch(ts, format, memo=memo)
     except Exception:
         return "Invalid time"
 
@@ -57,25 +156,29 @@ def signup():
         email = request.form['email']
         password = request.form['password']
 
-        conn = get_db_connection()
+        conn = get_directory_connection()
         cur = conn.cursor()
 
         cur.execute("SELECT * FROM users WHERE username = ?", (username,))
         if cur.fetchone():
             flash('Username already taken.', 'error')
-            conn.close()
             return redirect(url_for('signup'))
 
         cur.execute("SELECT * FROM users WHERE email = ?", (email,))
         if cur.fetchone():
             flash('Email already registered.', 'error')
-            conn.close()
             return redirect(url_for('signup'))
 
-        cur.execute("INSERT INTO users (username, email, password) VALUES (?, ?, ?)",
-                    (username, email, password))
+        created_ts = now_epoch()
+        cur.execute("INSERT INTO users (username, email, password, created_at, created_ts) VALUES (?, ?, ?, ?, ?)",
+                    (username, email, password, to_text(created_ts), created_ts))
         conn.commit()
-        conn.close()
+
+        if app.config['SHARD_COUNT']:
+            user_id = cur.lastrowid
+            shard = get_db_connection(user_id)
+            copy_user(shard.cursor(), user_id, username, email, to_text(created_ts), created_ts)
+            shard.commit()
 
         flash('Signup successful! Please log in.', 'success')
         return redirect(url_for('login'))
@@ -88,11 +191,10 @@ def login():
         identifier = request.form['identifier']
         password = request.form['password']
 
-        conn = get_db_connection()
+        conn = get_directory_connection()
         cur = conn.cursor()
         cur.execute("SELECT * FROM users WHERE username = ? OR email = ?", (identifier, identifier))
         user = cur.fetchone()
-        conn.close()
 
         if user and password == user['password']:
             session['user_id'] = user['id']
@@ -117,7 +219,7 @@ def reset_password():
         identifier = request.form['identifier']
         new_password = request.form['new_password']
 
-        conn = get_db_connection()
+        conn = get_directory_connection()
         cur = conn.cursor()
         cur.execute("SELECT * FROM users WHERE username = ? OR email = ?", (identifier, identifier))
         user = cur.fetchone()
@@ -129,7 +231,6 @@ def reset_password():
         else:
             flash('User not found.', 'error')
 
-        conn.close()
         return redirect(url_for('login'))
 
     return render_template('reset_password.html')
@@ -139,26 +240,18 @@ def reset_password():
 
 
 @app.route('/dashboard')
+@cached_page
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    user_id = session['user_id']
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, task_name, estimated_time, is_completed, start_time, is_paused
-        FROM tasks
-        WHERE user_id = ?
-        ORDER BY id DESC
-    """, (user_id,))
-    tasks = cur.fetchall()
-    conn.close()
-
-    # Just convert row to dict — no formatting
-    formatted_tasks = [dict(task) for task in tasks]
-
-    return render_template('dashboard.html', username=session['username'], tasks=formatted_tasks)
+    repo = repository()
+    # Read first: the live-update stream starts from this version and
+    # catches up on anything that lands before it connects
+    data_version = repo.counters(session['user_id'])['data_version']
+    tasks = repo.list_tasks(session['user_id'])
+    return render_template('dashboard.html', username=session['username'], tasks=tasks,
+                           data_version=data_version)
 
 
 
@@ -166,24 +259,16 @@ def dashboard():
 @login_required
 def add_task():
     if request.method == 'POST':
-        task_name = request.form['task_name']
-        description = request.form.get('description', '')
-        estimated_time = int(request.form['estimated_time'])
-
-        if estimated_time < 1:
-            flash("Estimated time must be at least 1 minute.", "error")
+        try:
+            task_name, estimated_time, priority = parse_task_fields(
+                request.form.get('task_name'), request.form.get('estimated_time'), request.form.get('priority', 0))
+        except ValueError as e:
+            flash(str(e), "error")
             return redirect(url_for('add_task'))
 
-        priority = int(request.form.get('priority', 0))
-
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('''
-            INSERT INTO tasks (user_id, task_name, description, estimated_time, priority, is_completed)
-            VALUES (?, ?, ?, ?, ?, 0)
-        ''', (session['user_id'], task_name, description, estimated_time, priority))
-        conn.commit()
-        conn.close()
+        task_id = repository_write("create_task", session['user_id'], task_name,
+                                   request.form.get('description', ''), estimated_time, priority)
+        notify("created", [task_id])
 
         return redirect(url_for('dashboard'))
 
@@ -192,29 +277,19 @@ def add_task():
 @app.route('/edit_task/<int:task_id>', methods=['GET', 'POST'])
 @login_required
 def edit_task(task_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     if request.method == 'POST':
-        task_name = request.form['task_name']
-        estimated_time = int(request.form['estimated_time'])
-
-        if estimated_time < 1:
-            flash("Estimated time must be at least 1 minute.", "error")
+        try:
+            task_name, estimated_time, priority = parse_task_fields(
+                request.form.get('task_name'), request.form.get('estimated_time'), request.form.get('priority', 0))
+        except ValueError as e:
+            flash(str(e), "error")
             return redirect(url_for('edit_task', task_id=task_id))
 
-        priority = request.form.get('priority', 0)  # will be string, can convert if needed
-
-        cur.execute('UPDATE tasks SET task_name = ?, estimated_time = ?, priority = ? WHERE id = ? AND user_id = ?',
-                    (task_name, estimated_time, priority, task_id, session['user_id']))
-        conn.commit()
-        conn.close()
+        if repository_write("update_task", session['user_id'], task_id, task_name, estimated_time, priority):
+            notify("updated", [task_id])
         return redirect(url_for('dashboard'))
 
-    cur.execute('SELECT * FROM tasks WHERE id = ? AND user_id = ?', (task_id, session['user_id']))
-    task = cur.fetchone()
-    conn.close()
-
+    task = repository().get_task(session['user_id'], task_id)
     if not task:
         return "Task not found", 404
 
@@ -227,11 +302,8 @@ def delete_task(task_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM tasks WHERE id = ? AND user_id = ?', (task_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    if repository_write("delete_tasks", session['user_id'], [task_id]):
+        notify("deleted", removed=[task_id])
 
     flash('Task deleted.', 'info')
     return redirect(url_for('dashboard'))
@@ -242,73 +314,18 @@ def mark_complete(task_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Fetch task details
-    cur.execute("SELECT * FROM tasks WHERE id = ? AND user_id = ?", (task_id, session['user_id']))
-    task = cur.fetchone()
-
-    if task:
-        if not task['start_time']:
-            flash("You must start the task before marking it complete.", "warning")
-            conn.close()
-            return redirect(url_for('dashboard'))
-
-        try:
-            start_time = datetime.strptime(task['start_time'], "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            start_time = datetime.strptime(task['start_time'], "%Y-%m-%d %H:%M:%S.%f")
-
-        # ✅ Normalize both times to UTC
-        utc = pytz.utc
-        start_time_utc = utc.localize(start_time)
-        completed_at_utc = datetime.utcnow().replace(tzinfo=utc)
-
-        # ✅ Correct time difference in seconds, then round to minutes
-        seconds_elapsed = (completed_at_utc - start_time_utc).total_seconds()
-        actual_time_minutes = max(1, ceil(seconds_elapsed / 60))
-
-        # ✅ Insert into completed_tasks table
-        cur.execute('''
-            INSERT INTO completed_tasks 
-            (user_id, task_name, description, estimated_time, actual_time, start_time, completed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            task['user_id'],
-            task['task_name'],
-            task['description'],
-            task['estimated_time'],
-            actual_time_minutes,
-            task['start_time'],
-            completed_at_utc.strftime("%Y-%m-%d %H:%M:%S")
-        ))
-
-        # ✅ Update user_stats table
-        today = datetime.now().strftime("%Y-%m-%d")
-        cur.execute('SELECT * FROM user_stats WHERE user_id = ? AND date = ?', (session['user_id'], today))
-        stats_row = cur.fetchone()
-
-        if stats_row:
-            cur.execute('''
-                UPDATE user_stats SET tasks_completed = tasks_completed + 1
-                WHERE user_id = ? AND date = ?
-            ''', (session['user_id'], today))
-        else:
-            cur.execute('''
-                INSERT INTO user_stats (user_id, date, tasks_completed)
-                VALUES (?, ?, 1)
-            ''', (session['user_id'], today))
-
-        # ✅ Remove from active task list
-        cur.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-        conn.commit()
+    # Moves the task to completed_tasks and updates user_stats and aggregates
+    completed, not_started = repository_write("complete_tasks", session['user_id'], [task_id])
+    if completed:
+        notify("completed", removed=completed)
 
+    if not_started:
+        flash("You must start the task before marking it complete.", "warning")
+    elif completed:
         flash("Task marked as Complete!", "success")
     else:
         flash("Task not found!", "error")
 
-    conn.close()
     return redirect(url_for('dashboard'))
 
 @app.route('/start_task/<int:task_id>')
@@ -316,16 +333,11 @@ def start_task(task_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    utc_now = datetime.now(pytz.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET start_time = ? WHERE id = ? AND user_id = ?",
-                (utc_now, task_id, session['user_id']))
-    conn.commit()
-    conn.close()
-
-    flash("Task started!", "success")
+    if repository_write("start_tasks", session['user_id'], [task_id]):
+        notify("started", [task_id])
+        flash("Task started!", "success")
+    else:
+        flash("That task has already been started.", "warning")
     return redirect(url_for('dashboard'))
 
 
@@ -333,11 +345,8 @@ def start_task(task_id):
 def pause_task(task_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET is_paused = 1 WHERE id = ? AND user_id = ?", (task_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    if repository_write("pause_tasks", session['user_id'], [task_id]):
+        notify("paused", [task_id])
     flash("Task paused.", "info")
     return redirect(url_for('dashboard'))
 
@@ -345,81 +354,331 @@ def pause_task(task_id):
 def resume_task(task_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE tasks SET is_paused = 0 WHERE id = ? AND user_id = ?", (task_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    if repository_write("resume_tasks", session['user_id'], [task_id]):
+        notify("resumed", [task_id])
     flash("Task resumed.", "success")
     return redirect(url_for('dashboard'))
 
 
-@app.route('/completed_tasks')
+BATCH_ACTIONS = {
+    'start': ("start_tasks", "started"),
+    'pause': ("pause_tasks", "paused"),
+    'resume': ("resume_tasks", "resumed"),
+    'delete': ("delete_tasks", "deleted"),
+}
+
+@app.route('/batch_tasks', methods=['POST'])
 @login_required
-def view_completed_tasks():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def batch_tasks():
+    action = request.form.get('action')
+    task_ids = [int(t) for t in request.form.getlist('task_ids') if t.isdigit()][:MAX_BATCH]
 
-    cur.execute("SELECT username FROM users WHERE id = ?", (session['user_id'],))
-    user = cur.fetchone()
-    username = user['username'] if user else "User"
+    if not task_ids or (action != 'complete' and action not in BATCH_ACTIONS):
+        flash("Select at least one task and an action.", "warning")
+        return redirect(url_for('dashboard'))
 
-    filter_option = request.args.get('filter', 'all')  # date filter
-    time_filter = request.args.get('time_filter', 'all')  # new time filter
+    # The whole batch is one transaction
+    if action == 'complete':
+        completed, not_started = repository_write("complete_tasks", session['user_id'], task_ids)
+        if completed:
+            notify("completed", removed=completed)
+            flash(f"{len(completed)} task(s) marked as Complete!", "success")
+        if not_started:
+            flash(f"{len(not_started)} task(s) skipped: start them before marking complete.", "warning")
+    else:
+        apply_action, past_tense = BATCH_ACTIONS[action]
+        changed = repository_write(apply_action, session['user_id'], task_ids)
+        if changed and action == 'delete':
+            notify(past_tense, removed=task_ids)
+        elif changed:
+            notify(past_tense, task_ids)
+        flash(f"{changed} task(s) {past_tense}.", "info")
+        if action == 'start' and changed < len(task_ids):
+            flash(f"{len(task_ids) - changed} task(s) skipped: already started.", "warning")
 
-    date_filter_sql = ""
-    params = [session['user_id']]
+    return redirect(url_for('dashboard'))
 
-    if filter_option == 'today':
-        date_filter_sql = "AND DATE(completed_at) = ?"
-        params.append(datetime.now().date())
-    elif filter_option == 'last7':
-        date_filter_sql = "AND DATE(completed_at) >= ?"
-        params.append((datetime.now() - timedelta(days=7)).date())
-    elif filter_option == 'last30':
-        date_filter_sql = "AND DATE(completed_at) >= ?"
-        params.append((datetime.now() - timedelta(days=30)).date())
-
-    cur.execute(f"""
-        SELECT * FROM completed_tasks
-        WHERE user_id = ? {date_filter_sql}
-        ORDER BY completed_at DESC
-    """, params)
-
-    rows = cur.fetchall()
-    conn.close()
-
-    completed = []
-    for row in rows:
-        actual = row['actual_time']
-        estimated = row['estimated_time']
-        qualifies = True
-
-        if time_filter == 'before' and not (actual is not None and actual < estimated):
-            qualifies = False
-        elif time_filter == 'on' and not (actual is not None and actual == estimated):
-            qualifies = False
-        elif time_filter == 'after' and not (actual is not None and actual > estimated):
-            qualifies = False
-
-        if qualifies:
-            completed.append({
-                'id': row['id'],
-                'user_id': row['user_id'],
-                'task_name': row['task_name'],
-                'description': row['description'],
-                'estimated_time': estimated,
-                'created_at': datetime.strptime(row['created_at'], "%Y-%m-%d %H:%M:%S") if row['created_at'] else None,
-                'completed_at': datetime.strptime(row['completed_at'], "%Y-%m-%d %H:%M:%S") if row['completed_at'] else None,
-                'actual_time': actual
-            })
+
+# ------------------------ JSON API ------------------------
+# The dashboard calls these with fetch() and patches the page in place; the
+# HTML routes above stay as the no-JavaScript fallback. Every response is
+# the changed task (or the id that left the list) plus the updated counters.
+
+def task_json(task):
+    task = dict(task)
+    task['start_display'] = to_ist(task['start_ts']) if task['start_ts'] else None
+    return task
+
+def api_result(repo, status=200, **payload):
+    payload['counters'] = repo.counters(session['user_id'])
+    return jsonify(payload), status
+
+def api_task_fields(current=None):
+    """Task fields from a JSON (or form) body; missing fields keep `current`."""
+    data = request.get_json(silent=True) or request.form
+    current = current or {}
+    return parse_task_fields(data.get('task_name', current.get('task_name')),
+                             data.get('estimated_time', current.get('estimated_time')),
+                             data.get('priority', current.get('priority', 0)))
+
+@app.route('/api/tasks', methods=['GET'])
+@api_login_required
+def api_list_tasks():
+    repo = repository()
+    return api_result(repo, tasks=[task_json(task) for task in repo.list_tasks(session['user_id'])])
+
+@app.route('/api/tasks', methods=['POST'])
+@api_login_required
+def api_create_task():
+    try:
+        task_name, estimated_time, priority = api_task_fields()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    data = request.get_json(silent=True) or request.form
+    task_id = repository_write("create_task", session['user_id'], task_name, data.get('description', ''),
+                               estimated_time, priority)
+    notify("created", [task_id])
+    repo = repository()
+    return api_result(repo, 201, task=task_json(repo.get_task(session['user_id'], task_id)))
+
+@app.route('/api/tasks/<int:task_id>', methods=['PATCH'])
+@api_login_required
+def api_update_task(task_id):
+    repo = repository()
+    task = repo.get_task(session['user_id'], task_id)
+    if not task:
+        return jsonify(error="Task not found."), 404
+    try:
+        task_name, estimated_time, priority = api_task_fields(current=task)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    repository_write("update_task", session['user_id'], task_id, task_name, estimated_time, priority)
+    notify("updated", [task_id])
+    return api_result(repo, task=task_json(repo.get_task(session['user_id'], task_id)))
+
+@app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+@api_login_required
+def api_delete_task(task_id):
+    if not repository_write("delete_tasks", session['user_id'], [task_id]):
+        return jsonify(error="Task not found."), 404
+    notify("deleted", removed=[task_id])
+    return api_result(repository(), removed=task_id, message="Task deleted.")
+
+API_TIMER_ACTIONS = {
+    'start': ("start_tasks", "started", "Task started!"),
+    'pause': ("pause_tasks", "paused", "Task paused."),
+    'resume': ("resume_tasks", "resumed", "Task resumed."),
+}
+
+@app.route('/api/tasks/<int:task_id>/<action>', methods=['POST'])
+@api_login_required
+def api_task_action(task_id, action):
+    repo = repository()
+
+    if action == 'complete':
+        completed, not_started = repository_write("complete_tasks", session['user_id'], [task_id])
+        if not_started:
+            return jsonify(error="You must start the task before marking it complete."), 409
+        if not completed:
+            return jsonify(error="Task not found."), 404
+        notify("completed", removed=completed)
+        return api_result(repo, removed=task_id, message="Task marked as Complete!")
+
+    if action not in API_TIMER_ACTIONS:
+        return jsonify(error="Unknown action."), 404
+    apply_action, event, message = API_TIMER_ACTIONS[action]
+    if not repository_write(apply_action, session['user_id'], [task_id]):
+        if action == 'start' and repo.get_task(session['user_id'], task_id):
+            return jsonify(error="Task already started."), 409
+        return jsonify(error="Task not found."), 404
+    notify(event, [task_id])
+    return api_result(repo, task=task_json(repo.get_task(session['user_id'], task_id)), message=message)
+
+@app.route('/api/completed_tasks/<int:task_id>/unmark', methods=['POST'])
+@api_login_required
+def api_unmark_complete(task_id):
+    new_id = repository_write("uncomplete_task", session['user_id'], task_id)
+    if new_id is None:
+        return jsonify(error="Task not found."), 404
+    notify("uncompleted", [new_id])
+    repo = repository()
+    return api_result(repo, removed=task_id, task=task_json(repo.get_task(session['user_id'], new_id)),
+                      message="Task marked as incomplete and moved back to active tasks.")
+
+@app.route('/api/tasks/import', methods=['POST'])
+@api_login_required
+def api_import_tasks():
+    """Bulk-create tasks from an uploaded CSV or JSON lines file (a
+    multipart "file" field or the raw body); see import_tasks.py."""
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or guess_import_format(upload.filename if upload else None,
+                                                            upload.mimetype if upload else request.mimetype)
+    if fmt not in IMPORT_READERS:
+        return jsonify(error="Send CSV or JSON lines (format=csv or format=jsonl)."), 400
+
+    user_id = session['user_id']
+    report = import_stream(upload.stream if upload else request.stream, fmt,
+                           lambda rows: repository_write("create_tasks", user_id, rows),
+                           batch_size=app.config['IMPORT_BATCH_SIZE'])
+    if report['imported']:
+        notify("imported")
+    return jsonify(report)
+
+
+# ------------------------ LIVE UPDATES ------------------------
+# Open dashboards keep an EventSource on /api/events and patch themselves
+# from the changes the routes above publish, instead of being reloaded to
+# pick up another tab's changes. Events carry the changed tasks, the ids
+# that left the list, the counters and the server time; worked time ticks
+# in the browser from those.
+
+def notify(event, task_ids=(), removed=()):
+    """Publish a committed change to the user's open dashboards. The tasks
+    are read back only when a stream in this process is listening."""
+    user_id = session['user_id']
+    if not events.has_subscribers(user_id):
+        return
+    repo = repository()
+    wanted = set(task_ids)
+    tasks = [task_json(task) for task in repo.list_tasks(user_id) if task['id'] in wanted] if wanted else []
+    events.publish(user_id, event, tasks=tasks, removed=list(removed), counters=repo.counters(user_id))
+
+def sync_event(user_id, since):
+    """("sync" event, data_version) with every active task when the user's
+    data_version is no longer `since`, else (None, data_version). Uses a
+    connection of its own for just this read, so an open stream doesn't
+    hold one from the pool."""
+    pool = get_pool(*user_store(user_id))
+    conn = pool.acquire()
+    try:
+        repo = repository(conn.cursor())
+        counters = repo.counters(user_id)
+        version = str(counters['data_version'])
+        if version == since:
+            return None, version
+        tasks = [task_json(task) for task in repo.list_tasks(user_id)]
+    finally:
+        pool.release(conn)
+    return events.format_event("sync", {'tasks': tasks, 'counters': counters, 'now': now_epoch()},
+                               event_id=version), version
+
+def event_stream(user_id, subscription, since):
+    heartbeat = app.config['EVENT_HEARTBEAT_S']
+    deadline = time.monotonic() + app.config['EVENT_STREAM_LIFETIME_S']
+    # The first message carries the server clock; a sync comes instead when
+    # something changed since the page (or the last event) was rendered
+    message, version = sync_event(user_id, since)
+    yield "retry: 3000\n\n" + (message or events.format_event("hello", {'now': now_epoch()}, event_id=version))
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return  # the browser reconnects, with Last-Event-ID
+        try:
+            event, data = subscription.get(timeout=min(heartbeat, remaining))
+        except queue.Empty:
+            # Changes made through another worker only show up here
+            message, version = sync_event(user_id, version)
+            yield message or ": keep-alive\n\n"
+            continue
+        version = str(data['counters']['data_version'])
+        yield events.format_event(event, data, event_id=version)
+
+@app.route('/api/events')
+@api_login_required
+def api_events():
+    user_id = session['user_id']
+    subscription = events.subscribe(user_id, app.config['EVENT_STREAMS_MAX'])
+    if subscription is None:
+        return jsonify(error="Too many live connections."), 503
+    # EventSource resends the last id it saw when it reconnects
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    response = Response(stream_with_context(event_stream(user_id, subscription, since)),
+                        mimetype='text/event-stream')
+    response.call_on_close(lambda: events.unsubscribe(user_id, subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy hold the events back
+    return response
+
+
+@app.route('/completed_tasks')
+@login_required
+@cached_page
+def view_completed_tasks():
+    filter_option = request.args.get('filter', 'all')  # date filter
+    time_filter = request.args.get('time_filter', 'all')  # new time filter
+    cursor = request.args.get('cursor')  # "<completed_ts>_<id>" of the last row on the previous page
+
+    before = None
+    if cursor:
+        before_ts, _, before_id = cursor.partition('_')
+        if before_ts.isdigit() and before_id.isdigit():
+            before = (int(before_ts), int(before_id))
+
+    # One extra row tells us whether an older page exists
+    page_size = app.config['COMPLETED_PAGE_SIZE']
+    since_ts, until_ts = completed_range(filter_option)
+    completed = repository().completed_page(session['user_id'], since_ts, until_ts, time_filter,
+                                            before=before, limit=page_size + 1)
+
+    next_cursor = None
+    if len(completed) > page_size:
+        completed = completed[:page_size]
+        last = completed[-1]
+        next_cursor = f"{last['completed_ts']}_{last['id']}"
 
     return render_template(
         'completed.html',
         completed_tasks=completed,
-        username=username,
+        username=session['username'],
         selected_filter=filter_option,
-        selected_time_filter=time_filter
+        selected_time_filter=time_filter,
+        cursor=cursor,
+        next_cursor=next_cursor
+    )
+
+
+@app.route('/export/<table>')
+@login_required
+def export_history(table):
+    if table not in EXPORT_COLUMNS:
+        return "Unknown export", 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ENCODERS:
+        return "Unsupported format", 400
+    compress = request.args.get('gzip') == '1'
+
+    columns = EXPORT_COLUMNS[table]
+    params = [session['user_id']]
+    filter_sql = ""
+    order_by = "id"
+    if table == 'completed_tasks':
+        filter_sql, filter_params = completed_filter_sql(*completed_range(request.args.get('filter', 'all')),
+                                                         request.args.get('time_filter', 'all'))
+        params += filter_params
+        order_by = "completed_ts, id"
+
+    select_sql = f"""
+        SELECT {', '.join(columns)} FROM {{table}}
+        WHERE user_id = ? {filter_sql}
+        ORDER BY {order_by}
+    """
+    conn = get_db_connection()
+    if table == 'completed_tasks':
+        # History includes the archived rows, which are all older than the
+        # hot ones: stream them first, each half in index order
+        cur = ChainedCursor(conn.execute(select_sql.format(table="archive.completed_tasks"), params),
+                            conn.execute(select_sql.format(table="main.completed_tasks"), params))
+    else:
+        cur = conn.execute(select_sql.format(table=table), params)
+
+    filename = f"{table}.{fmt}" + (".gz" if compress else "")
+    chunks = export_stream(cur, columns, fmt, batch_size=app.config['EXPORT_BATCH_SIZE'], compress=compress)
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
     )
 
 
@@ -428,45 +687,28 @@ def view_completed_tasks():
 
 @app.route('/profile')
 @login_required
+@cached_page
 def profile():
     user_id = session['user_id']
-    conn = get_db_connection()
-    cur = conn.cursor()
+    repo = repository()
+    user = repo.user_info(user_id)
 
-    # Get basic user info
-    cur.execute("SELECT username, email, created_at FROM users WHERE id = ?", (user_id,))
-    user = cur.fetchone()
-    
-    # Format created_at for readability
-    created_at = datetime.strptime(user['created_at'], "%Y-%m-%d %H:%M:%S")
-    formatted_created_at = created_at.strftime("%B %d, %Y")  # e.g., "June 22, 2025"
+    # Format created_ts for readability
+    formatted_created_at = format_epoch(user['created_ts'], "%B %d, %Y", tz_name="UTC")  # e.g., "June 22, 2025"
 
-    # Get stats
-    cur.execute("SELECT date, tasks_completed FROM user_stats WHERE user_id = ? ORDER BY date ASC", (user_id,))
-    stats = cur.fetchall()
+    # Streak and best day are kept current by mark/unmark (see aggregates.py)
+    stats = repo.streak_stats(user_id)
 
-    # Streak
-    today = datetime.now().date()
-    active_days = {datetime.strptime(row['date'], "%Y-%m-%d").date() for row in stats if row['tasks_completed'] > 0}
-    streak = 0
-    current_day = today
-    while current_day in active_days:
-        streak += 1
-        current_day -= timedelta(days=1)
-
-    # Best performing day
-    best_day = None
-    max_tasks = 0
-    for row in stats:
-        if row['tasks_completed'] > max_tasks:
-            max_tasks = row['tasks_completed']
-            best_day = row['date']
+    # The streak only counts if it runs up to today
+    today = datetime.now().strftime("%Y-%m-%d")
+    streak = stats['current_streak'] if stats and stats['last_active_date'] == today else 0
+
+    best_day = stats['best_day'] if stats else None
+    max_tasks = stats['best_day_count'] if stats else 0
 
     # Format best_day
     formatted_best_day = datetime.strptime(best_day, "%Y-%m-%d").strftime("%B %d, %Y") if best_day else None
 
-    conn.close()
-
     return render_template(
         'profile.html',
         user=user,
@@ -479,39 +721,41 @@ def profile():
 
 
 
+@app.route('/search')
+@login_required
+@cached_page
+def search():
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', '1')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+
+    results, has_next = [], False
+    if query:
+        # Ranked FTS5 matches across active, completed and archived tasks (see search.py)
+        results, has_next = search_tasks(get_db_connection().cursor(), session['user_id'], query,
+                                         page=page, page_size=app.config['SEARCH_PAGE_SIZE'])
+    return render_template('search.html', username=session['username'], query=query,
+                           results=results, page=page, has_next=has_next)
+
+
 @app.route('/productivity')
+@cached_page
 def productivity():
     user_id = session.get('user_id')
     if not user_id:
         return redirect(url_for('login'))
 
-    connection = sqlite3.connect('taskcrafter.db')
-    cursor = connection.cursor()
-
-    # Get username
-    cursor.execute("SELECT username FROM users WHERE id = ?", (user_id,))
-    row = cursor.fetchone()
-    username = row[0] if row else "User"
-
-    # Total active tasks
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE user_id = ?", (user_id,))
-    active_tasks = cursor.fetchone()[0]
-
-    # Total completed tasks
-    cursor.execute("SELECT COUNT(*) FROM completed_tasks WHERE user_id = ?", (user_id,))
-    completed_tasks = cursor.fetchone()[0]
+    # Username and running totals in one row (see aggregates.py)
+    row = repository().totals(user_id)
+    username = row['username'] if row else "User"
+    active_tasks = row['active_count'] if row else 0
+    completed_tasks = row['completed_count'] if row else 0
+    total_estimated = row['total_estimated'] if row else 0
+    total_actual = row['total_actual'] if row else 0
 
     # Total tasks = active + completed
     total_tasks = active_tasks + completed_tasks
 
-    # Total estimated time for completed tasks
-    cursor.execute("SELECT COALESCE(SUM(estimated_time), 0) FROM completed_tasks WHERE user_id = ?", (user_id,))
-    total_estimated = cursor.fetchone()[0]
-
-    # Total actual time
-    cursor.execute("SELECT COALESCE(SUM(actual_time), 0) FROM completed_tasks WHERE user_id = ?", (user_id,))
-    total_actual = cursor.fetchone()[0]
-
     # Efficiency
     # Calculate efficiency if actual time > 0 else 0
     efficiency = 0
@@ -521,7 +765,6 @@ def productivity():
         efficiency = min(100.0, round((total_estimated / total_actual) * 100, 2))
 
 
-    connection.close()
 
     return render_template('productivity.html',
                            total_tasks=total_tasks,
@@ -532,54 +775,24 @@ def productivity():
                            username=username)
 
 
+@app.route('/api/productivity/trends')
+@api_login_required
+@cached_page
+def productivity_trends():
+    # Fetched by productivity.html after first paint; cached per data_version
+    cur = get_db_connection().cursor()
+    return jsonify(trend_series(cur, session['user_id'], datetime.now().date()))
+
+
 @app.route('/unmark_complete/<int:task_id>', methods=['POST'])
 @login_required
 def unmark_complete(task_id):
-    user_id = session['user_id']
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Fetch task data from completed_tasks
-    cur.execute('''
-        SELECT task_name, description, estimated_time, actual_time, created_at, completed_at
-        FROM completed_tasks
-        WHERE id = ? AND user_id = ?
-    ''', (task_id, user_id))
-    completed_task = cur.fetchone()
-
-    if not completed_task:
+    # Moves the task back to tasks and takes it off user_stats and aggregates
+    new_id = repository_write("uncomplete_task", session['user_id'], task_id)
+    if new_id is None:
         flash("Task not found.", "danger")
-        conn.close()
         return redirect(url_for('view_completed_tasks'))
-
-    # Insert back into tasks
-    cur.execute('''
-        INSERT INTO tasks (user_id, task_name, description, estimated_time, created_at, is_completed)
-        VALUES (?, ?, ?, ?, ?, 0)
-    ''', (user_id, completed_task['task_name'], completed_task['description'],
-          completed_task['estimated_time'], completed_task['created_at']))
-
-    # Decrement from user_stats
-    completed_date = completed_task['completed_at'].split()[0]  # "YYYY-MM-DD"
-    cur.execute('SELECT tasks_completed FROM user_stats WHERE user_id = ? AND date = ?', (user_id, completed_date))
-    row = cur.fetchone()
-
-    if row:
-        if row['tasks_completed'] > 1:
-            cur.execute('''
-                UPDATE user_stats
-                SET tasks_completed = tasks_completed - 1
-                WHERE user_id = ? AND date = ?
-            ''', (user_id, completed_date))
-        else:
-            # If only 1 task existed, remove the row
-            cur.execute('DELETE FROM user_stats WHERE user_id = ? AND date = ?', (user_id, completed_date))
-
-    # Delete from completed_tasks
-    cur.execute('DELETE FROM completed_tasks WHERE id = ? AND user_id = ?', (task_id, user_id))
-
-    conn.commit()
-    conn.close()
+    notify("uncompleted", [new_id])
 
     flash("Task marked as incomplete and moved back to active tasks.", "success")
     return redirect(url_for('dashboard'))
@@ -597,6 +810,8 @@ def optimize_tasks():
     next_task_fits = None
     strategy = None
     error_message = None
+    estimate_mode = request.form.get('estimates', 'corrected')
+    task_estimates = {}
 
     if request.method == 'POST':
         strategy = request.form.get('strategy')
@@ -614,31 +829,29 @@ def optimize_tasks():
                 total_tasks_remaining=0,
                 next_task_fits=None,
                 strategy=strategy,
+                estimate_mode=estimate_mode,
+                task_estimates={},
                 error_message=error_message
             )
 
-        conn = sqlite3.connect('taskcrafter.db')
-        c = conn.cursor()
+        # (id, task_name, estimated_time, priority); the priority column is
+        # only shown for the strategies that use it. The minutes are
+        # re-timed from the user's history of estimate vs actual (estimates.py)
+        repo = repository()
+        tasks, task_estimates = adjust_estimates(repo.schedulable_tasks(user_id), repo.estimate_stats(user_id),
+                                                 estimate_mode)
 
         if strategy == 'priority':
-            c.execute("SELECT id, task_name, estimated_time, priority FROM tasks WHERE user_id = ? AND is_completed = 0", (user_id,))
-            all_tasks = c.fetchall()
-            all_tasks.sort(key=lambda x: x[3])  # Lower priority = more important
+            all_tasks = sorted(tasks, key=lambda x: x[3])  # Lower priority = more important
 
         elif strategy == 'longest_job':
-            c.execute("SELECT id, task_name, estimated_time FROM tasks WHERE user_id = ? AND is_completed = 0", (user_id,))
-            all_tasks = c.fetchall()
-            all_tasks.sort(key=lambda x: x[2], reverse=True)  # Longest time first
+            all_tasks = sorted((task[:3] for task in tasks), key=lambda x: x[2], reverse=True)  # Longest time first
 
         elif strategy == 'max_tasks':
-            c.execute("SELECT id, task_name, estimated_time FROM tasks WHERE user_id = ? AND is_completed = 0", (user_id,))
-            all_tasks = c.fetchall()
-            all_tasks.sort(key=lambda x: x[2])  # Shortest time first
+            all_tasks = sorted((task[:3] for task in tasks), key=lambda x: x[2])  # Shortest time first
 
         elif strategy == 'none':
-            c.execute("SELECT id, task_name, estimated_time, priority FROM tasks WHERE user_id = ? AND is_completed = 0", (user_id,))
-            optimized_tasks = c.fetchall()
-            conn.close()
+            optimized_tasks = tasks
             return render_template(
                 'optimize_tasks.html',
                 optimized_tasks=optimized_tasks,
@@ -647,36 +860,29 @@ def optimize_tasks():
                 total_tasks_remaining=0,
                 next_task_fits=None,
                 strategy=strategy,
+                estimate_mode=estimate_mode,
+                task_estimates=task_estimates,
                 error_message=None
             )
 
         else:
             all_tasks = []
 
-        # Filter tasks by available time (only if strategy ≠ 'none')
+        # Pick the best subset that fits the available time (only if strategy ≠ 'none')
         if available_time is not None:
-            total = 0
-            temp = []
-            for task in all_tasks:
-                task_time = task[2]
-                if total + task_time <= available_time:
-                    temp.append(task)
-                    total += task_time
-                else:
-                    break
-            optimized_tasks = temp
-            leftover_time = available_time - total
+            selection = select_tasks(all_tasks, available_time, strategy,
+                                     time_limit_ms=app.config['OPTIMIZER_TIME_LIMIT_MS'])
+            optimized_tasks = selection.tasks
+            leftover_time = available_time - selection.total_time
             total_tasks_remaining = len(all_tasks) - len(optimized_tasks)
 
-            remaining_tasks = all_tasks[len(optimized_tasks):]
+            chosen_ids = {task[0] for task in optimized_tasks}
+            remaining_tasks = [task for task in all_tasks if task[0] not in chosen_ids]
             if remaining_tasks:
-                next_task_estimated_time = remaining_tasks[0][2]
-                next_task_fits = leftover_time >= next_task_estimated_time
+                next_task_fits = any(task[2] <= leftover_time for task in remaining_tasks)
             else:
                 next_task_fits = None
 
-        conn.close()
-
     return render_template(
         'optimize_tasks.html',
         optimized_tasks=optimized_tasks,
@@ -685,19 +891,64 @@ def optimize_tasks():
         total_tasks_remaining=total_tasks_remaining,
         next_task_fits=next_task_fits,
         strategy=strategy,
+        estimate_mode=estimate_mode,
+        task_estimates=task_estimates,
         error_message=error_message
     )
 
 
 
+# Days shown on /plan_days, and the most a submitted plan may cover
+PLAN_DAYS = 7
+PLAN_MAX_DAYS = 31
+
+@app.route('/plan_days', methods=['GET', 'POST'])
+@login_required
+def plan_days_view():
+    today = datetime.now().date()
+    method = request.form.get('method', 'first_fit')
+    minutes = [value.strip() for value in request.form.getlist('day_minutes')][:PLAN_MAX_DAYS] or [''] * PLAN_DAYS
+    plan = None
+    error_message = None
+
+    if request.method == 'POST':
+        if method not in PLAN_METHODS:
+            error_message = "Choose a packing method."
+        elif not all(value.isdigit() for value in minutes):
+            error_message = "Enter the minutes you have for each day (0 for a day off)."
+        else:
+            tasks = repository().schedulable_tasks(session['user_id'])
+            plan = plan_days(tasks, [int(value) for value in minutes], method)
+
+    return render_template(
+        'plan_days.html',
+        days=[today + timedelta(days=i) for i in range(len(minutes))],
+        minutes=minutes,
+        method=method,
+        plan=plan,
+        error_message=error_message
+    )
+
 
 @app.route('/')
 def home():
     return render_template('home.html')
 
 
+@app.route('/cache_stats')
+@monitoring_token_required
+def cache_stats():
+    return get_fragment_cache().stats()
+
+@app.route('/metrics')
+@monitoring_token_required
+def prometheus_metrics():
+    # The page cache counters are included here too, for scraping
+    return Response(metrics.render(get_fragment_cache().stats()), content_type=metrics.CONTENT_TYPE)
+
+
 
 # ------------------------ RUN APP ------------------------
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,195 @@
+"""Move old completed tasks out of the hot database.
+
+Rows of completed_tasks older than ARCHIVE_AFTER_DAYS move to a separate
+SQLite file (ARCHIVE_DB_PATH), attached to every pooled connection as
+"archive". Their per-user, per-day totals stay behind in the hot file's
+completed_rollups table, so user_aggregates can still be checked against
+the base tables. Archived rows are always older than every hot row, so
+/completed_tasks and the exports read them after the hot ones in the same
+order. Run it from cron:
+
+    python archive.py              # archive rows older than ARCHIVE_AFTER_DAYS
+    python archive.py --days 30    # override the age
+
+Rollups are keyed by the server's local day, like user_stats; ones
+written before that were keyed by the UTC day, and are re-dated from the
+archived rows with
+
+    python archive.py --rebuild-rollups
+
+With SHARD_COUNT set each shard has its own archive file.
+"""
+
+import argparse
+import sqlite3
+import time
+
+from config import Config
+from search import index_statements, rebuild_index
+from timecodec import local_date_sql, now_epoch
+
+COLUMNS = ("id", "user_id", "task_name", "description", "estimated_time", "actual_time", "start_time",
+           "created_at", "completed_at", "created_ts", "start_ts", "completed_ts")
+
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS archive.completed_tasks (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        task_name TEXT NOT NULL,
+        description TEXT,
+        estimated_time INTEGER NOT NULL,
+        actual_time INTEGER,
+        start_time TEXT,
+        created_at TEXT,
+        completed_at TEXT,
+        created_ts INTEGER,
+        start_ts INTEGER,
+        completed_ts INTEGER
+    )
+    ''',
+    # Same access path as idx_completed_user_ts in the hot file
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_user_ts ON completed_tasks(user_id, completed_ts)",
+    *index_statements("completed_tasks", schema="archive."),
+]
+
+
+def attach_archive(connection, path):
+    """Attach the archive file as "archive", creating its tables on first use."""
+    connection.execute("ATTACH DATABASE ? AS archive", (path,))
+    indexed = connection.execute(
+        "SELECT 1 FROM archive.sqlite_master WHERE name = 'completed_tasks_search'").fetchone()
+    for statement in ARCHIVE_SCHEMA:
+        connection.execute(statement)
+    if indexed is None:
+        # An archive from before search: index the rows it already has
+        rebuild_index(connection, "archive", "completed_tasks")
+        if connection.in_transaction:
+            connection.commit()
+
+
+def archive_user(cur, user_id, cutoff_ts):
+    """Move one user's completed tasks finished before cutoff_ts into the
+    archive and fold them into completed_rollups. Returns the rows moved.
+
+    With the hot file in WAL mode a transaction spanning both files is
+    atomic per file, not across them. The archive insert comes first and
+    ignores ids it already has, so a run interrupted in between is finished
+    by the next one.
+    """
+    columns = ", ".join(COLUMNS)
+    cur.execute(f'''
+        INSERT OR IGNORE INTO archive.completed_tasks ({columns})
+        SELECT {columns} FROM main.completed_tasks
+        WHERE user_id = ? AND completed_ts < ?
+    ''', (user_id, cutoff_ts))
+    # Rolled up by the local day user_stats and the trend charts use
+    cur.execute(f'''
+        INSERT INTO completed_rollups (user_id, date, completed_count, total_estimated, total_actual)
+        SELECT user_id, {local_date_sql('completed_ts')}, COUNT(*), SUM(estimated_time),
+               COALESCE(SUM(actual_time), 0)
+        FROM main.completed_tasks
+        WHERE user_id = ? AND completed_ts < ?
+        GROUP BY user_id, {local_date_sql('completed_ts')}
+        ON CONFLICT(user_id, date) DO UPDATE SET
+            completed_count = completed_count + excluded.completed_count,
+            total_estimated = total_estimated + excluded.total_estimated,
+            total_actual = total_actual + excluded.total_actual
+    ''', (user_id, cutoff_ts))
+    cur.execute("DELETE FROM main.completed_tasks WHERE user_id = ? AND completed_ts < ?", (user_id, cutoff_ts))
+    # Pages look the same afterwards, so there is no data_version bump
+    return cur.rowcount
+
+
+def remove_archived(cur, user_id, completed_id):
+    """Delete one archived row (for unmark) and take it off its day's
+    rollup. Returns the row as it was, or None if it isn't archived."""
+    cur.execute(f'''
+        SELECT {", ".join(COLUMNS)} FROM archive.completed_tasks
+        WHERE id = ? AND user_id = ?
+    ''', (completed_id, user_id))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    cur.execute("DELETE FROM archive.completed_tasks WHERE id = ?", (completed_id,))
+    # Rollups written before they moved to local days are keyed by the UTC
+    # day (until rebuild_rollups re-dates them)
+    for day in (local_date_sql('?'), "date(?, 'unixepoch')"):
+        cur.execute(f'''
+            UPDATE completed_rollups
+            SET completed_count = completed_count - 1,
+                total_estimated = total_estimated - ?,
+                total_actual = total_actual - ?
+            WHERE user_id = ? AND date = {day}
+        ''', (row['estimated_time'], row['actual_time'] or 0, user_id, row['completed_ts']))
+        if cur.rowcount:
+            cur.execute(f"DELETE FROM completed_rollups WHERE user_id = ? AND date = {day} "
+                        "AND completed_count <= 0", (user_id, row['completed_ts']))
+            break
+    return row
+
+
+def rebuild_rollups(connection):
+    """Recompute completed_rollups from the archived rows, by local day.
+    Returns the number of rollup rows written."""
+    with connection:
+        connection.execute("DELETE FROM completed_rollups")
+        return connection.execute(f'''
+            INSERT INTO completed_rollups (user_id, date, completed_count, total_estimated, total_actual)
+            SELECT user_id, {local_date_sql('completed_ts')}, COUNT(*), SUM(estimated_time),
+                   COALESCE(SUM(actual_time), 0)
+            FROM archive.completed_tasks
+            GROUP BY user_id, {local_date_sql('completed_ts')}
+        ''').rowcount
+
+
+def archive_all(connection, cutoff_ts):
+    """Archive every user's old rows, one short transaction per user so
+    the app's writers are never blocked for long. Returns (rows, users)."""
+    moved = users = 0
+    # One index probe per user rather than a scan of completed_tasks
+    user_ids = [row[0] for row in connection.execute('''
+        SELECT id FROM users u
+        WHERE EXISTS (SELECT 1 FROM main.completed_tasks c WHERE c.user_id = u.id AND c.completed_ts < ?)
+    ''', (cutoff_ts,))]
+    for user_id in user_ids:
+        cur = connection.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            count = archive_user(cur, user_id, cutoff_ts)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        moved += count
+        users += 1
+    return moved, users
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive old completed tasks.")
+    parser.add_argument("--days", type=int, default=Config.ARCHIVE_AFTER_DAYS,
+                        help="archive rows completed more than this many days ago")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="only recompute the per-day rollups from the archived rows")
+    args = parser.parse_args()
+
+    from shards import data_stores
+
+    cutoff_ts = now_epoch() - args.days * 86400
+    for path, archive_path in data_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT):
+        connection = sqlite3.connect(path, isolation_level=None, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+        connection.row_factory = sqlite3.Row
+        attach_archive(connection, archive_path)
+
+        if args.rebuild_rollups:
+            print(f"{path}: {rebuild_rollups(connection)} rollup rows rebuilt from {archive_path}.")
+            connection.close()
+            continue
+
+        start = time.perf_counter()
+        moved, users = archive_all(connection, cutoff_ts)
+        elapsed = time.perf_counter() - start
+        connection.close()
+        print(f"Archived {moved} completed tasks for {users} users into {archive_path} "
+              f"in {elapsed:.1f}s.")
@@ -0,0 +1,149 @@
+"""Fill a SQLite file with synthetic users, tasks and history.
+
+    python -m benchmarks.generate_data bench.db [--users 100] [--active 20]
+                                                [--completed 500] [--days 90] [--seed 7]
+
+Every user is "user<N>" with password "password". Completed tasks are spread
+over the last --days days; user_stats, user_aggregates and the estimate
+statistics are derived from them exactly as the app would have left them.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+import aggregates
+import estimates
+from init_db import migrate
+from timecodec import now_epoch, to_text
+
+PASSWORD = "password"
+
+# Task names and descriptions are drawn from these, the first words far
+# more often than the last, so searches hit both common and rare terms
+VERBS = ["review", "write", "fix", "plan", "call", "update", "prepare", "send", "read", "clean",
+         "schedule", "draft", "test", "deploy", "organise", "research", "book", "pay", "refactor", "sketch"]
+NOUNS = ["report", "invoice", "meeting", "budget", "slides", "emails", "kitchen", "roadmap", "tests",
+         "newsletter", "contract", "dentist", "groceries", "backlog", "design", "server", "taxes", "garden",
+         "interview", "proposal", "release", "onboarding", "playlist", "benchmark", "workshop", "inventory"]
+DETAILS = ["for the team", "before friday", "with finance", "for the quarterly review", "at home",
+           "for the new client", "after lunch", "and follow up", "for the launch", "with the landlord"]
+
+
+def _words(rng, words):
+    # Roughly Zipf: index k is picked about 1/(k+1) as often as the first
+    return words[min(len(words) - 1, int(rng.paretovariate(1.0)) - 1)]
+
+
+def _task_text(rng, i):
+    verb, noun = _words(rng, VERBS), _words(rng, NOUNS)
+    return f"{verb} {noun} {i}", f"{verb} the {noun} {rng.choice(DETAILS)}"
+
+
+def _user_rows(users, now):
+    for i in range(1, users + 1):
+        created_ts = now - 365 * 86400
+        yield (i, f"user{i}", f"user{i}@example.com", PASSWORD, to_text(created_ts), created_ts)
+
+
+def _active_rows(user_id, count, now, rng):
+    for i in range(count):
+        created_ts = now - rng.randint(0, 7 * 86400)
+        # About a third started, a third of those paused after some work;
+        # the rest have been running since they were started
+        start_ts = now - rng.randint(60, 3 * 3600) if rng.random() < 0.33 else None
+        paused = 1 if start_ts and rng.random() < 0.33 else 0
+        accumulated = rng.randint(1, now - start_ts) if paused else 0
+        resumed_at = start_ts if start_ts and not paused else None
+        name, description = _task_text(rng, i)
+        yield (user_id, name, description, rng.randint(5, 240), rng.randint(0, 5),
+               to_text(created_ts), created_ts, to_text(start_ts), start_ts, paused, accumulated, resumed_at)
+
+
+def _completed_rows(user_id, count, days, now, rng):
+    for i in range(count):
+        estimated = rng.randint(5, 240)
+        actual = max(1, int(estimated * rng.uniform(0.5, 1.8)))
+        completed_ts = now - rng.randint(0, days * 86400)
+        start_ts = completed_ts - actual * 60
+        created_ts = start_ts - rng.randint(0, 2 * 86400)
+        name, description = _task_text(rng, i)
+        yield (user_id, name, description, estimated, actual,
+               to_text(start_ts), to_text(completed_ts), to_text(created_ts),
+               created_ts, start_ts, completed_ts)
+
+
+def generate(path, users=100, active=20, completed=500, days=90, seed=7):
+    """Create `path` (replacing it) and fill it. Returns row counts per table."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rng = random.Random(seed)
+    now = now_epoch()
+    connection = sqlite3.connect(path, isolation_level=None)
+    migrate(connection)
+
+    connection.execute("BEGIN")
+    connection.executemany(
+        "INSERT INTO users (id, username, email, password, created_at, created_ts) VALUES (?, ?, ?, ?, ?, ?)",
+        _user_rows(users, now))
+    for user_id in range(1, users + 1):
+        connection.executemany('''
+            INSERT INTO tasks (user_id, task_name, description, estimated_time, priority, is_completed,
+                               created_at, created_ts, start_time, start_ts, is_paused, accumulated_seconds,
+                               last_resumed_at)
+            VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?, ?, ?)
+        ''', _active_rows(user_id, active, now, rng))
+        connection.executemany('''
+            INSERT INTO completed_tasks
+            (user_id, task_name, description, estimated_time, actual_time, start_time, completed_at,
+             created_at, created_ts, start_ts, completed_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', _completed_rows(user_id, completed, days, now, rng))
+
+    # The timer log those tasks would have: each start, and the pause that
+    # left a paused one with its worked time
+    connection.execute('''
+        INSERT INTO task_time_events (task_id, user_id, event, ts, elapsed_seconds)
+        SELECT id, user_id, 'start', start_ts, 0 FROM tasks WHERE start_ts IS NOT NULL
+        UNION ALL
+        SELECT id, user_id, 'pause', start_ts + accumulated_seconds, accumulated_seconds
+        FROM tasks WHERE is_paused = 1
+        ORDER BY 4
+    ''')
+
+    # One user_stats row per user and day that has completions
+    connection.execute('''
+        INSERT INTO user_stats (user_id, date, tasks_completed)
+        SELECT user_id, substr(completed_at, 1, 10), COUNT(*)
+        FROM completed_tasks GROUP BY user_id, substr(completed_at, 1, 10)
+    ''')
+    connection.commit()
+
+    aggregates.reconcile(connection, fix=True)
+    estimates.rebuild(connection)
+    connection.execute("ANALYZE")
+
+    counts = {table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("users", "tasks", "completed_tasks", "user_stats")}
+    connection.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic TaskCrafter database.")
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--active", type=int, default=20, help="active tasks per user")
+    parser.add_argument("--completed", type=int, default=500, help="completed tasks per user")
+    parser.add_argument("--days", type=int, default=90, help="days of completion history")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = generate(args.path, args.users, args.active, args.completed, args.days, args.seed)
+    elapsed = time.perf_counter() - start
+    print(", ".join(f"{count} {table}" for table, count in counts.items()) + f" in {elapsed:.1f}s")
@@ -0,0 +1,66 @@
+"""Time the /plan_days packer and compare it with its lower bounds.
+
+    python -m benchmarks.planner_bench [--days 7] [--seed 7]
+
+For each synthetic task set it reports, per method, how long planning took,
+how many days the plan used against the fewest possible, and how many
+minutes were left out against the fewest possible. A naive first-fit that
+scans every day per task is timed alongside for reference.
+"""
+
+import argparse
+import random
+import time
+
+from planner import METHODS, plan_days, plan_order
+
+SIZES = [10, 100, 500, 1_000, 10_000, 100_000]
+
+
+def synthetic_tasks(n, rng):
+    return [(i, f"task {i}", rng.randint(5, 240), rng.randint(0, 5)) for i in range(n)]
+
+
+def naive_first_fit(tasks, capacities):
+    """O(n * d) reference: scan the days in order for every task."""
+    free = list(capacities)
+    for task in plan_order(tasks):
+        for day, cap in enumerate(free):
+            if task[2] <= cap:
+                free[day] -= task[2]
+                break
+    return free
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'tasks':>7} {'days':>5} {'method':<10} {'ms':>9} {'days used':>10} {'min':>5} "
+          f"{'left out':>9} {'min':>7} {'naive ms':>9}")
+    for n in SIZES:
+        tasks = synthetic_tasks(n, rng)
+        # Enough room for roughly 90% of the work, so packing quality shows
+        total = sum(task[2] for task in tasks)
+        days = max(args.days, 1)
+        per_day = max(240, int(total * 0.9 / days))
+        capacities = [rng.randint(per_day // 2, per_day * 3 // 2) for _ in range(days)]
+        _, naive_ms = timed(naive_first_fit, tasks, capacities)
+        for method in METHODS:
+            plan, ms = timed(plan_days, tasks, capacities, method)
+            report = plan.report
+            print(f"{n:>7} {days:>5} {method:<10} {ms:>9.2f} {report['days_used']:>10} {report['min_days']:>5} "
+                  f"{report['unplaced_minutes']:>9} {report['min_unplaced_minutes']:>7} {naive_ms:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
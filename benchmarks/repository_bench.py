@@ -0,0 +1,126 @@
+"""Time the same workload on each repository backend.
+
+    python -m benchmarks.repository_bench [--users 20] [--tasks 50] [--runs 5] [--seed 7]
+
+Each run starts from an empty store, the way a test would: a new SQLite
+file (migrations included), an in-process ":memory:" SQLite database, or a
+MemoryRepository. Every user then creates --tasks tasks, starts, pauses
+and resumes them, completes two thirds, unmarks a few, and reads back every
+view the app renders (task list, schedulable tasks, completed pages,
+totals, streaks, counters). SQLite writes commit one by one, as the routes
+do. The report has the median setup and workload time per backend.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from archive import attach_archive
+from init_db import migrate
+from repository import MemoryRepository, SQLiteRepository
+
+
+def sqlite_repository(path, archive_path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    migrate(connection)
+    attach_archive(connection, archive_path)
+    return connection, SQLiteRepository(connection.cursor())
+
+
+def _nothing():
+    pass
+
+
+def workload(repo, users, tasks, rng, begin=_nothing, commit=_nothing):
+    operations = 0
+
+    def write(method, *args):
+        nonlocal operations
+        begin()
+        result = getattr(repo, method)(*args)
+        commit()
+        operations += 1
+        return result
+
+    user_ids = [write("add_user", f"user{i}", f"user{i}@example.com", "password") for i in range(users)]
+    for user_id in user_ids:
+        task_ids = [write("create_task", user_id, f"task {i}", "", rng.randint(5, 240), rng.randint(0, 5))
+                    for i in range(tasks)]
+        for task_id in task_ids:
+            write("start_tasks", user_id, [task_id])
+        for task_id in task_ids[::2]:
+            write("pause_tasks", user_id, [task_id])
+            write("resume_tasks", user_id, [task_id])
+        write("complete_tasks", user_id, task_ids[:len(task_ids) * 2 // 3])
+        for completed in repo.completed_page(user_id, limit=3):
+            write("uncomplete_task", user_id, completed['id'])
+
+        repo.list_tasks(user_id)
+        repo.schedulable_tasks(user_id)
+        page = repo.completed_page(user_id, limit=20)
+        if page:
+            repo.completed_page(user_id, before=(page[-1]['completed_ts'], page[-1]['id']), limit=20)
+        repo.completed_page(user_id, time_filter='after', limit=20)
+        repo.totals(user_id)
+        repo.streak_stats(user_id)
+        repo.counters(user_id)
+        operations += 9
+    return operations
+
+
+def run(backend, users, tasks, seed, tmp, index):
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    connection = None
+    begin = commit = _nothing
+    if backend == "memory":
+        repo = MemoryRepository()
+    else:
+        path = ":memory:" if backend == "sqlite :memory:" else os.path.join(tmp, f"repo{index}.db")
+        archive_path = ":memory:" if backend == "sqlite :memory:" else os.path.join(tmp, f"repo{index}_archive.db")
+        connection, repo = sqlite_repository(path, archive_path)
+        begin = lambda: connection.execute("BEGIN")
+        commit = lambda: connection.execute("COMMIT")
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    operations = workload(repo, users, tasks, rng, begin, commit)
+    elapsed = time.perf_counter() - start
+    if connection is not None:
+        connection.close()
+    return setup, elapsed, operations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks", type=int, default=50, help="tasks per user")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("sqlite file", "sqlite :memory:", "memory"):
+            results[backend] = [run(backend, args.users, args.tasks, args.seed, tmp, i) for i in range(args.runs)]
+
+    baseline = statistics.median(setup + elapsed for setup, elapsed, _ in results["sqlite file"])
+    print(f"{args.users} users x {args.tasks} tasks, median of {args.runs} runs")
+    print(f"{'backend':<16} {'setup ms':>9} {'work ms':>9} {'ops/s':>10} {'speedup':>8}")
+    for backend, runs in results.items():
+        setup = statistics.median(run[0] for run in runs)
+        elapsed = statistics.median(run[1] for run in runs)
+        operations = runs[0][2]
+        print(f"{backend:<16} {setup * 1000:>9.1f} {elapsed * 1000:>9.1f} {operations / elapsed:>10.0f} "
+              f"{baseline / (setup + elapsed):>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Drive every route through Flask's test client and report latency.
+
+    python -m benchmarks.routes_bench [--db bench.db] [--users 100] [--requests 200]
+                                      [--no-page-cache] [--save baseline.json]
+                                      [--compare baseline.json] [--threshold 0.2]
+
+Without --db a synthetic database is generated in a temp directory (see
+benchmarks.generate_data). Each route gets --requests calls spread over
+random users; the report has p50/p95/p99 latency, SQL statements per
+request and the process's peak RSS.
+
+Statements are counted through the pool's on_query hook (see db.py): one
+per execute() or executemany() the app issues on any pooled connection,
+whatever triggers run underneath and however many rows executemany
+binds. The BEGIN and COMMIT the sqlite3 module issues on its own aren't
+counted. --save writes the results as a JSON
+baseline; --compare checks them against one and exits 1 when a route's p95
+or query count (or the peak RSS) regressed by more than --threshold.
+
+The read views are behind the per-user page cache, so repeated calls mostly
+measure cache hits. Pass --no-page-cache to measure the render path.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.generate_data import PASSWORD, generate
+
+# (name, method, path) of the read routes, each called as a random user
+READ_ROUTES = [
+    ("dashboard", "GET", "/dashboard"),
+    ("completed_tasks", "GET", "/completed_tasks"),
+    ("completed_tasks_last7_before", "GET", "/completed_tasks?filter=last7&time_filter=before"),
+    ("profile", "GET", "/profile"),
+    ("productivity", "GET", "/productivity"),
+    ("optimize_tasks_get", "GET", "/optimize_tasks"),
+    ("api_tasks", "GET", "/api/tasks"),
+    ("export_completed_csv", "GET", "/export/completed_tasks?format=csv"),
+    ("search", "GET", "/search?q=report"),
+    ("search_prefix", "GET", "/search?q=sch"),
+    ("plan_days_get", "GET", "/plan_days"),
+    ("productivity_trends", "GET", "/api/productivity/trends"),
+]
+
+OPTIMIZE_STRATEGIES = ["priority", "longest_job", "max_tasks"]
+PLAN_METHODS = ["first_fit", "best_fit"]
+
+# Tasks created for each round of batch actions
+BATCH_TASKS = 5
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Recorder:
+    """Collects latency and statement counts per route name."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.queries = {}
+        self.current = 0
+
+    def count(self, _sql, _seconds):
+        self.current += 1
+
+    def call(self, name, client, method, path, **kwargs):
+        self.current = 0
+        start = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()  # drain streamed bodies (exports)
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code}")
+        self.latencies.setdefault(name, []).append(elapsed)
+        self.queries.setdefault(name, []).append(self.current)
+        return response
+
+    def results(self):
+        return {
+            name: {
+                "n": len(samples),
+                "p50_ms": round(percentile(samples, 50), 3),
+                "p95_ms": round(percentile(samples, 95), 3),
+                "p99_ms": round(percentile(samples, 99), 3),
+                "queries": round(sum(self.queries[name]) / len(self.queries[name]), 2),
+            }
+            for name, samples in self.latencies.items()
+        }
+
+
+def load_app(db_path, page_cache):
+    """Import the app against `db_path`. Config is read at import time, so
+    the environment has to be set first."""
+    os.environ["DB_PATH"] = db_path
+    if not page_cache:
+        os.environ["PAGE_CACHE_MAX_BYTES"] = "0"
+    import app as app_module
+    return app_module.create_app()
+
+
+def run(db_path, users, requests, page_cache=True, seed=7):
+    app = load_app(db_path, page_cache)
+    recorder = Recorder()
+
+    from db import get_db_connection, reset_pools
+
+    # Count statements next to whatever hook the app installed (metrics);
+    # the pools opened at startup are dropped so every connection gets it
+    app_hook = app.extensions.get("db_on_query")
+
+    def on_query(sql, seconds):
+        recorder.count(sql, seconds)
+        if app_hook is not None:
+            app_hook(sql, seconds)
+
+    app.extensions["db_on_query"] = on_query
+    reset_pools()
+
+    rng = random.Random(seed)
+    clients = {}
+
+    def client_for(user_id):
+        if user_id not in clients:
+            client = app.test_client()
+            client.post("/login", data={"identifier": f"user{user_id}", "password": PASSWORD})
+            client.get("/dashboard")  # consume the login flash, which bypasses the page cache
+            clients[user_id] = client
+        return clients[user_id]
+
+    for name, method, path in READ_ROUTES:
+        for _ in range(requests):
+            recorder.call(name, client_for(rng.randint(1, users)), method, path)
+
+    for _ in range(requests):
+        recorder.call("optimize_tasks_post", client_for(rng.randint(1, users)), "POST", "/optimize_tasks",
+                      data={"strategy": rng.choice(OPTIMIZE_STRATEGIES), "available_time": "480"})
+
+    for _ in range(requests):
+        recorder.call("plan_days_post", client_for(rng.randint(1, users)), "POST", "/plan_days",
+                      data={"method": rng.choice(PLAN_METHODS),
+                            "day_minutes": [str(rng.choice([0, 120, 240, 480])) for _ in range(7)]})
+
+    # One full task lifecycle per iteration through the JSON API
+    for _ in range(requests):
+        user_id = rng.randint(1, users)
+        client = client_for(user_id)
+        task = recorder.call("api_create", client, "POST", "/api/tasks",
+                             json={"task_name": "bench", "estimated_time": 30}).get_json()["task"]
+        for action in ("start", "pause", "resume", "complete"):
+            recorder.call(f"api_{action}", client, "POST", f"/api/tasks/{task['id']}/{action}")
+        with app.app_context():
+            completed_id = get_db_connection().execute(
+                "SELECT MAX(id) FROM completed_tasks WHERE user_id = ?", (user_id,)).fetchone()[0]
+        unmarked = recorder.call("api_unmark", client, "POST",
+                                 f"/api/completed_tasks/{completed_id}/unmark").get_json()
+        recorder.call("api_delete", client, "DELETE", f"/api/tasks/{unmarked['task']['id']}")
+
+    # The form routes: edit one task, then batch actions over a handful
+    for _ in range(requests):
+        client = client_for(rng.randint(1, users))
+        task_ids = [str(client.post("/api/tasks", json={"task_name": "bench batch", "estimated_time": 15})
+                        .get_json()["task"]["id"]) for _ in range(BATCH_TASKS)]
+        recorder.call("edit_task_get", client, "GET", f"/edit_task/{task_ids[0]}")
+        recorder.call("edit_task_post", client, "POST", f"/edit_task/{task_ids[0]}",
+                      data={"task_name": "bench batch edited", "estimated_time": "20", "priority": "1"})
+        for action in ("start", "pause", "resume", "delete"):
+            recorder.call(f"batch_{action}", client, "POST", "/batch_tasks",
+                          data={"action": action, "task_ids": task_ids})
+
+    return {
+        "meta": {
+            "users": users,
+            "requests": requests,
+            "page_cache": page_cache,
+            "python": sys.version.split()[0],
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "routes": recorder.results(),
+    }
+
+
+def compare(current, baseline, threshold, min_delta_ms=0.5):
+    """Lines describing each route against the baseline, and whether any
+    regressed. A p95 change under min_delta_ms is noise, whatever the ratio."""
+    lines, regressed = [], False
+    for name, now in current["routes"].items():
+        before = baseline["routes"].get(name)
+        if before is None:
+            lines.append(f"{name:<30} new route")
+            continue
+        slower = (now["p95_ms"] > before["p95_ms"] * (1 + threshold)
+                  and now["p95_ms"] - before["p95_ms"] > min_delta_ms)
+        chattier = now["queries"] > before["queries"] * (1 + threshold)
+        flag = "REGRESSION" if slower or chattier else "ok"
+        regressed |= slower or chattier
+        lines.append(f"{name:<30} p95 {before['p95_ms']:>8.2f} -> {now['p95_ms']:>8.2f} ms   "
+                     f"queries {before['queries']:>6.1f} -> {now['queries']:>6.1f}   {flag}")
+    rss_before, rss_now = baseline.get("peak_rss_mb"), current["peak_rss_mb"]
+    if rss_before:
+        heavier = rss_now > rss_before * (1 + threshold)
+        regressed |= heavier
+        lines.append(f"{'peak RSS':<30} {rss_before:.1f} -> {rss_now:.1f} MB   "
+                     f"{'REGRESSION' if heavier else 'ok'}")
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every route through the Flask test client.")
+    parser.add_argument("--db", help="existing database to run against (default: generate one)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--active", type=int, default=20)
+    parser.add_argument("--completed", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200, help="calls per route")
+    parser.add_argument("--no-page-cache", action="store_true", help="disable the per-user page cache")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="ignore p95 changes smaller than this")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    db_path = args.db
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        counts = generate(db_path, args.users, args.active, args.completed, seed=args.seed)
+        print("Generated " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+    results = run(db_path, args.users, args.requests, page_cache=not args.no_page_cache, seed=args.seed)
+
+    print(f"{'route':<30} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, stats in results["routes"].items():
+        print(f"{name:<30} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} "
+              f"{stats['queries']:>8.1f}")
+    print(f"peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        lines, regressed = compare(results, baseline, args.threshold, args.min_delta_ms)
+        print()
+        print("\n".join(lines))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
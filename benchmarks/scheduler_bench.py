@@ -0,0 +1,73 @@
+"""Compare the /optimize_tasks engine with the old greedy prefix cutoff.
+
+    python -m benchmarks.scheduler_bench [--budget 480] [--seed 7]
+
+For each synthetic task set it reports the value each approach reaches
+(as a percentage of the best value found) and how long it took.
+"""
+
+import argparse
+import random
+import time
+
+from scheduler import select_tasks, task_values
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+STRATEGIES = {
+    "priority": lambda task: task[3],
+    "longest_job": lambda task: -task[2],
+    "max_tasks": lambda task: task[2],
+}
+
+
+def synthetic_tasks(n, rng):
+    return [(i, f"task {i}", rng.randint(5, 240), rng.randint(0, 5)) for i in range(n)]
+
+
+def greedy_prefix(tasks, budget, strategy):
+    """The pre-engine behaviour: sort, then stop at the first task that doesn't fit."""
+    ordered = sorted(tasks, key=STRATEGIES[strategy])
+    chosen, total = [], 0
+    for task in ordered:
+        if total + task[2] > budget:
+            break
+        chosen.append(task)
+        total += task[2]
+    return chosen
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=int, default=480, help="available minutes")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--time-limit-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'tasks':>7} {'strategy':<12} {'greedy %':>9} {'greedy ms':>10} "
+          f"{'engine %':>9} {'engine ms':>10} {'approx %':>9} {'approx ms':>10}  method")
+    for n in SIZES:
+        tasks = synthetic_tasks(n, rng)
+        for strategy in STRATEGIES:
+            values = dict(zip((t[0] for t in tasks), task_values(tasks, strategy)))
+            greedy, greedy_ms = timed(greedy_prefix, tasks, args.budget, strategy)
+            exact, exact_ms = timed(select_tasks, tasks, args.budget, strategy,
+                                    time_limit_ms=args.time_limit_ms)
+            approx, approx_ms = timed(select_tasks, tasks, args.budget, strategy, time_limit_ms=0)
+
+            greedy_value = sum(values[t[0]] for t in greedy)
+            best = max(exact.value, approx.value, greedy_value) or 1
+            print(f"{n:>7} {strategy:<12} {100 * greedy_value / best:>8.1f}% {greedy_ms:>10.2f} "
+                  f"{100 * exact.value / best:>8.1f}% {exact_ms:>10.2f} "
+                  f"{100 * approx.value / best:>8.1f}% {approx_ms:>10.2f}  "
+                  f"{exact.method}{'' if exact.exact else ' (time limit)'}")
+
+
+if __name__ == "__main__":
+    main()
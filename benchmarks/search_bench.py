@@ -0,0 +1,104 @@
+"""Time /search's FTS5 query against a LIKE scan on a large database.
+
+    python -m benchmarks.search_bench [--db search.db] [--users 1000] [--per-user 1000]
+                                      [--queries 500] [--seed 7]
+
+Without --db a synthetic database with users x per-user rows (5% active,
+the rest completed; 1M rows by default) is generated in a temp directory,
+which takes about a minute. Each query is a random user searching one or
+two words from the generator's vocabulary, the last one cut to a prefix
+as if still typing. The LIKE baseline is the same search done with
+'%word%' filters on the user's rows; it can use the user_id index but has
+to read every one of the user's rows.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from archive import attach_archive
+from benchmarks.generate_data import DETAILS, NOUNS, VERBS, generate
+from search import search_tasks
+
+LIKE_SQL = '''
+    SELECT 'active', id, task_name FROM tasks
+    WHERE user_id = :user_id AND {filters}
+    UNION ALL
+    SELECT 'completed', id, task_name FROM completed_tasks
+    WHERE user_id = :user_id AND {filters}
+    ORDER BY 2 DESC LIMIT 21
+'''
+
+
+def random_query(rng):
+    words = [rng.choice(VERBS + NOUNS + " ".join(DETAILS).split()) for _ in range(rng.randint(1, 2))]
+    words[-1] = words[-1][:max(2, rng.randint(2, len(words[-1])))]
+    return " ".join(words)
+
+
+def like_search(cur, user_id, text):
+    words = text.split()
+    filters = " AND ".join(f"(task_name LIKE :w{i} OR description LIKE :w{i})" for i in range(len(words)))
+    params = {"user_id": user_id, **{f"w{i}": f"%{word}%" for i, word in enumerate(words)}}
+    cur.execute(LIKE_SQL.format(filters=filters), params)
+    return cur.fetchall()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return pick(0.50), pick(0.95), pick(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--per-user", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if path is None:
+            path = os.path.join(tmp, "search.db")
+            active = max(1, args.per_user // 20)
+            start = time.perf_counter()
+            counts = generate(path, users=args.users, active=active, completed=args.per_user - active,
+                              seed=args.seed)
+            print(f"Generated {counts['tasks'] + counts['completed_tasks']} rows "
+                  f"in {time.perf_counter() - start:.0f}s.")
+
+        connection = sqlite3.connect(path)
+        attach_archive(connection, os.path.join(tmp, "search_archive.db"))
+        users = connection.execute("SELECT MAX(id) FROM users").fetchone()[0]
+        cur = connection.cursor()
+
+        rng = random.Random(args.seed)
+        queries = [(rng.randint(1, users), random_query(rng)) for _ in range(args.queries)]
+        timings = {"fts5": [], "like": []}
+        hits = 0
+        for user_id, text in queries:
+            start = time.perf_counter()
+            results, _ = search_tasks(cur, user_id, text)
+            timings["fts5"].append(time.perf_counter() - start)
+            hits += bool(results)
+
+            start = time.perf_counter()
+            like_search(cur, user_id, text)
+            timings["like"].append(time.perf_counter() - start)
+        connection.close()
+
+    print(f"{args.queries} queries, {hits} with results")
+    print(f"{'method':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for method, samples in timings.items():
+        p50, p95, p99 = percentiles(samples)
+        print(f"{method:<8} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
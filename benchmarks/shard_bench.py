@@ -0,0 +1,107 @@
+"""Write throughput as worker processes scale: one file vs SHARD_COUNT shards.
+
+    python -m benchmarks.shard_bench [--clients 64] [--ops 20] [--shards 8]
+                                     [--workers 1 2 4 8]
+
+A synthetic database is generated and split with shards.split, then each
+worker count is run against the single file and against the shards. The
+--clients logged-in users are divided among that many worker processes
+(started fresh, like gunicorn workers), each client a thread running
+write_bench's create/start/pause/resume/complete loop with a commit per
+request. Throughput is every request over the wall time from releasing the
+workers to the last one finishing; "failed" counts 5xx responses, which
+here means a write that gave up on the lock after DB_BUSY_TIMEOUT_MS.
+
+Sharding only takes writers off each other's lock; it doesn't add CPU. On
+a machine with fewer cores than workers the gain shows as less time lost to
+lock waits (SQLite's busy handler sleeps between retries), not as parallel
+speedup.
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.generate_data import generate
+
+
+def worker(env, user_ids, ops, ready, go, results):
+    os.environ.update(env)
+    from benchmarks.write_bench import load_app, writer_thread
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):  # create_app's migration report
+        app = load_app(env["DB_PATH"])
+    latencies, failures = [], []
+    barrier = threading.Barrier(len(user_ids) + 1)
+    threads = [threading.Thread(target=writer_thread, args=(app, user_id, ops, latencies, failures, barrier))
+               for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    ready.put(os.getpid())
+    go.wait()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, len(failures)))
+
+
+def run(env, workers, clients, ops):
+    context = multiprocessing.get_context("spawn")
+    ready, results, go = context.Queue(), context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(env, list(range(1 + i, clients + 1, workers)), ops,
+                                                       ready, go, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+
+    start = time.perf_counter()
+    go.set()
+    latencies, failed = [], 0
+    for _ in processes:
+        samples, failures = results.get()
+        latencies += samples
+        failed += failures
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {"per_s": len(latencies) / elapsed, "p50": pick(0.50), "p99": pick(0.99), "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--ops", type=int, default=20, help="timer actions per client")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    from shards import split
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "shard.db")
+        archive_path = os.path.join(tmp, "shard_archive.db")
+        generate(db_path, users=args.clients, active=5, completed=50)
+        split(db_path, archive_path, args.shards)
+        base = {"DB_PATH": db_path, "ARCHIVE_DB_PATH": archive_path, "METRICS_ENABLED": "0",
+                "WRITE_QUEUE_ENABLED": "0"}
+
+        print(f"{args.clients} clients, {args.ops + 3} writes each, {os.cpu_count()} CPUs")
+        print(f"{'workers':>7} {'storage':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+        for workers in args.workers:
+            for label, count in (("1 file", 0), (f"{args.shards} shards", args.shards)):
+                result = run({**base, "SHARD_COUNT": str(count)}, workers, args.clients, args.ops)
+                print(f"{workers:>7} {label:<10} {result['per_s']:>8.0f} {result['p50']:>8.1f} "
+                      f"{result['p99']:>8.1f} {result['failed']:>7}")
+
+
+if __name__ == '__main__':
+    main()
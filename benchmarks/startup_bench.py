@@ -0,0 +1,98 @@
+"""Measure cold start: from importing the app to its first response.
+
+    python -m benchmarks.startup_bench [--runs 5] [--gunicorn] [--port 8765]
+
+Each run starts a fresh interpreter against a new, empty database, so it
+pays everything a scale-to-zero instance pays: imports, migrations and the
+first request's connection and template compile. The default mode splits
+that into import, create_app() and first-response time through Flask's
+test client. --gunicorn instead launches `gunicorn -c gunicorn.conf.py`
+and times from spawning it to the first HTTP 200, which adds the server's
+own boot and the fork.
+
+A running app reports the same import-to-first-response figure per process
+as taskcrafter_startup_seconds on /metrics.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line of milliseconds
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+response = flask_app.test_client().get("/login")
+t3 = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({"import": (t1 - t0) * 1000, "create_app": (t2 - t1) * 1000,
+                  "first_response": (t3 - t2) * 1000, "total": (t3 - t0) * 1000}))
+"""
+
+
+def fresh_env(tmp, run):
+    env = dict(os.environ)
+    env["DB_PATH"] = os.path.join(tmp, f"startup{run}.db")
+    env["ARCHIVE_DB_PATH"] = os.path.join(tmp, f"startup{run}_archive.db")
+    return env
+
+
+def test_client_run(tmp, run):
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=fresh_env(tmp, run),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def gunicorn_run(tmp, run, port, timeout=30):
+    env = fresh_env(tmp, run)
+    env["PORT"] = str(port)
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1) as response:
+                    if response.status == 200:
+                        return {"total": (time.perf_counter() - start) * 1000}
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"no response from gunicorn within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="time a real gunicorn boot instead")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.gunicorn:
+            results = [gunicorn_run(tmp, run, args.port) for run in range(args.runs)]
+        else:
+            results = [test_client_run(tmp, run) for run in range(args.runs)]
+
+    print(f"{'phase':<16} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for phase in results[0]:
+        values = [result[phase] for result in results]
+        print(f"{phase:<16} {statistics.median(values):>10.1f} {min(values):>8.1f} {max(values):>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Render time of a 10k-row completed list: TEXT + strptime vs epoch codec.
+
+    python -m benchmarks.timecodec_bench [--rows 10000] [--repeat 5]
+
+Both variants render the same Jinja template; only the to_ist filter and the
+stored representation differ.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+import pytz
+from jinja2 import Environment
+
+from timecodec import format_epoch, to_text
+
+TEMPLATE = (
+    "{% for row in rows %}<li>{{ row.task_name }} "
+    "started {{ row.start | to_ist }}, done {{ row.completed | to_ist }}</li>{% endfor %}"
+)
+FORMAT = "%d %b %Y %I:%M %p"
+
+
+def to_ist_text(value, format=FORMAT):
+    """The filter as it was: rebuild tz objects and strptime on every call."""
+    if value is None:
+        return "N/A"
+    try:
+        utc = pytz.utc
+        ist = pytz.timezone("Asia/Kolkata")
+        dt = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        return utc.localize(dt).astimezone(ist).strftime(format)
+    except Exception:
+        return "Invalid time"
+
+
+def make_epoch_filter():
+    memo = {}  # one dict per render, like flask.g in the app
+
+    def to_ist_epoch(value, format=FORMAT):
+        if value is None:
+            return "N/A"
+        return format_epoch(value, format, memo=memo)
+    return to_ist_epoch
+
+
+def render(filter_fn, rows):
+    env = Environment()
+    env.filters["to_ist"] = filter_fn
+    template = env.from_string(TEMPLATE)
+    start = time.perf_counter()
+    template.render(rows=rows)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    now = int(time.time())
+    epochs = []
+    for i in range(args.rows):
+        # Minute resolution, so a busy user's list repeats timestamps
+        completed = now - rng.randint(0, 90 * 24 * 60) * 60
+        epochs.append((f"task {i}", completed - rng.randint(5, 240) * 60, completed))
+    text_rows = [{"task_name": n, "start": to_text(s), "completed": to_text(c)} for n, s, c in epochs]
+    epoch_rows = [{"task_name": n, "start": s, "completed": c} for n, s, c in epochs]
+
+    text_ms = min(render(to_ist_text, text_rows) for _ in range(args.repeat))
+    epoch_ms = min(render(make_epoch_filter(), epoch_rows) for _ in range(args.repeat))
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"  TEXT + strptime + pytz per call: {text_ms:8.1f} ms")
+    print(f"  epoch + cached tz + memo:        {epoch_ms:8.1f} ms  ({text_ms / epoch_ms:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Contention benchmark: per-request commits vs the group-commit writer.
+
+    python -m benchmarks.write_bench [--writers 64] [--ops 40] [--db bench.db]
+
+Each writer is a thread logged in as its own user, driving the JSON API the
+way the dashboard does: create a task, then start/pause/resume it --ops
+times, then complete it. The same run is made twice in one process, first
+with a commit per request (the default) and then with WRITE_QUEUE_ENABLED,
+and the report has throughput, latency percentiles and failed requests
+("database is locked" and friends) for each.
+
+Note the two modes are not equally durable: pooled connections commit with
+synchronous=NORMAL, the writer thread with synchronous=FULL.
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.generate_data import PASSWORD, generate
+
+ACTIONS = ("start", "pause", "resume")
+
+
+def load_app(db_path):
+    os.environ["DB_PATH"] = db_path
+    import app as app_module
+    return app_module.create_app()
+
+
+def writer_thread(app, user_id, ops, latencies, failures, barrier):
+    client = app.test_client()
+    client.post("/login", data={"identifier": f"user{user_id}", "password": PASSWORD})
+
+    def call(path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = client.post(path, **kwargs)
+            ok = response.status_code < 500
+        except Exception:
+            ok, response = False, None
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            failures.append(path)
+        return response
+
+    barrier.wait()
+    created = call("/api/tasks", json={"task_name": "contention", "estimated_time": 30})
+    if created is None or created.status_code != 201:
+        return
+    task_id = created.get_json()["task"]["id"]
+    for i in range(ops):
+        call(f"/api/tasks/{task_id}/{ACTIONS[i % len(ACTIONS)]}")
+    call(f"/api/tasks/{task_id}/start")
+    call(f"/api/tasks/{task_id}/complete")
+
+
+def run(app, writers, ops, queued):
+    from writer import get_writer, stop_writer
+
+    app.config["WRITE_QUEUE_ENABLED"] = queued
+    latencies, failures = [], []
+    barrier = threading.Barrier(writers + 1)
+    threads = [threading.Thread(target=writer_thread, args=(app, user_id, ops, latencies, failures, barrier))
+               for user_id in range(1, writers + 1)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    batches = jobs = 0
+    if queued:
+        with app.app_context():
+            writer = get_writer()
+            batches, jobs = writer.batches, writer.jobs
+            stop_writer()
+
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        "requests": len(latencies),
+        "per_s": len(latencies) / elapsed,
+        "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000,
+        "failed": len(failures),
+        "avg_batch": jobs / batches if batches else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=64)
+    parser.add_argument("--ops", type=int, default=40, help="timer actions per writer")
+    parser.add_argument("--db", help="existing database with at least --writers users")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "write.db")
+            generate(db_path, users=args.writers, active=5, completed=50)
+        app = load_app(db_path)
+
+        print(f"{args.writers} concurrent writers, {args.ops + 3} writes each")
+        print(f"{'mode':<16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+              f"{'failed':>7} {'batch':>6}")
+        for label, queued in (("commit/request", False), ("group commit", True)):
+            result = run(app, args.writers, args.ops, queued)
+            print(f"{label:<16} {result['per_s']:>8.0f} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+                  f"{result['p99']:>8.1f} {result['max']:>8.1f} {result['failed']:>7} {result['avg_batch']:>6.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Per-user page caching for the read-heavy views.
+
+Every write a user makes bumps user_aggregates.data_version (call
+bump_data_version on the cursor doing the write). The read views wrapped in
+@cached_page then:
+
+  * answer 304 Not Modified when the browser's ETag still matches (a bare
+    If-Modified-Since only when it is later than the last write), and
+  * otherwise serve the rendered body (HTML or JSON) from an in-process
+    LRU keyed by (user, data version, day, URL), rendering only on a miss.
+
+The day is part of the key because pages such as the streak on /profile
+and the "today" filters change at midnight without any write.
+"""
+
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from db import get_db_connection
+from timecodec import day_start_epoch, now_epoch
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered (body, mimetype) pairs, bounded by the
+    total bytes of the bodies."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype="text/html"):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_fragment_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FragmentCache(current_app.config['PAGE_CACHE_MAX_BYTES'])
+    return _cache
+
+
+def bump_data_version(cur, user_id):
+    """Mark everything cached for this user as stale. Call it on the cursor
+    doing the write so the bump commits (or rolls back) with it."""
+    cur.execute('''
+        INSERT INTO user_aggregates (user_id, data_version, data_updated_ts)
+        VALUES (?, 1, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            data_version = data_version + 1,
+            data_updated_ts = excluded.data_updated_ts
+    ''', (user_id, now_epoch()))
+
+
+def cached_page(view):
+    """Serve a per-user read view with ETag/Last-Modified and the LRU."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = session.get('user_id')
+        # Pending flash messages are rendered into the page: never cache those
+        if user_id is None or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        row = get_db_connection().execute(
+            "SELECT data_version, data_updated_ts FROM user_aggregates WHERE user_id = ?",
+            (user_id,)).fetchone()
+        version, updated_ts = (row[0], row[1] or 0) if row else (0, 0)
+
+        today = date.today()
+        key = (user_id, version, today.isoformat(), request.full_path)
+        etag = f"{user_id}-{version}-{today:%Y%m%d}-{zlib.crc32(request.full_path.encode()):08x}"
+        last_modified = datetime.fromtimestamp(max(updated_ts, day_start_epoch(today)), timezone.utc)
+
+        if request.if_none_match:
+            # The ETag carries data_version: it alone decides
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            # data_updated_ts has one-second resolution, so a write in the
+            # same second as the copy the client holds leaves Last-Modified
+            # unchanged. Without an ETag the version can't be checked, so a
+            # date alone only counts when it is strictly newer than the data
+            not_modified = request.if_modified_since is not None and last_modified < request.if_modified_since
+        if not_modified:
+            response = make_response('', 304)
+        else:
+            cache = get_fragment_cache()
+            entry = cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cache.put(key, response.get_data(), response.mimetype)
+            else:
+                response = make_response(entry[0])
+                response.mimetype = entry[1]
+
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True  # always revalidate, usually to a 304
+        return response
+    return wrapper
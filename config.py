@@ -0,0 +1,71 @@
+import os
+
+
+class Config:
+    # Use environment variable for DB path or fallback to local
+    DB_PATH = os.getenv("DB_PATH", "taskcrafter.db")
+
+    # Connection pool (per worker process)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+    # Pragmas applied once when a pooled connection is opened
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(16 * 1024)))
+
+    # Time budget for the exact /optimize_tasks search before it settles
+    # for the best plan found so far
+    OPTIMIZER_TIME_LIMIT_MS = int(os.getenv("OPTIMIZER_TIME_LIMIT_MS", "50"))
+
+    # Rows per page on /completed_tasks
+    COMPLETED_PAGE_SIZE = int(os.getenv("COMPLETED_PAGE_SIZE", "50"))
+
+    # Ranked results per page on /search
+    SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+
+    # Rows fetched per fetchmany() call while streaming exports
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Upper bound on rendered pages kept in the per-process LRU
+    PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+    # Request/SQL/template timings on /metrics (per process)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+    # Bearer token that /metrics and /cache_stats require; unset, both
+    # answer 404. Scrape with "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Log statements slower than this many milliseconds; 0 turns it off
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "0"))
+
+    # Completed tasks older than ARCHIVE_AFTER_DAYS are moved to this file by
+    # archive.py; it is attached to every pooled connection as "archive"
+    ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", os.path.splitext(DB_PATH)[0] + "_archive.db")
+    ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+    # Send task writes through one writer thread per process that commits
+    # them in groups (see writer.py) instead of a commit per request
+    WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE_ENABLED", "0") == "1"
+    WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))
+    WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "2"))
+    WRITE_TIMEOUT_MS = int(os.getenv("WRITE_TIMEOUT_MS", "10000"))
+
+    # Spread users' tasks over this many shard files next to DB_PATH, with
+    # DB_PATH kept for users and login (see shards.py); 0 keeps one file
+    SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+
+    # Live dashboard updates over Server-Sent Events (see events.py): open
+    # streams per process, seconds between keep-alives (each one also
+    # checks for changes made through other workers), and how long a stream
+    # lasts before the browser is asked to reconnect
+    EVENT_STREAMS_MAX = int(os.getenv("EVENT_STREAMS_MAX", "16"))
+    EVENT_HEARTBEAT_S = float(os.getenv("EVENT_HEARTBEAT_S", "15"))
+    EVENT_STREAM_LIFETIME_S = float(os.getenv("EVENT_STREAM_LIFETIME_S", "300"))
+
+    # Rows per executemany + commit in bulk imports (see import_tasks.py)
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+    # What the task routes read and write through: a callable taking a
+    # cursor and returning a repository.TaskRepository, or its import path
+    REPOSITORY = os.getenv("REPOSITORY", "repository.SQLiteRepository")
@@ -0,0 +1,192 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_request_context, session
+
+from archive import attach_archive
+from shards import store_for
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Reports every statement and its duration to the connection's on_query
+    hook. The time covers execute() -- for a SELECT that is the work up to
+    the first row, not fetching the rest."""
+
+    def execute(self, sql, parameters=()):
+        on_query = self.connection.on_query
+        if on_query is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            on_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        on_query = self.connection.on_query
+        if on_query is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            on_query(sql, time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors are TimedCursors. on_query(sql, seconds) is
+    called after each statement; None turns the timing off."""
+
+    on_query = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Keeps idle SQLite connections for one database file so requests can
+    reuse them instead of paying for connect + pragma setup every time."""
+
+    def __init__(self, path, size=8, busy_timeout_ms=5000, mmap_size=0, cache_size_kb=2000, on_query=None,
+                 archive_path=None):
+        self.path = path
+        self.archive_path = archive_path
+        self.on_query = on_query
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def connect(self):
+        """A new connection with the pool's settings, outside the pool: the
+        caller closes it."""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,  # handed between gunicorn threads, never shared
+            factory=TimedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        if self.archive_path:
+            attach_archive(conn, self.archive_path)
+        # Set last so the pragmas above aren't counted against a request
+        conn.on_query = self.on_query
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connect()
+
+    def release(self, conn):
+        # Never hand a half-finished transaction to the next request
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=None, archive_path=None):
+    config = current_app.config
+    path = path or config["DB_PATH"]
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(
+                    path,
+                    size=config["DB_POOL_SIZE"],
+                    busy_timeout_ms=config["DB_BUSY_TIMEOUT_MS"],
+                    mmap_size=config["DB_MMAP_SIZE"],
+                    cache_size_kb=config["DB_CACHE_SIZE_KB"],
+                    on_query=current_app.extensions.get("db_on_query"),
+                    archive_path=archive_path or config["ARCHIVE_DB_PATH"],
+                )
+                _pools[path] = pool
+    return pool
+
+
+def reset_pools():
+    """Drop every pool in this process. A forked worker calls this first
+    (gunicorn.conf.py's post_fork), so it never reuses a connection the
+    master opened -- SQLite handles must not cross a fork."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+def user_store(user_id=None):
+    """(path, archive_path) of the database holding `user_id`'s tasks, by
+    default the logged-in user's. That is DB_PATH unless SHARD_COUNT is
+    set and there is a user (see shards.py)."""
+    config = current_app.config
+    if user_id is None and has_request_context():
+        user_id = session.get("user_id")
+    if user_id is None:
+        return config["DB_PATH"], config["ARCHIVE_DB_PATH"]
+    return store_for(user_id, config["DB_PATH"], config["ARCHIVE_DB_PATH"], config["SHARD_COUNT"])
+
+
+def _request_connection(path, archive_path):
+    connections = g.setdefault("db_connections", {})
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = get_pool(path, archive_path).acquire()
+    return conn
+
+
+def get_db_connection(user_id=None):
+    """Return the request's connection to `user_id`'s database (see
+    user_store; by default the logged-in user's), checking one out of the
+    pool on first use. It goes back to the pool at teardown."""
+    return _request_connection(*user_store(user_id))
+
+
+def get_directory_connection():
+    """The request's connection to DB_PATH, where users sign up and log in.
+    The same connection as get_db_connection() unless sharding is on."""
+    config = current_app.config
+    return _request_connection(config["DB_PATH"], config["ARCHIVE_DB_PATH"])
+
+
+def release_db_connection(exc=None):
+    for path, conn in g.pop("db_connections", {}).items():
+        get_pool(path).release(conn)
+
+
+def init_app(app, on_query=None):
+    """Register the pool teardown. on_query, if given, is called as
+    on_query(sql, seconds) after every statement on a pooled connection."""
+    app.extensions["db_on_query"] = on_query
+    app.teardown_appcontext(release_db_connection)
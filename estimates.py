@@ -0,0 +1,202 @@
+"""Per-user estimate correction for /optimize_tasks, learned from history.
+
+Every completed task has an estimate and the minutes it actually took. For
+each user and task size (SIZE_BUCKETS, by estimated minutes) the
+user_estimate_stats table keeps a running count, mean and sum of squared
+deviations (Welford's M2) of actual / estimated. complete_tasks folds the
+completed rows in, uncomplete_task takes its row back out, both on the
+cursor doing the write, so reading a user's statistics at plan time is one
+primary-key lookup of at most len(SIZE_BUCKETS) + 1 rows, never a scan of
+their history.
+
+The optimizer then plans with the estimate times the (shrunk) mean ratio,
+and shows the range mean +/- RANGE_Z standard deviations as the likely
+duration. Run this module to rebuild the table from every completed row,
+archived ones included (the migration that created it only saw the hot
+rows):
+
+    python estimates.py
+"""
+
+import math
+import sqlite3
+from bisect import bisect_left
+from collections import namedtuple
+
+# Upper bounds (minutes, inclusive) of every size bucket but the last
+SIZE_BUCKETS = (15, 30, 60, 120, 240)
+
+# Ratios are clamped so one task left running overnight doesn't swamp the mean
+RATIO_MIN = 0.1
+RATIO_MAX = 10.0
+
+# A bucket with fewer samples than this borrows the user's overall ratio
+MIN_SAMPLES = 3
+# The mean is shrunk towards 1.0 (the user's own estimate) as if this many
+# tasks had taken exactly as long as estimated
+PRIOR_WEIGHT = 3
+# Likely range: mean +/- RANGE_Z standard deviations (roughly 10th-90th percentile)
+RANGE_Z = 1.28
+
+Estimate = namedtuple("Estimate", "estimated minutes low high ratio samples")
+
+_BUCKET_SQL = ("CASE " + " ".join(f"WHEN estimated_time <= {edge} THEN {i}" for i, edge in enumerate(SIZE_BUCKETS))
+               + f" ELSE {len(SIZE_BUCKETS)} END")
+
+# (user_id, bucket, n, mean, m2) per user and bucket from completed rows;
+# {source} is a table name or a subquery over completed tasks
+STATS_SQL = f'''
+    SELECT user_id, bucket, COUNT(*) AS n, AVG(x) AS mean,
+           MAX(0.0, SUM(x * x) - COUNT(*) * AVG(x) * AVG(x)) AS m2
+    FROM (
+        SELECT user_id, {_BUCKET_SQL} AS bucket,
+               MIN(MAX(CAST(actual_time AS REAL) / estimated_time, {RATIO_MIN}), {RATIO_MAX}) AS x
+        FROM {{source}}
+        WHERE actual_time IS NOT NULL AND estimated_time > 0
+    )
+    GROUP BY user_id, bucket
+'''
+
+
+def size_bucket(estimated_time):
+    return bisect_left(SIZE_BUCKETS, estimated_time)
+
+
+def ratio(estimated_time, actual_time):
+    """actual / estimated for one completed task (clamped), or None when it
+    can't be computed."""
+    if actual_time is None or not estimated_time or estimated_time <= 0:
+        return None
+    return min(max(actual_time / estimated_time, RATIO_MIN), RATIO_MAX)
+
+
+def summarize(values):
+    """(n, mean, m2) of `values` by Welford's online update."""
+    n, mean, m2 = 0, 0.0, 0.0
+    for x in values:
+        n += 1
+        delta = x - mean
+        mean += delta / n
+        m2 += delta * (x - mean)
+    return n, mean, m2
+
+
+def merge(a, b):
+    """(n, mean, m2) of two samples combined (Chan et al.'s pairwise update)."""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n
+
+
+def remove(stats, x):
+    """(n, mean, m2) with the value `x` taken back out; (0, 0.0, 0.0) once
+    nothing is left."""
+    n, mean, m2 = stats
+    if n <= 1:
+        return 0, 0.0, 0.0
+    new_mean = (n * mean - x) / (n - 1)
+    return n - 1, new_mean, max(0.0, m2 - (x - mean) * (x - new_mean))
+
+
+def _save(cur, user_id, bucket, stats):
+    if stats[0] == 0:
+        cur.execute("DELETE FROM user_estimate_stats WHERE user_id = ? AND bucket = ?", (user_id, bucket))
+        return
+    cur.execute('''
+        INSERT INTO user_estimate_stats (user_id, bucket, n, mean, m2) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, bucket) DO UPDATE SET n = excluded.n, mean = excluded.mean, m2 = excluded.m2
+    ''', (user_id, bucket, *stats))
+
+
+def _load(cur, user_id, bucket):
+    cur.execute("SELECT n, mean, m2 FROM user_estimate_stats WHERE user_id = ? AND bucket = ?", (user_id, bucket))
+    row = cur.fetchone()
+    return tuple(row) if row else (0, 0.0, 0.0)
+
+
+def record_completed(cur, user_id, pairs):
+    """Fold (estimated_time, actual_time) of newly completed tasks into the
+    user's statistics: one read and one write per bucket touched."""
+    by_bucket = {}
+    for estimated_time, actual_time in pairs:
+        x = ratio(estimated_time, actual_time)
+        if x is not None:
+            by_bucket.setdefault(size_bucket(estimated_time), []).append(x)
+    for bucket, values in by_bucket.items():
+        _save(cur, user_id, bucket, merge(_load(cur, user_id, bucket), summarize(values)))
+
+
+def record_uncompleted(cur, user_id, estimated_time, actual_time):
+    """Take an unmarked task's ratio back out of the user's statistics."""
+    x = ratio(estimated_time, actual_time)
+    if x is None:
+        return
+    bucket = size_bucket(estimated_time)
+    _save(cur, user_id, bucket, remove(_load(cur, user_id, bucket), x))
+
+
+def read_stats(cur, user_id):
+    """{bucket: (n, mean, m2)} for the user."""
+    cur.execute("SELECT bucket, n, mean, m2 FROM user_estimate_stats WHERE user_id = ?", (user_id,))
+    return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+
+def correct(estimated_time, stats):
+    """An Estimate for a task of `estimated_time` minutes given the user's
+    {bucket: (n, mean, m2)}. Without history it is the estimate itself."""
+    n, mean, m2 = stats.get(size_bucket(estimated_time), (0, 0.0, 0.0))
+    if n < MIN_SAMPLES:
+        n, mean, m2 = (0, 0.0, 0.0)
+        for bucket_stats in stats.values():
+            n, mean, m2 = merge((n, mean, m2), bucket_stats)
+    if n == 0:
+        return Estimate(estimated_time, estimated_time, estimated_time, estimated_time, 1.0, 0)
+    shrunk = (n * mean + PRIOR_WEIGHT) / (n + PRIOR_WEIGHT)
+    spread = RANGE_Z * math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+    minutes = max(1, round(estimated_time * shrunk))
+    low = max(1, math.floor(estimated_time * max(shrunk - spread, RATIO_MIN)))
+    high = max(minutes, math.ceil(estimated_time * (shrunk + spread)))
+    return Estimate(estimated_time, minutes, min(low, minutes), high, shrunk, n)
+
+
+def adjust(tasks, stats, mode="corrected"):
+    """Re-time (id, name, estimated_time[, priority]) tasks for the
+    scheduler. mode is "raw" (as entered), "corrected" (the expected
+    duration) or "safe" (the top of the likely range). Returns the re-timed
+    tasks and {task_id: Estimate}."""
+    estimates = {task[0]: correct(task[2], stats) for task in tasks}
+    if mode not in ("corrected", "safe"):
+        return list(tasks), estimates
+    pick = (lambda estimate: estimate.high) if mode == "safe" else (lambda estimate: estimate.minutes)
+    return [(task[0], task[1], pick(estimates[task[0]]), *task[3:]) for task in tasks], estimates
+
+
+def rebuild(connection):
+    """Recompute user_estimate_stats from every completed row, including
+    the archive when it is attached. Returns the number of rows written."""
+    archived = connection.execute(
+        "SELECT 1 FROM pragma_database_list WHERE name = 'archive'").fetchone() is not None
+    source = "main.completed_tasks"
+    if archived:
+        source = ("(SELECT user_id, estimated_time, actual_time FROM main.completed_tasks UNION ALL "
+                  "SELECT user_id, estimated_time, actual_time FROM archive.completed_tasks)")
+    with connection:
+        connection.execute("DELETE FROM user_estimate_stats")
+        return connection.execute("INSERT INTO user_estimate_stats (user_id, bucket, n, mean, m2) "
+                                  + STATS_SQL.format(source=source)).rowcount
+
+
+if __name__ == '__main__':
+    from archive import attach_archive
+    from config import Config
+    from shards import data_stores
+
+    for path, archive_path in data_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT):
+        connection = sqlite3.connect(path)
+        attach_archive(connection, archive_path)
+        print(f"{path}: {rebuild(connection)} user/size statistics rebuilt.")
+        connection.close()
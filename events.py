@@ -0,0 +1,77 @@
+"""In-process pub/sub behind the dashboard's live updates (/api/events).
+
+The task routes publish a user's change after it commits; each open
+dashboard holds a Server-Sent Events stream subscribed to its user and
+patches the page from the event instead of reloading:
+
+    publish(user_id, "started", tasks=[...], counters={...})
+
+Subscribers are per process. A change made through another gunicorn
+worker (or the group-commit writer of another one) isn't delivered here;
+the stream notices it by data_version instead (see app.api_events) and
+sends the whole task list as a "sync" event. A subscriber whose queue is
+full has events dropped the same way, and is caught up by the next sync.
+"""
+
+import json
+import queue
+import threading
+
+from timecodec import now_epoch
+
+# Events a slow stream may fall behind by before new ones are dropped
+QUEUE_SIZE = 64
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(user_id, limit):
+    """A queue receiving `user_id`'s events, or None when this process
+    already serves `limit` streams."""
+    with _subscribers_lock:
+        if sum(len(queues) for queues in _subscribers.values()) >= limit:
+            return None
+        subscription = queue.Queue(maxsize=QUEUE_SIZE)
+        _subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+
+def unsubscribe(user_id, subscription):
+    with _subscribers_lock:
+        queues = _subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(subscription)
+            if not queues:
+                del _subscribers[user_id]
+
+
+def has_subscribers(user_id):
+    """Whether publishing for `user_id` would reach anyone; lets the routes
+    skip reading the changed tasks back when no dashboard is open."""
+    return user_id in _subscribers
+
+
+def stream_count():
+    with _subscribers_lock:
+        return sum(len(queues) for queues in _subscribers.values())
+
+
+def publish(user_id, event, **data):
+    """Send `event` with `data` (JSON-serialisable) to every stream of
+    `user_id` in this process. The server time is added as data["now"]."""
+    with _subscribers_lock:
+        queues = list(_subscribers.get(user_id, ()))
+    message = (event, {**data, "now": now_epoch()})
+    for subscription in queues:
+        try:
+            subscription.put_nowait(message)
+        except queue.Full:
+            pass  # caught up by a sync once the stream sees the newer data_version
+
+
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message."""
+    lines = [] if event_id is None else [f"id: {event_id}"]
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
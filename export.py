@@ -0,0 +1,90 @@
+"""Streaming export of task history as CSV or NDJSON.
+
+Rows are pulled from an executed cursor with fetchmany() and encoded one
+batch at a time, so memory stays flat however long the history is. Used by
+the /export route and by export_db.py for bulk exports.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+EXPORT_COLUMNS = {
+    'completed_tasks': ('id', 'user_id', 'task_name', 'description', 'estimated_time',
+                        'actual_time', 'start_time', 'created_at', 'completed_at'),
+    'tasks': ('id', 'user_id', 'task_name', 'description', 'estimated_time',
+              'priority', 'created_at', 'start_time', 'is_paused'),
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ChainedCursor:
+    """fetchmany() over several cursors in turn, e.g. the archived rows and
+    then the hot ones, each already in order."""
+
+    def __init__(self, *cursors):
+        self.cursors = list(cursors)
+
+    def fetchmany(self, size):
+        while self.cursors:
+            rows = self.cursors[0].fetchmany(size)
+            if rows:
+                return rows
+            self.cursors.pop(0)
+        return []
+
+
+def iter_batches(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def encode_csv(cursor, columns, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in iter_batches(cursor, batch_size):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: nothing matched
+        yield buffer.getvalue().encode('utf-8')
+
+
+def encode_ndjson(cursor, columns, batch_size):
+    for rows in iter_batches(cursor, batch_size):
+        yield ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(',', ':')) + '\n'
+            for row in rows
+        ).encode('utf-8')
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into a single gzip member on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(cursor, columns, fmt, batch_size=1000, compress=False):
+    chunks = ENCODERS[fmt](cursor, columns, batch_size)
+    return gzip_chunks(chunks) if compress else chunks
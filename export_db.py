@@ -0,0 +1,50 @@
+import argparse
+import sqlite3
+import sys
+
+from archive import attach_archive
+from config import Config
+from export import EXPORT_COLUMNS, ENCODERS, ChainedCursor, export_stream
+from shards import data_stores
+
+
+def _store_cursor(connection, table, archive_path, columns):
+    select_sql = f"SELECT {', '.join(columns)} FROM {{table}}"
+    if table == "completed_tasks":
+        attach_archive(connection, archive_path)
+        query = (select_sql.format(table="archive.completed_tasks") + " UNION ALL "
+                 + select_sql.format(table="main.completed_tasks") + " ORDER BY user_id, id")
+    else:
+        query = select_sql.format(table=table) + " ORDER BY user_id, id"
+    return connection.execute(query)
+
+
+def export_all(table, fmt, out, compress=False, batch_size=5000):
+    """Stream every user's rows from `table` into the binary file `out`.
+    completed_tasks includes the rows archive.py moved out. With SHARD_COUNT
+    set the shards are read one after the other, so rows are in user order
+    within each shard."""
+    columns = EXPORT_COLUMNS[table]
+    stores = data_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT)
+    connections = [sqlite3.connect(path) for path, _archive_path in stores]
+    cursor = ChainedCursor(*(_store_cursor(connection, table, archive_path, columns)
+                             for connection, (_path, archive_path) in zip(connections, stores)))
+    for chunk in export_stream(cursor, columns, fmt, batch_size=batch_size, compress=compress):
+        out.write(chunk)
+    for connection in connections:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export task history for all users.")
+    parser.add_argument("table", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("--format", choices=sorted(ENCODERS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "wb") as out:
+            export_all(args.table, args.format, out, compress=args.gzip)
+    else:
+        export_all(args.table, args.format, sys.stdout.buffer, compress=args.gzip)
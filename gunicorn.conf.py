@@ -0,0 +1,43 @@
+"""Production gunicorn settings.
+
+    gunicorn -c gunicorn.conf.py
+
+The master imports the app and runs create_app() once (preload_app), so
+migrations and template/module imports happen before the fork and the
+workers start warm. Each worker then drops anything it inherited from the
+master's connection pool before its first request.
+
+SQLite in WAL mode serves any number of readers next to a single writer,
+so a few processes with a handful of threads each is the sweet spot: more
+workers mostly queue on the write lock and each one holds its own page
+cache and connection pool. Keep DB_POOL_SIZE at least `threads`. With
+SHARD_COUNT set (see shards.py) there is a write lock per shard, and each
+worker keeps a pool per shard it has served.
+
+Each open dashboard holds a live-update stream (/api/events), and under
+gthread a stream occupies a thread for as long as it is open. Every worker
+gets EVENT_STREAMS_MAX threads on top of `threads` for them; the app turns
+streams beyond that away, so they can't starve ordinary requests. Streams
+don't keep a database connection checked out. Events are published in the
+process that made the change; other workers' streams pick it up on their
+next keep-alive (EVENT_HEARTBEAT_S).
+"""
+
+import os
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+preload_app = True
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4")) + int(os.getenv("EVENT_STREAMS_MAX", "16"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from db import reset_pools
+    reset_pools()
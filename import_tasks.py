@@ -0,0 +1,217 @@
+"""Bulk task import from CSV or JSON lines.
+
+Used by POST /api/tasks/import and from the command line:
+
+    python import_tasks.py --user alice tasks.csv
+    python import_tasks.py --user alice --format jsonl tasks.jsonl
+    some-export | python import_tasks.py --user alice --format csv -
+
+A CSV file needs a header row naming at least task_name and
+estimated_time; description and priority are optional, other columns are
+ignored. JSON lines have one object per line with the same keys. Every row
+is checked with the rules /add_task applies (task_actions.parse_task_fields),
+and the valid ones are inserted IMPORT_BATCH_SIZE at a time, one executemany and
+one commit per batch (task_actions.create_tasks). A bad row doesn't stop
+the import: it is reported with its line number and skipped.
+
+The input is read a line at a time and only one batch is held, so memory
+stays flat however large the file is; only the first MAX_ERRORS errors are
+kept, the rest are just counted. Files in the millions of rows are best
+loaded with the CLI, which writes to the user's database directly rather
+than holding a web worker for the whole upload.
+"""
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+
+from task_actions import create_tasks, parse_task_fields
+
+BATCH_SIZE = 1000
+MAX_ERRORS = 100
+
+# SQLite's INTEGER range; a bigger number would fail the whole batch's insert
+MAX_INTEGER = 2 ** 63 - 1
+
+FORMATS = ("csv", "jsonl")
+
+
+def _text(value):
+    # Compare like a form post: 5.5 or true must not pass as a whole number
+    return None if value is None else str(value)
+
+
+def read_csv(text):
+    """(line number, row dict or error message) for every CSV record
+    after the header."""
+    reader = csv.DictReader(text)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # e.g. an unterminated quote or a field over the size limit
+            yield reader.line_num, f"Invalid CSV: {e}"
+            continue
+        yield reader.line_num, row
+
+
+def read_jsonl(text):
+    """(line number, row dict or error message) for every non-blank line."""
+    for number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"Invalid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "Each line must be a JSON object."
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def guess_format(filename=None, mimetype=None):
+    """"csv" or "jsonl" from a file name or content type, else None."""
+    name = (filename or "").lower()
+    if name.endswith(".csv") or mimetype in ("text/csv", "application/csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")) or mimetype in ("application/x-ndjson", "application/jsonl",
+                                                            "application/x-jsonlines"):
+        return "jsonl"
+    return None
+
+
+def parse_row(row):
+    """(task_name, description, estimated_time, priority) from one parsed
+    row, or ValueError with a message fit to show the user."""
+    task_name, estimated_time, priority = parse_task_fields(
+        _text(row.get("task_name")), _text(row.get("estimated_time")), _text(row.get("priority")))
+    if estimated_time > MAX_INTEGER:
+        raise ValueError("Estimated time is too large.")
+    if abs(priority) > MAX_INTEGER:
+        raise ValueError("Priority is too large.")
+    return task_name, _text(row.get("description")) or "", estimated_time, priority
+
+
+def import_rows(records, write, batch_size=BATCH_SIZE, max_errors=MAX_ERRORS):
+    """Validate (line number, row) records and hand the good rows to
+    write(rows) in batches; write commits them and returns the count.
+
+    Returns a report dict: imported, failed, errors (the first max_errors
+    {"line", "error"} entries), seconds and rows_per_second.
+    """
+    start = time.perf_counter()
+    report = {"imported": 0, "failed": 0, "errors": []}
+
+    def fail(line, message):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"line": line, "error": message})
+
+    def flush(batch, lines):
+        try:
+            report["imported"] += write(batch)
+        except (sqlite3.Error, OverflowError) as e:
+            for line in lines:
+                fail(line, f"Not saved: {e}")
+
+    batch, lines = [], []
+    for line, row in records:
+        if isinstance(row, str):
+            fail(line, row)
+            continue
+        try:
+            batch.append(parse_row(row))
+        except ValueError as e:
+            fail(line, str(e))
+            continue
+        except TypeError:
+            # Not something parse_row anticipated; the row goes, the import goes on
+            fail(line, "Invalid row.")
+            continue
+        lines.append(line)
+        if len(batch) >= batch_size:
+            flush(batch, lines)
+            batch, lines = [], []
+    if batch:
+        flush(batch, lines)
+
+    elapsed = time.perf_counter() - start
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round((report["imported"] + report["failed"]) / elapsed) if elapsed else 0
+    return report
+
+
+def import_stream(binary, fmt, write, batch_size=BATCH_SIZE, max_errors=MAX_ERRORS):
+    """import_rows over a binary file-like object in `fmt` (UTF-8, with or
+    without a BOM)."""
+    text = io.TextIOWrapper(binary, encoding="utf-8-sig", errors="replace", newline="")
+    try:
+        return import_rows(READERS[fmt](text), write, batch_size, max_errors)
+    finally:
+        text.detach()  # the caller owns (and closes) the underlying stream
+
+
+def _user_id(directory_path, user):
+    connection = sqlite3.connect(directory_path)
+    try:
+        row = connection.execute("SELECT id FROM users WHERE username = ? OR email = ?", (user, user)).fetchone()
+    finally:
+        connection.close()
+    return row[0] if row else None
+
+
+if __name__ == '__main__':
+    from config import Config
+    from shards import store_for
+
+    parser = argparse.ArgumentParser(description="Import tasks for one user from CSV or JSON lines.")
+    parser.add_argument("file", help="file to read, or - for stdin")
+    parser.add_argument("--user", required=True, help="username or email of the owner")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=Config.IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or guess_format(args.file)
+    if fmt is None:
+        parser.error("can't tell the format from the file name; pass --format")
+    user_id = _user_id(Config.DB_PATH, args.user)
+    if user_id is None:
+        parser.error(f"no user {args.user!r}")
+
+    path, _archive_path = store_for(user_id, Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT)
+    connection = sqlite3.connect(path, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    connection.execute("PRAGMA synchronous=NORMAL")
+
+    def write(rows):
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            created = create_tasks(connection.cursor(), user_id, rows)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return created
+
+    source = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+    try:
+        report = import_stream(source, fmt, write, batch_size=args.batch_size)
+    finally:
+        source.close()
+        connection.close()
+
+    for error in report["errors"]:
+        print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+    if report["failed"] > len(report["errors"]):
+        print(f"... and {report['failed'] - len(report['errors'])} more", file=sys.stderr)
+    print(f"Imported {report['imported']} tasks ({report['failed']} rows failed) in {report['seconds']:.1f}s, "
+          f"{report['rows_per_second']} rows/s.")
+    sys.exit(1 if report["failed"] else 0)
@@ -1,81 +1,328 @@
 import sqlite3
 import os
+import sys
 
-def create_tables():
-    # Use environment variable for DB path or fallback to local
-    connection = sqlite3.connect(os.getenv("DB_PATH", "taskcrafter.db"))
-    cursor = connection.cursor()
+from analytics import SERIES_SQL
+from estimates import STATS_SQL as ESTIMATE_STATS_SQL
+from search import index_statements
+
+# Numbered schema migrations. PRAGMA user_version records the last one
+# applied, so each runs exactly once per database file. Never edit a
+# migration that has shipped -- append a new one instead.
+MIGRATIONS = [
+    (1, "base tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            task_name TEXT NOT NULL,
+            description TEXT,
+            estimated_time INTEGER NOT NULL,
+            priority INTEGER DEFAULT 1,
+            is_completed INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            start_time TEXT,
+            is_paused INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS task_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            actual_time INTEGER NOT NULL,
+            completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            tasks_completed INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id, date)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS completed_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            task_name TEXT NOT NULL,
+            description TEXT,
+            estimated_time INTEGER NOT NULL,
+            actual_time INTEGER,
+            start_time TEXT,
+            created_at TEXT,
+            completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+    ]),
+    (2, "indexes for per-user hot queries", [
+        # dashboard: WHERE user_id = ? ORDER BY id DESC
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user ON tasks(user_id, id)",
+        # optimize_tasks: WHERE user_id = ? AND is_completed = 0
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_open ON tasks(user_id, is_completed, estimated_time, priority)",
+        # view_completed_tasks: WHERE user_id = ? AND completed_at >= ? ORDER BY completed_at DESC
+        "CREATE INDEX IF NOT EXISTS idx_completed_user_time ON completed_tasks(user_id, completed_at)",
+        # productivity: COUNT/SUM over one user's history, answered from the index alone
+        "CREATE INDEX IF NOT EXISTS idx_completed_user_totals ON completed_tasks(user_id, estimated_time, actual_time)",
+        # users(email) and user_stats(user_id, date) are already covered by
+        # their UNIQUE constraints' automatic indexes.
+    ]),
+    (3, "per-user productivity aggregates", [
+        '''
+        CREATE TABLE IF NOT EXISTS user_aggregates (
+            user_id INTEGER PRIMARY KEY,
+            active_count INTEGER NOT NULL DEFAULT 0,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            total_estimated INTEGER NOT NULL DEFAULT 0,
+            total_actual INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO user_aggregates
+            (user_id, active_count, completed_count, total_estimated, total_actual)
+        SELECT u.id,
+               (SELECT COUNT(*) FROM tasks t WHERE t.user_id = u.id),
+               (SELECT COUNT(*) FROM completed_tasks c WHERE c.user_id = u.id),
+               (SELECT COALESCE(SUM(estimated_time), 0) FROM completed_tasks c WHERE c.user_id = u.id),
+               (SELECT COALESCE(SUM(actual_time), 0) FROM completed_tasks c WHERE c.user_id = u.id)
+        FROM users u
+        ''',
+        # productivity reads user_aggregates now; the covering index only cost writes
+        "DROP INDEX IF EXISTS idx_completed_user_totals",
+    ]),
+    (4, "streak and best day in user_aggregates", [
+        "ALTER TABLE user_aggregates ADD COLUMN current_streak INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_aggregates ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_aggregates ADD COLUMN last_active_date TEXT",
+        "ALTER TABLE user_aggregates ADD COLUMN best_day TEXT",
+        "ALTER TABLE user_aggregates ADD COLUMN best_day_count INTEGER NOT NULL DEFAULT 0",
+        "INSERT OR IGNORE INTO user_aggregates (user_id) SELECT id FROM users",
+        '''
+        WITH active AS (
+            SELECT user_id, date,
+                   julianday(date) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY date) AS run
+            FROM user_stats WHERE tasks_completed > 0
+        ),
+        runs AS (
+            SELECT user_id, COUNT(*) AS length, MAX(date) AS end_date
+            FROM active GROUP BY user_id, run
+        ),
+        latest AS (
+            SELECT user_id, MAX(length) AS longest_streak, MAX(end_date) AS last_active_date
+            FROM runs GROUP BY user_id
+        ),
+        ranked AS (
+            SELECT user_id, date, tasks_completed,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY tasks_completed DESC, date ASC) AS rank
+            FROM user_stats WHERE tasks_completed > 0
+        ),
+        streaks AS (
+            SELECT l.user_id, r.length AS current_streak, l.longest_streak, l.last_active_date,
+                   b.date AS best_day, b.tasks_completed AS best_day_count
+            FROM latest l
+            JOIN runs r ON r.user_id = l.user_id AND r.end_date = l.last_active_date
+            JOIN ranked b ON b.user_id = l.user_id AND b.rank = 1
+        )
+        UPDATE user_aggregates
+        SET current_streak = s.current_streak,
+            longest_streak = s.longest_streak,
+            last_active_date = s.last_active_date,
+            best_day = s.best_day,
+            best_day_count = s.best_day_count
+        FROM streaks s
+        WHERE s.user_id = user_aggregates.user_id
+        ''',
+    ]),
+    (5, "integer UTC epoch timestamps next to the TEXT columns", [
+        "ALTER TABLE users ADD COLUMN created_ts INTEGER",
+        "ALTER TABLE tasks ADD COLUMN created_ts INTEGER",
+        "ALTER TABLE tasks ADD COLUMN start_ts INTEGER",
+        "ALTER TABLE completed_tasks ADD COLUMN created_ts INTEGER",
+        "ALTER TABLE completed_tasks ADD COLUMN start_ts INTEGER",
+        "ALTER TABLE completed_tasks ADD COLUMN completed_ts INTEGER",
+        "UPDATE users SET created_ts = CAST(strftime('%s', created_at) AS INTEGER)",
+        "UPDATE tasks SET created_ts = CAST(strftime('%s', created_at) AS INTEGER), "
+        "start_ts = CAST(strftime('%s', start_time) AS INTEGER)",
+        "UPDATE completed_tasks SET created_ts = CAST(strftime('%s', created_at) AS INTEGER), "
+        "start_ts = CAST(strftime('%s', start_time) AS INTEGER), "
+        "completed_ts = CAST(strftime('%s', completed_at) AS INTEGER)",
+        # view_completed_tasks filters and pages on completed_ts now
+        "CREATE INDEX IF NOT EXISTS idx_completed_user_ts ON completed_tasks(user_id, completed_ts)",
+        "DROP INDEX IF EXISTS idx_completed_user_time",
+    ]),
+    (6, "per-user data version for page caching", [
+        "ALTER TABLE user_aggregates ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE user_aggregates ADD COLUMN data_updated_ts INTEGER",
+    ]),
+    (7, "per-user daily rollups of archived completed tasks", [
+        # Totals for the rows archive.py moved out of completed_tasks, by
+        # UTC day of completed_ts
+        '''
+        CREATE TABLE IF NOT EXISTS completed_rollups (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            completed_count INTEGER NOT NULL DEFAULT 0,
+            total_estimated INTEGER NOT NULL DEFAULT 0,
+            total_actual INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, date),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (8, "pause-aware task timing", [
+        # Append-only timer log. elapsed_seconds is the task's worked time
+        # right after the event; completing a task collapses its events to
+        # the one 'complete' row.
+        '''
+        CREATE TABLE IF NOT EXISTS task_time_events (
+            id INTEGER PRIMARY KEY,
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            event TEXT NOT NULL CHECK (event IN ('start', 'pause', 'resume', 'complete')),
+            ts INTEGER NOT NULL,
+            elapsed_seconds INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_time_events_task ON task_time_events(task_id)",
+        # Worked time is accumulated_seconds plus, while running, now - last_resumed_at
+        "ALTER TABLE tasks ADD COLUMN accumulated_seconds INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE tasks ADD COLUMN last_resumed_at INTEGER",
+        "UPDATE tasks SET last_resumed_at = start_ts WHERE start_ts IS NOT NULL AND is_paused = 0",
+        # When a paused task was paused was never stored: count it as paused
+        # now, which is what completing it would have counted up to here
+        "UPDATE tasks SET accumulated_seconds = MAX(0, CAST(strftime('%s', 'now') AS INTEGER) - start_ts) "
+        "WHERE start_ts IS NOT NULL AND is_paused = 1",
+        "INSERT INTO task_time_events (task_id, user_id, event, ts) "
+        "SELECT id, user_id, 'start', start_ts FROM tasks WHERE start_ts IS NOT NULL",
+    ]),
+    (9, "full-text search indexes", [
+        # FTS5 indexes over task names and descriptions, kept in sync by
+        # triggers (see search.py), then filled from the existing rows
+        *index_statements("tasks"),
+        *index_statements("completed_tasks"),
+        "INSERT INTO tasks_search(tasks_search) VALUES ('rebuild')",
+        "INSERT INTO completed_tasks_search(completed_tasks_search) VALUES ('rebuild')",
+    ]),
+    (10, "per-user actual/estimate statistics by task size", [
+        # Running count, mean and M2 of actual_time / estimated_time (see
+        # estimates.py); filled from the hot rows, estimates.py adds the archive
+        '''
+        CREATE TABLE IF NOT EXISTS user_estimate_stats (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            mean REAL NOT NULL DEFAULT 0,
+            m2 REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, bucket),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+        ''',
+        "INSERT INTO user_estimate_stats (user_id, bucket, n, mean, m2) "
+        + ESTIMATE_STATS_SQL.format(source="completed_tasks"),
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
 
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL UNIQUE,
-        email TEXT NOT NULL UNIQUE,
-        password TEXT NOT NULL,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
+# Query shapes that must be answered with an index SEARCH, never a full SCAN.
+HOT_QUERIES = {
+    "dashboard": ("SELECT id, task_name, description, estimated_time, priority, is_completed, start_ts, is_paused, "
+                  "created_ts, accumulated_seconds, last_resumed_at FROM tasks WHERE user_id = ? ORDER BY id DESC",
+                  (1,)),
+    "optimize_tasks": ("SELECT id, task_name, estimated_time, priority FROM tasks "
+                       "WHERE user_id = ? AND is_completed = 0 ORDER BY estimated_time, priority, id", (1,)),
+    "view_completed_tasks": ("SELECT id, task_name, estimated_time, actual_time, completed_ts "
+                             "FROM completed_tasks WHERE user_id = ? AND completed_ts >= ? "
+                             "AND (completed_ts, id) < (?, ?) ORDER BY completed_ts DESC, id DESC LIMIT ?",
+                             (1, 1735689600, 1738368000, 1, 50)),
+    "productivity": ("SELECT u.username, a.active_count, a.completed_count, a.total_estimated, a.total_actual "
+                     "FROM users u LEFT JOIN user_aggregates a ON a.user_id = u.id WHERE u.id = ?", (1,)),
+    "login": ("SELECT * FROM users WHERE username = ? OR email = ?", ("a", "a")),
+    "productivity_trends": (SERIES_SQL, (1, "2025-01-01", 1, 1735689600, 1, "2025-01-01")),
+    "estimate_stats": ("SELECT bucket, n, mean, m2 FROM user_estimate_stats WHERE user_id = ?", (1,)),
+    "best_day": ("SELECT date, tasks_completed FROM user_stats WHERE user_id = ? AND tasks_completed > 0 "
+                 "ORDER BY tasks_completed DESC, date ASC LIMIT 1", (1,)),
+}
 
-    cursor.execute('''
-CREATE TABLE IF NOT EXISTS tasks (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    task_name TEXT NOT NULL,
-    description TEXT,
-    estimated_time INTEGER NOT NULL,
-    priority INTEGER DEFAULT 1,
-    is_completed INTEGER DEFAULT 0,
-    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    start_time TEXT,
-    is_paused INTEGER DEFAULT 0,
-    FOREIGN KEY (user_id) REFERENCES users (id)
-)
-''')
 
-    # Create task_logs table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS task_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        task_id INTEGER NOT NULL,
-        actual_time INTEGER NOT NULL,
-        completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (task_id) REFERENCES tasks(id)
-    )
-    ''')
+def migrate(connection):
+    """Apply every migration newer than the file's user_version.
+    Returns the list of versions that were applied."""
+    current = connection.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+    for version, _name, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        connection.execute("BEGIN")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        applied.append(version)
+    return applied
 
-    # Create user_stats table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS user_stats (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        date TEXT NOT NULL,
-        tasks_completed INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        UNIQUE(user_id, date)
-    )
-    ''')
 
-    # Create completed_tasks table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS completed_tasks (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    task_name TEXT NOT NULL,
-    description TEXT,
-    estimated_time INTEGER NOT NULL,
-    actual_time INTEGER,
-    start_time TEXT,  -- ✅ added column
-    created_at TEXT,
-    completed_at TEXT DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id)
-)
-''')
+def check_query_plans(connection):
+    """Return {query_name: plan_detail} for every hot query whose plan
+    falls back to a table scan. An empty dict means all plans are good."""
+    offenders = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = connection.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        for row in plan:
+            detail = row[3]
+            # Scanning a subquery's own rows is fine; its tables are checked on their own lines
+            if detail.startswith("SCAN ") and not detail.startswith("SCAN (subquery"):
+                offenders[name] = detail
+                break
+    return offenders
 
 
-    connection.commit()
+def create_tables(path=None):
+    # Use environment variable for DB path or fallback to local
+    connection = sqlite3.connect(path or os.getenv("DB_PATH", "taskcrafter.db"), isolation_level=None)
+    applied = migrate(connection)
     connection.close()
-    print("All tables created successfully!")
+    if applied:
+        print(f"Applied migrations {applied}; schema at version {SCHEMA_VERSION}.")
+    else:
+        print(f"Schema up to date (version {SCHEMA_VERSION}).")
+
 
 if __name__ == '__main__':
-    create_tables()
+    from config import Config
+    from shards import shard_stores
+
+    shards = [path for path, _archive_path in shard_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH,
+                                                           Config.SHARD_COUNT)]
+    for path in [Config.DB_PATH, *shards]:
+        create_tables(path)
+    if "--check-plans" in sys.argv[1:]:
+        offenders = {}
+        for path in [Config.DB_PATH, *shards]:
+            connection = sqlite3.connect(path)
+            offenders.update(check_query_plans(connection))
+            connection.close()
+        for name, detail in offenders.items():
+            print(f"FAIL {name}: {detail}")
+        if offenders:
+            sys.exit(1)
+        print("All hot queries use an index.")
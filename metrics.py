@@ -0,0 +1,167 @@
+"""Request, SQL and template timings, exposed on /metrics for Prometheus.
+
+init_app connects to Flask's signals to time each request and each template
+render; record_query is the pool's on_query hook (see db.py) and times each
+statement against the route running it. Everything is kept per process, so
+with several gunicorn workers each one reports its own numbers and
+Prometheus should scrape them all or sum across instances.
+
+/metrics (and /cache_stats) answer 404 unless METRICS_TOKEN is set and
+the scraper sends it as "Authorization: Bearer <token>".
+
+SLOW_QUERY_MS > 0 also logs every statement slower than that through the
+app logger.
+
+taskcrafter_startup_seconds is the time from importing app.py to the end of
+the process's first response -- the cold start a scale-to-zero instance
+makes its first visitor wait through.
+"""
+
+import threading
+import time
+
+from flask import before_render_template, current_app, g, has_request_context, request, \
+    request_finished, request_started, template_rendered
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; from sub-millisecond index lookups up to slow exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """A Prometheus histogram with one label."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-2]}')
+            lines.append(f"{self.name}_sum{{{label}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{label}}} {values[-2]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "taskcrafter_request_duration_seconds", "Time from request start to response, by endpoint.", "endpoint")
+SQL_SECONDS = Histogram(
+    "taskcrafter_sql_query_duration_seconds", "Time spent in each SQL statement, by endpoint.", "endpoint")
+SQL_PER_REQUEST = Histogram(
+    "taskcrafter_sql_queries_per_request", "SQL statements run per request, by endpoint.", "endpoint",
+    buckets=QUERY_COUNT_BUCKETS)
+TEMPLATE_SECONDS = Histogram(
+    "taskcrafter_template_render_seconds", "Jinja render time, by template.", "template")
+
+HISTOGRAMS = (REQUEST_SECONDS, SQL_SECONDS, SQL_PER_REQUEST, TEMPLATE_SECONDS)
+
+# perf_counter() when app.py was imported, and the seconds from then to the
+# first response once there has been one
+_startup = {"started": None, "seconds": None}
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "none"
+
+
+def record_query(sql, seconds):
+    """on_query hook for the connection pool."""
+    endpoint = _endpoint()
+    SQL_SECONDS.observe(endpoint, seconds)
+    if has_request_context():
+        g.sql_queries = g.get("sql_queries", 0) + 1
+
+    slow_ms = current_app.config["SLOW_QUERY_MS"]
+    if slow_ms and seconds * 1000 >= slow_ms:
+        current_app.logger.warning("Slow query (%.1f ms) on %s: %s",
+                                   seconds * 1000, endpoint, " ".join(sql.split()))
+
+
+def _request_started(sender, **extra):
+    g.request_start = time.perf_counter()
+    g.sql_queries = 0
+
+
+def _request_finished(sender, response, **extra):
+    start = g.get("request_start")
+    if start is None:
+        return
+    endpoint = _endpoint()
+    finished = time.perf_counter()
+    REQUEST_SECONDS.observe(endpoint, finished - start)
+    SQL_PER_REQUEST.observe(endpoint, g.get("sql_queries", 0))
+    if _startup["seconds"] is None and _startup["started"] is not None:
+        _startup["seconds"] = finished - _startup["started"]
+        current_app.logger.info("First response %.0f ms after import", _startup["seconds"] * 1000)
+
+
+def _before_render(sender, template, context, **extra):
+    g.setdefault("render_starts", []).append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    starts = g.get("render_starts")
+    if starts:
+        TEMPLATE_SECONDS.observe(template.name or "<string>", time.perf_counter() - starts.pop())
+
+
+def init_app(app, started=None):
+    """Time requests and template renders for `app`. `started` is the
+    perf_counter() reading taken when the app module was imported."""
+    _startup["started"] = started
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+
+def render(page_cache_stats=None):
+    """All metrics in the Prometheus text format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.expose()
+    if _startup["seconds"] is not None:
+        lines += ["# HELP taskcrafter_startup_seconds Time from importing the app to its first response.",
+                  "# TYPE taskcrafter_startup_seconds gauge",
+                  f"taskcrafter_startup_seconds {_startup['seconds']}"]
+    if page_cache_stats is not None:
+        for key in ("hits", "misses", "evictions"):
+            name = f"taskcrafter_page_cache_{key}_total"
+            lines += [f"# HELP {name} Page cache {key} in this process.",
+                      f"# TYPE {name} counter",
+                      f"{name} {page_cache_stats[key]}"]
+        for key in ("entries", "bytes", "max_bytes"):
+            name = f"taskcrafter_page_cache_{key}"
+            lines += [f"# HELP {name} Page cache {key.replace('_', ' ')} in this process.",
+                      f"# TYPE {name} gauge",
+                      f"{name} {page_cache_stats[key]}"]
+    return "\n".join(lines) + "\n"
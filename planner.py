@@ -0,0 +1,160 @@
+"""Multi-day plans for /plan_days.
+
+Given the user's open tasks and the minutes available on each of the next
+few days, assign every task to a day. Tasks are taken in priority order
+(lower priority number first) and, within a priority, longest first -- the
+"decreasing" part of first-fit/best-fit decreasing:
+
+    first_fit -- earliest day with room, so important work lands early
+    best_fit  -- the day the task fills most tightly, which packs better
+                 but lets important tasks drift to later days
+
+Both run in O(n log d) for n tasks over d days (a max segment tree over the
+days' free minutes for first-fit, a sorted free list for best-fit), and
+stop as soon as no day has room for the shortest task left. A few hundred
+tasks plan in about a millisecond; at the 31-day limit a plain scan of the
+days is no slower, so the tree only earns its keep if the horizon grows.
+
+Tasks longer than any day never fit and are reported as unplaced. The plan
+comes with lower bounds any plan must respect, so the report can say how
+far from optimal it could be.
+"""
+
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+METHODS = ("first_fit", "best_fit")
+
+Plan = namedtuple("Plan", "days unplaced used_minutes report")
+
+
+def plan_order(tasks):
+    """Tasks in placement order: priority first, then longest first."""
+    return sorted(tasks, key=lambda task: ((task[3] or 0), -task[2], task[0]))
+
+
+class _MaxTree:
+    """Free minutes per day, answering "earliest day with at least w free"."""
+
+    def __init__(self, values):
+        self.size = 1
+        while self.size < len(values):
+            self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        self.tree[self.size:self.size + len(values)] = values
+        for i in range(self.size - 1, 0, -1):
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+
+    def first_at_least(self, minutes):
+        if self.tree[1] < minutes:
+            return None
+        i = 1
+        while i < self.size:
+            i = 2 * i if self.tree[2 * i] >= minutes else 2 * i + 1
+        return i - self.size
+
+    def take(self, day, minutes):
+        i = day + self.size
+        self.tree[i] -= minutes
+        i //= 2
+        while i:
+            self.tree[i] = max(self.tree[2 * i], self.tree[2 * i + 1])
+            i //= 2
+
+
+def _suffix_min(weights):
+    """suffix[i] = shortest task from i on: once no day has that much
+    room, nothing after i can be placed."""
+    suffix = list(weights)
+    for i in range(len(suffix) - 2, -1, -1):
+        if suffix[i + 1] < suffix[i]:
+            suffix[i] = suffix[i + 1]
+    return suffix
+
+
+def _first_fit(weights, capacities):
+    tree = _MaxTree(list(capacities))
+    shortest_left = _suffix_min(weights)
+    placement = [None] * len(weights)
+    for i, w in enumerate(weights):
+        if tree.tree[1] < shortest_left[i]:
+            break
+        day = tree.first_at_least(w)
+        if day is not None:
+            tree.take(day, w)
+            placement[i] = day
+    return placement
+
+
+def _best_fit(weights, capacities):
+    # (free minutes, day): the first entry with enough room is the tightest,
+    # earliest day breaking ties
+    free = sorted((cap, day) for day, cap in enumerate(capacities))
+    shortest_left = _suffix_min(weights)
+    placement = [None] * len(weights)
+    for i, w in enumerate(weights):
+        if free[-1][0] < shortest_left[i]:
+            break
+        j = bisect_left(free, (w, -1))
+        if j == len(free):
+            continue
+        cap, day = free.pop(j)
+        insort(free, (cap - w, day))
+        placement[i] = day
+    return placement
+
+
+def lower_bounds(weights, capacities, placed_minutes):
+    """Bounds that hold for every plan.
+
+    min_unplaced_minutes -- tasks longer than the longest day, plus any
+        minutes beyond the total capacity
+    min_days -- the fewest leading days whose capacity adds up to the
+        minutes this plan placed; no plan placing as much finishes sooner
+    """
+    longest_day = max(capacities, default=0)
+    too_long = sum(w for w in weights if w > longest_day)
+    placeable = sum(weights) - too_long
+    min_unplaced = too_long + max(0, placeable - sum(capacities))
+
+    min_days, running = 0, 0
+    for cap in capacities:
+        if running >= placed_minutes:
+            break
+        running += cap
+        min_days += 1
+    return min_unplaced, min_days
+
+
+def plan_days(tasks, capacities, method="first_fit"):
+    """Assign (id, name, estimated_time, priority) tasks to days.
+
+    capacities[i] is the minutes free on day i. Returns a Plan whose `days`
+    holds each day's tasks in placement order.
+    """
+    ordered = [task for task in plan_order(tasks) if task[2] > 0]
+    weights = [task[2] for task in ordered]
+    placement = (_best_fit if method == "best_fit" else _first_fit)(weights, capacities)
+
+    days = [[] for _ in capacities]
+    unplaced = []
+    for task, day in zip(ordered, placement):
+        (unplaced if day is None else days[day]).append(task)
+
+    used = [sum(task[2] for task in day_tasks) for day_tasks in days]
+    placed_minutes = sum(used)
+    min_unplaced, min_days = lower_bounds(weights, capacities, placed_minutes)
+    days_used = max((i + 1 for i, day_tasks in enumerate(days) if day_tasks), default=0)
+    unplaced_minutes = sum(task[2] for task in unplaced)
+    report = {
+        "method": method,
+        "placed_minutes": placed_minutes,
+        "capacity_minutes": sum(capacities),
+        "unplaced_minutes": unplaced_minutes,
+        "min_unplaced_minutes": min_unplaced,
+        "days_used": days_used,
+        "min_days": min_days,
+        # True when no plan could leave fewer minutes out or finish sooner
+        "optimal": unplaced_minutes == min_unplaced and days_used == min_days,
+    }
+    return Plan(days=days, unplaced=unplaced, used_minutes=used, report=report)
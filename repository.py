@@ -0,0 +1,571 @@
+"""Task and stats storage behind one interface, with two backends.
+
+The views read through a repository instead of running SQL themselves:
+
+    repo = SQLiteRepository(get_db_connection().cursor())
+    tasks = repo.list_tasks(user_id)
+
+SQLiteRepository is what the app runs on. Its statements are constant
+strings with narrow column lists, so each one is prepared once per pooled
+connection and then reused from sqlite3's statement cache. Its writes are
+the task_actions functions.
+
+The app builds its repository from the REPOSITORY setting, a callable
+taking the connection's cursor (SQLiteRepository by default). Every task
+read and write in the routes goes through it, and writes go through
+run_write, so they commit (or group-commit) as before. That makes a
+wrapping or instrumented SQLite repository a config change. The page
+cache, search, exports, the trend charts and login still read the
+SQLite file directly, so MemoryRepository isn't a backend the app can be
+served from.
+
+MemoryRepository keeps the same data in dicts, with a sorted list of ids
+(or (completed_ts, id) keys) per user standing in for the indexes. It has
+the same methods, writes included, and follows the same rules for the
+aggregates, user_stats days and streaks, so scheduling, planning and stats
+code can be exercised and benchmarked without a database file.
+
+Search, exports and the trend charts are SQL-specific (FTS5, streaming
+cursors, one grouped query) and stay in their own modules.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime
+from math import ceil
+
+import aggregates
+import estimates
+import task_actions
+from timecodec import now_epoch, to_text
+
+TASK_FIELDS = tuple(column.strip() for column in task_actions.TASK_COLUMNS.split(","))
+
+COMPLETED_FIELDS = ("id", "task_name", "estimated_time", "actual_time", "completed_ts")
+
+TIME_FILTER_SQL = {
+    'before': "AND actual_time < estimated_time",
+    'on': "AND actual_time = estimated_time",
+    'after': "AND actual_time > estimated_time",
+}
+
+
+def completed_filter_sql(since_ts=None, until_ts=None, time_filter=None):
+    """SQL predicates and params for a completed_ts range [since_ts, until_ts)
+    and a time filter ('before', 'on' or 'after' the estimate). The range
+    is on completed_ts so idx_completed_user_ts applies."""
+    sql, params = [], []
+    if since_ts is not None:
+        sql.append("AND completed_ts >= ?")
+        params.append(since_ts)
+    if until_ts is not None:
+        sql.append("AND completed_ts < ?")
+        params.append(until_ts)
+    if time_filter in TIME_FILTER_SQL:
+        sql.append(TIME_FILTER_SQL[time_filter])
+    return " ".join(sql), params
+
+
+class TaskRepository(ABC):
+    """What the views need from storage. Reads return dicts (or tuples for
+    schedulable_tasks, which the scheduler indexes) and None when there is
+    nothing for that user; writes match the task_actions functions without
+    the cursor."""
+
+    @abstractmethod
+    def add_user(self, username, email, password, created_ts=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def user_info(self, user_id):
+        """username, email and created_ts."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_tasks(self, user_id):
+        """Active tasks (TASK_FIELDS), newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_task(self, user_id, task_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def schedulable_tasks(self, user_id):
+        """(id, task_name, estimated_time, priority) of every unfinished
+        task, shortest first (then by priority and id)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def completed_page(self, user_id, since_ts=None, until_ts=None, time_filter=None, before=None, limit=50):
+        """Up to `limit` completed tasks (COMPLETED_FIELDS), newest first,
+        after the (completed_ts, id) key `before` if given."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def totals(self, user_id):
+        """username plus the active/completed counts and minute totals."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def streak_stats(self, user_id):
+        """current_streak, last_active_date, best_day and best_day_count."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def counters(self, user_id):
+        """aggregates.read_counters for this user."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def estimate_stats(self, user_id):
+        """{size bucket: (n, mean, m2)} of actual/estimated ratios, as
+        estimates.read_stats returns them."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_task(self, user_id, task_name, description, estimated_time, priority):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_tasks(self, user_id, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_task(self, user_id, task_id, task_name, estimated_time, priority):
+        raise NotImplementedError
+
+    @abstractmethod
+    def start_tasks(self, user_id, task_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def pause_tasks(self, user_id, task_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def resume_tasks(self, user_id, task_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_tasks(self, user_id, task_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete_tasks(self, user_id, task_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def uncomplete_task(self, user_id, completed_id):
+        raise NotImplementedError
+
+
+class SQLiteRepository(TaskRepository):
+    """Reads and writes on one cursor; the caller owns the transaction."""
+
+    USER_INFO_SQL = "SELECT username, email, created_ts FROM users WHERE id = ?"
+    LIST_TASKS_SQL = f"SELECT {task_actions.TASK_COLUMNS} FROM tasks WHERE user_id = ? ORDER BY id DESC"
+    # idx_tasks_user_open already returns this order; no sort step
+    SCHEDULABLE_SQL = ("SELECT id, task_name, estimated_time, priority FROM tasks "
+                       "WHERE user_id = ? AND is_completed = 0 ORDER BY estimated_time, priority, id")
+    COMPLETED_SQL = f'''
+        SELECT {", ".join(COMPLETED_FIELDS)}
+        FROM {{table}}
+        WHERE user_id = ? {{filters}} {{keyset}}
+        ORDER BY completed_ts DESC, id DESC
+        LIMIT ?
+    '''
+    TOTALS_SQL = '''
+        SELECT u.username,
+               COALESCE(a.active_count, 0) AS active_count,
+               COALESCE(a.completed_count, 0) AS completed_count,
+               COALESCE(a.total_estimated, 0) AS total_estimated,
+               COALESCE(a.total_actual, 0) AS total_actual
+        FROM users u
+        LEFT JOIN user_aggregates a ON a.user_id = u.id
+        WHERE u.id = ?
+    '''
+    STREAK_SQL = '''
+        SELECT current_streak, last_active_date, best_day, best_day_count
+        FROM user_aggregates WHERE user_id = ?
+    '''
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def _one(self, sql, params):
+        self.cur.execute(sql, params)
+        row = self.cur.fetchone()
+        return dict(row) if row is not None else None
+
+    def add_user(self, username, email, password, created_ts=None):
+        created_ts = now_epoch() if created_ts is None else created_ts
+        self.cur.execute("INSERT INTO users (username, email, password, created_at, created_ts) VALUES (?, ?, ?, ?, ?)",
+                         (username, email, password, to_text(created_ts), created_ts))
+        return self.cur.lastrowid
+
+    def user_info(self, user_id):
+        return self._one(self.USER_INFO_SQL, (user_id,))
+
+    def list_tasks(self, user_id):
+        self.cur.execute(self.LIST_TASKS_SQL, (user_id,))
+        return [dict(row) for row in self.cur.fetchall()]
+
+    def get_task(self, user_id, task_id):
+        task = task_actions.get_task(self.cur, user_id, task_id)
+        return dict(task) if task is not None else None
+
+    def schedulable_tasks(self, user_id):
+        self.cur.execute(self.SCHEDULABLE_SQL, (user_id,))
+        return [tuple(row) for row in self.cur.fetchall()]
+
+    def completed_page(self, user_id, since_ts=None, until_ts=None, time_filter=None, before=None, limit=50):
+        filters, params = completed_filter_sql(since_ts, until_ts, time_filter)
+        params.insert(0, user_id)
+        keyset = ""
+        if before is not None:
+            keyset = "AND (completed_ts, id) < (?, ?)"
+            params += list(before)
+        page_sql = self.COMPLETED_SQL.format(table="{table}", filters=filters, keyset=keyset)
+
+        self.cur.execute(page_sql.format(table="main.completed_tasks"), params + [limit])
+        rows = self.cur.fetchall()
+        # Archived rows (see archive.py) are all older than the hot ones and
+        # continue the same order, so they are only read once the hot rows run out
+        if len(rows) < limit:
+            self.cur.execute(page_sql.format(table="archive.completed_tasks"), params + [limit - len(rows)])
+            rows += self.cur.fetchall()
+        return [dict(row) for row in rows]
+
+    def totals(self, user_id):
+        # The totals already include archived tasks, which reconcile checks via completed_rollups
+        return self._one(self.TOTALS_SQL, (user_id,))
+
+    def streak_stats(self, user_id):
+        return self._one(self.STREAK_SQL, (user_id,))
+
+    def counters(self, user_id):
+        return aggregates.read_counters(self.cur, user_id)
+
+    def estimate_stats(self, user_id):
+        return estimates.read_stats(self.cur, user_id)
+
+    def create_task(self, *args):
+        return task_actions.create_task(self.cur, *args)
+
+    def create_tasks(self, *args):
+        return task_actions.create_tasks(self.cur, *args)
+
+    def update_task(self, *args):
+        return task_actions.update_task(self.cur, *args)
+
+    def start_tasks(self, *args):
+        return task_actions.start_tasks(self.cur, *args)
+
+    def pause_tasks(self, *args):
+        return task_actions.pause_tasks(self.cur, *args)
+
+    def resume_tasks(self, *args):
+        return task_actions.resume_tasks(self.cur, *args)
+
+    def delete_tasks(self, *args):
+        return task_actions.delete_tasks(self.cur, *args)
+
+    def complete_tasks(self, *args):
+        return task_actions.complete_tasks(self.cur, *args)
+
+    def uncomplete_task(self, *args):
+        return task_actions.uncomplete_task(self.cur, *args)
+
+
+class MemoryRepository(TaskRepository):
+    """Everything in dicts, for tests and benchmarks. Writes take a lock;
+    there are no transactions, archive or search index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._tasks = {}
+        self._completed = {}
+        self._task_ids = {}       # user_id -> sorted task ids
+        self._completed_keys = {}  # user_id -> sorted (completed_ts, id)
+        self._days = {}           # user_id -> {YYYY-MM-DD: tasks_completed}, i.e. user_stats
+        self._aggregates = {}
+        self._events = {}         # task_id -> [(event, ts, elapsed_seconds)]
+        self._estimates = {}      # user_id -> {bucket: (n, mean, m2)}, i.e. user_estimate_stats
+        self._next_id = {"users": 1, "tasks": 1, "completed": 1}
+
+    def _new_id(self, table):
+        new_id = self._next_id[table]
+        self._next_id[table] += 1
+        return new_id
+
+    def _aggregate(self, user_id):
+        row = self._aggregates.get(user_id)
+        if row is None:
+            row = self._aggregates[user_id] = dict.fromkeys(aggregates.FIELDS, 0)
+            row.update(last_active_date=None, best_day=None, data_version=0, data_updated_ts=None)
+        return row
+
+    def _bump(self, user_id, active=0, completed=0, estimated=0, actual=0):
+        row = self._aggregate(user_id)
+        row['active_count'] += active
+        row['completed_count'] += completed
+        row['total_estimated'] += estimated
+        row['total_actual'] += actual
+
+    def _bump_version(self, user_id):
+        row = self._aggregate(user_id)
+        row['data_version'] += 1
+        row['data_updated_ts'] = now_epoch()
+
+    def _recompute_streaks(self, user_id):
+        values = aggregates.streak_fields(self._days.get(user_id, {}))
+        self._aggregate(user_id).update(zip(aggregates.STREAK_FIELDS, values))
+
+    def _owned(self, user_id, task_ids):
+        return [self._tasks[task_id] for task_id in sorted(set(task_ids))
+                if task_id in self._tasks and self._tasks[task_id]['user_id'] == user_id]
+
+    def _insert_task(self, row):
+        row['id'] = self._new_id("tasks")
+        self._tasks[row['id']] = row
+        insort(self._task_ids.setdefault(row['user_id'], []), row['id'])
+        return row['id']
+
+    def _remove_task(self, task):
+        del self._tasks[task['id']]
+        ids = self._task_ids[task['user_id']]
+        del ids[bisect_left(ids, task['id'])]
+        self._events.pop(task['id'], None)
+
+    def add_user(self, username, email, password, created_ts=None):
+        with self._lock:
+            user_id = self._new_id("users")
+            created_ts = now_epoch() if created_ts is None else created_ts
+            self._users[user_id] = {"username": username, "email": email, "password": password,
+                                    "created_ts": created_ts}
+            return user_id
+
+    def user_info(self, user_id):
+        user = self._users.get(user_id)
+        return {field: user[field] for field in ("username", "email", "created_ts")} if user else None
+
+    def list_tasks(self, user_id):
+        return [{field: self._tasks[task_id][field] for field in TASK_FIELDS}
+                for task_id in reversed(self._task_ids.get(user_id, []))]
+
+    def get_task(self, user_id, task_id):
+        task = self._tasks.get(task_id)
+        if task is None or task['user_id'] != user_id:
+            return None
+        return {field: task[field] for field in TASK_FIELDS}
+
+    def schedulable_tasks(self, user_id):
+        tasks = [(task['id'], task['task_name'], task['estimated_time'], task['priority'])
+                 for task in map(self._tasks.get, self._task_ids.get(user_id, [])) if not task['is_completed']]
+        return sorted(tasks, key=lambda task: (task[2], task[3], task[0]))
+
+    def completed_page(self, user_id, since_ts=None, until_ts=None, time_filter=None, before=None, limit=50):
+        keys = self._completed_keys.get(user_id, [])
+        end = len(keys)
+        if until_ts is not None:
+            end = bisect_left(keys, (until_ts,))
+        if before is not None:
+            end = min(end, bisect_left(keys, tuple(before)))
+        page = []
+        for i in range(end - 1, -1, -1):
+            if len(page) == limit or (since_ts is not None and keys[i][0] < since_ts):
+                break
+            row = self._completed[keys[i][1]]
+            actual, estimated = row['actual_time'], row['estimated_time']
+            if ((time_filter == 'before' and not actual < estimated)
+                    or (time_filter == 'on' and actual != estimated)
+                    or (time_filter == 'after' and not actual > estimated)):
+                continue
+            page.append({field: row[field] for field in COMPLETED_FIELDS})
+        return page
+
+    def totals(self, user_id):
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        row = self._aggregates.get(user_id) or {}
+        return {"username": user['username'],
+                **{field: row.get(field, 0) for field in aggregates.FIELDS[:4]}}
+
+    def streak_stats(self, user_id):
+        row = self._aggregates.get(user_id)
+        if row is None:
+            return None
+        return {field: row[field] for field in ("current_streak", "last_active_date", "best_day", "best_day_count")}
+
+    def counters(self, user_id):
+        row = self._aggregates.get(user_id)
+        if row is None:
+            return {'active_count': 0, 'completed_count': 0, 'total_estimated': 0, 'total_actual': 0,
+                    'current_streak': 0, 'data_version': 0}
+        today = datetime.now().strftime("%Y-%m-%d")
+        return {
+            **{field: row[field] for field in aggregates.FIELDS[:4]},
+            'current_streak': row['current_streak'] if row['last_active_date'] == today else 0,
+            'data_version': row['data_version'],
+        }
+
+    def estimate_stats(self, user_id):
+        return dict(self._estimates.get(user_id, {}))
+
+    def _record_ratio(self, user_id, estimated_time, actual_time, removed=False):
+        x = estimates.ratio(estimated_time, actual_time)
+        if x is None:
+            return
+        buckets = self._estimates.setdefault(user_id, {})
+        bucket = estimates.size_bucket(estimated_time)
+        stats = buckets.get(bucket, (0, 0.0, 0.0))
+        stats = estimates.remove(stats, x) if removed else estimates.merge(stats, estimates.summarize([x]))
+        if stats[0]:
+            buckets[bucket] = stats
+        else:
+            buckets.pop(bucket, None)
+
+    def create_task(self, user_id, task_name, description, estimated_time, priority):
+        with self._lock:
+            created_ts = now_epoch()
+            task_id = self._insert_task({
+                "user_id": user_id, "task_name": task_name, "description": description,
+                "estimated_time": estimated_time, "priority": priority, "is_completed": 0,
+                "created_at": to_text(created_ts), "created_ts": created_ts, "start_time": None,
+                "start_ts": None, "is_paused": 0, "accumulated_seconds": 0, "last_resumed_at": None,
+            })
+            self._bump(user_id, active=1)
+            self._bump_version(user_id)
+            return task_id
+
+    def create_tasks(self, user_id, rows):
+        with self._lock:
+            created_ts = now_epoch()
+            for task_name, description, estimated_time, priority in rows:
+                self._insert_task({
+                    "user_id": user_id, "task_name": task_name, "description": description,
+                    "estimated_time": estimated_time, "priority": priority, "is_completed": 0,
+                    "created_at": to_text(created_ts), "created_ts": created_ts, "start_time": None,
+                    "start_ts": None, "is_paused": 0, "accumulated_seconds": 0, "last_resumed_at": None,
+                })
+            if rows:
+                self._bump(user_id, active=len(rows))
+                self._bump_version(user_id)
+            return len(rows)
+
+    def _update_tasks(self, user_id, tasks, changes, event=None, ts=None):
+        for task in tasks:
+            task.update(changes(task))
+            if event:
+                self._events.setdefault(task['id'], []).append((event, ts, task['accumulated_seconds']))
+        if tasks:
+            self._bump_version(user_id)
+        return len(tasks)
+
+    def update_task(self, user_id, task_id, task_name, estimated_time, priority):
+        with self._lock:
+            return self._update_tasks(user_id, self._owned(user_id, [task_id]), lambda task: {
+                "task_name": task_name, "estimated_time": estimated_time, "priority": priority})
+
+    def start_tasks(self, user_id, task_ids):
+        with self._lock:
+            ts = now_epoch()
+            unstarted = [task for task in self._owned(user_id, task_ids) if task['start_ts'] is None]
+            return self._update_tasks(user_id, unstarted, lambda task: {
+                "start_time": to_text(ts), "start_ts": ts, "is_paused": 0, "accumulated_seconds": 0,
+                "last_resumed_at": ts}, event="start", ts=ts)
+
+    def pause_tasks(self, user_id, task_ids):
+        with self._lock:
+            ts = now_epoch()
+            running = [task for task in self._owned(user_id, task_ids) if task['last_resumed_at'] is not None]
+            return self._update_tasks(user_id, running, lambda task: {
+                "is_paused": 1, "last_resumed_at": None,
+                "accumulated_seconds": task['accumulated_seconds'] + max(0, ts - task['last_resumed_at'])},
+                event="pause", ts=ts)
+
+    def resume_tasks(self, user_id, task_ids):
+        with self._lock:
+            ts = now_epoch()
+            paused = [task for task in self._owned(user_id, task_ids)
+                      if task['is_paused'] == 1 and task['start_ts'] is not None]
+            return self._update_tasks(user_id, paused, lambda task: {"is_paused": 0, "last_resumed_at": ts},
+                                      event="resume", ts=ts)
+
+    def delete_tasks(self, user_id, task_ids):
+        with self._lock:
+            tasks = self._owned(user_id, task_ids)
+            for task in tasks:
+                self._remove_task(task)
+            if tasks:
+                self._bump(user_id, active=-len(tasks))
+                self._bump_version(user_id)
+            return len(tasks)
+
+    def complete_tasks(self, user_id, task_ids):
+        with self._lock:
+            tasks = self._owned(user_id, task_ids)
+            started = [task for task in tasks if task['start_ts']]
+            not_started = [task['id'] for task in tasks if not task['start_ts']]
+            if not started:
+                return [], not_started
+
+            completed_ts = now_epoch()
+            today = datetime.now().strftime("%Y-%m-%d")
+            estimated = actual = 0
+            for task in started:
+                elapsed = task_actions.elapsed_seconds(task['accumulated_seconds'], task['last_resumed_at'],
+                                                       completed_ts)
+                row = {field: task[field] for field in ("user_id", "task_name", "description", "estimated_time",
+                                                        "start_time", "created_at", "created_ts", "start_ts")}
+                row.update(id=self._new_id("completed"), actual_time=max(1, ceil(elapsed / 60)),
+                           completed_at=to_text(completed_ts), completed_ts=completed_ts)
+                self._completed[row['id']] = row
+                insort(self._completed_keys.setdefault(user_id, []), (completed_ts, row['id']))
+                estimated += row['estimated_time']
+                actual += row['actual_time']
+                self._record_ratio(user_id, row['estimated_time'], row['actual_time'])
+                self._remove_task(task)
+                # A finished task keeps only its 'complete' event
+                self._events[task['id']] = [("complete", completed_ts, elapsed)]
+
+            days = self._days.setdefault(user_id, {})
+            days[today] = days.get(today, 0) + len(started)
+            self._bump(user_id, active=-len(started), completed=len(started), estimated=estimated, actual=actual)
+            self._recompute_streaks(user_id)
+            self._bump_version(user_id)
+            return [task['id'] for task in started], not_started
+
+    def uncomplete_task(self, user_id, completed_id):
+        with self._lock:
+            row = self._completed.get(completed_id)
+            if row is None or row['user_id'] != user_id:
+                return None
+            del self._completed[completed_id]
+            keys = self._completed_keys[user_id]
+            del keys[bisect_left(keys, (row['completed_ts'], completed_id))]
+
+            task_id = self._insert_task({
+                "user_id": user_id, "task_name": row['task_name'], "description": row['description'],
+                "estimated_time": row['estimated_time'], "priority": 1, "is_completed": 0,  # the column default
+                "created_at": row['created_at'], "created_ts": row['created_ts'], "start_time": None,
+                "start_ts": None, "is_paused": 0, "accumulated_seconds": 0, "last_resumed_at": None,
+            })
+
+            # Take the completion back off its day, as in user_stats
+            days = self._days.get(user_id, {})
+            day = row['completed_at'].split()[0]
+            if day in days:
+                days[day] -= 1
+                if days[day] <= 0:
+                    del days[day]
+            self._bump(user_id, active=1, completed=-1, estimated=-row['estimated_time'],
+                       actual=-(row['actual_time'] or 0))
+            self._record_ratio(user_id, row['estimated_time'], row['actual_time'], removed=True)
+            self._recompute_streaks(user_id)
+            self._bump_version(user_id)
+            return task_id
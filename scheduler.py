@@ -0,0 +1,197 @@
+"""Task selection for /optimize_tasks.
+
+Given the user's open tasks and a time budget, pick the subset that fits
+and maximises the strategy's value:
+
+    priority     -- sum of priority weights (lower priority number = heavier)
+    longest_job  -- minutes of the budget actually used
+    max_tasks    -- number of tasks
+
+All three are 0/1 knapsack problems. `select_tasks` solves them exactly
+(dynamic programming over minutes, or branch-and-bound when the DP table
+would be too large). When branch-and-bound runs out of time it returns the
+best plan found so far, which is never worse than greedy-with-fill-in; a
+time limit of 0 skips straight to that greedy approximation.
+"""
+
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from operator import gt
+
+# Rough pure-Python DP throughput, used to decide up front whether the
+# exact table fits inside the caller's time limit.
+DP_CELLS_PER_MS = 6_000
+
+Selection = namedtuple("Selection", "tasks total_time value method exact")
+
+
+def task_values(tasks, strategy):
+    """Value of each (id, name, estimated_time[, priority]) task under a strategy."""
+    if strategy == "priority":
+        priorities = [task[3] or 0 for task in tasks]
+        heaviest = max(priorities, default=0)
+        return [heaviest - p + 1 for p in priorities]
+    if strategy == "longest_job":
+        return [task[2] for task in tasks]
+    return [1] * len(tasks)
+
+
+def select_tasks(tasks, budget, strategy, time_limit_ms=50):
+    """Pick the best subset of `tasks` fitting in `budget` minutes.
+
+    Returns a Selection whose `tasks` keep the order they had in the input,
+    so callers can pre-sort for display.
+    """
+    weights = [task[2] for task in tasks]
+    values = task_values(tasks, strategy)
+    candidates = [i for i, w in enumerate(weights) if 0 < w <= budget]
+
+    if sum(weights[i] for i in candidates) <= budget:
+        chosen, method, exact = candidates, "all", True
+    elif len(set(values[i] for i in candidates)) <= 1:
+        # Equal values: shortest-first prefix is optimal
+        candidates.sort(key=lambda i: weights[i])
+        chosen, total = [], 0
+        for i in candidates:
+            if total + weights[i] > budget:
+                break
+            chosen.append(i)
+            total += weights[i]
+        method, exact = "shortest_first", True
+    else:
+        candidates = _prune(candidates, weights, values, budget)
+        deadline = time.perf_counter() + time_limit_ms / 1000
+        if len(candidates) * budget <= time_limit_ms * DP_CELLS_PER_MS:
+            chosen, method, exact = _knapsack_dp(candidates, weights, values, budget), "dp", True
+        elif time_limit_ms > 0:
+            chosen, exact = _branch_and_bound(candidates, weights, values, budget, deadline)
+            method = "branch_and_bound"
+        else:
+            chosen, method, exact = greedy_fill(candidates, weights, values, budget), "greedy_fill", False
+
+    chosen = sorted(chosen)
+    return Selection(
+        tasks=[tasks[i] for i in chosen],
+        total_time=sum(weights[i] for i in chosen),
+        value=sum(values[i] for i in chosen),
+        method=method,
+        exact=exact,
+    )
+
+
+def _prune(candidates, weights, values, budget):
+    """At most budget // w tasks of weight w can ever be chosen, so only the
+    most valuable ones of each weight matter. Exact, and shrinks thousands of
+    tasks down to roughly budget * ln(budget) candidates."""
+    by_weight = {}
+    for i in candidates:
+        by_weight.setdefault(weights[i], []).append(i)
+    kept = []
+    for w, group in by_weight.items():
+        limit = budget // w
+        if len(group) > limit:
+            group.sort(key=lambda i: values[i], reverse=True)
+            group = group[:limit]
+        kept.extend(group)
+    return kept
+
+
+def _knapsack_dp(items, weights, values, budget):
+    """Classic 0/1 knapsack over capacities 0..budget.
+
+    best[c] is the best value using capacity c; each item's row of
+    take-flags is kept as bytes for reconstruction.
+    """
+    best = [0] * (budget + 1)
+    rows = []
+    for i in items:
+        w, v = weights[i], values[i]
+        tail = best[w:]
+        with_item = [x + v for x in best[:budget + 1 - w]]
+        rows.append(bytes(map(gt, with_item, tail)))
+        best = best[:w] + list(map(max, tail, with_item))
+
+    chosen = []
+    capacity = budget
+    for i, take in zip(reversed(items), reversed(rows)):
+        w = weights[i]
+        if capacity >= w and take[capacity - w]:
+            chosen.append(i)
+            capacity -= w
+    return chosen
+
+
+def greedy_fill(items, weights, values, budget):
+    """Best value-per-minute first (longer tasks first on ties), skipping
+    rather than stopping at tasks that don't fit. Compared with the single
+    most valuable task, which keeps the result within a factor of two of
+    optimal."""
+    order = sorted(items, key=lambda i: (values[i] / weights[i], weights[i]), reverse=True)
+    chosen, total, value = [], 0, 0
+    for i in order:
+        if total + weights[i] <= budget:
+            chosen.append(i)
+            total += weights[i]
+            value += values[i]
+    single = max(items, key=lambda i: values[i], default=None)
+    if single is not None and values[single] > value:
+        return [single]
+    return chosen
+
+
+def _branch_and_bound(items, weights, values, budget, deadline):
+    """Depth-first branch-and-bound with the fractional (LP) bound.
+
+    Starts from the greedy solution and returns (chosen, exact); `exact` is
+    False when the deadline hit before the search space was exhausted, in
+    which case the best solution found so far is returned.
+    """
+    order = sorted(items, key=lambda i: (values[i] / weights[i], weights[i]), reverse=True)
+    n = len(order)
+    w_sorted = [weights[i] for i in order]
+    v_sorted = [values[i] for i in order]
+    w_prefix = [0]
+    v_prefix = [0]
+    for w, v in zip(w_sorted, v_sorted):
+        w_prefix.append(w_prefix[-1] + w)
+        v_prefix.append(v_prefix[-1] + v)
+
+    def upper_bound(k, capacity, value):
+        # Items k..m-1 fit whole; item m (if any) fits fractionally
+        m = bisect_right(w_prefix, w_prefix[k] + capacity, lo=k) - 1
+        bound = value + v_prefix[m] - v_prefix[k]
+        if m < n:
+            bound += (capacity - (w_prefix[m] - w_prefix[k])) * v_sorted[m] / w_sorted[m]
+        return bound
+
+    best = greedy_fill(items, weights, values, budget)
+    best_value = sum(values[i] for i in best)
+    best_path = None
+
+    stack = [(0, budget, 0, None)]
+    nodes = 0
+    while stack:
+        k, capacity, value, path = stack.pop()
+        nodes += 1
+        if nodes & 1023 == 0 and time.perf_counter() > deadline:
+            return _unwind(best_path, order, best), False
+        if value > best_value:
+            best_value, best_path = value, path
+        if k == n or int(upper_bound(k, capacity, value)) <= best_value:
+            continue
+        stack.append((k + 1, capacity, value, path))
+        if w_sorted[k] <= capacity:
+            stack.append((k + 1, capacity - w_sorted[k], value + v_sorted[k], (k, path)))
+
+    return _unwind(best_path, order, best), True
+
+
+def _unwind(path, order, fallback):
+    if path is None:
+        return fallback
+    chosen = []
+    while path is not None:
+        k, path = path
+        chosen.append(order[k])
+    return chosen
@@ -0,0 +1,210 @@
+"""Full-text search over a user's tasks with SQLite FTS5.
+
+Each searchable table has an external-content FTS5 index next to it,
+kept in step by triggers, so writes pay a few index updates and searches
+never scan the base rows:
+
+    tasks                   -> tasks_search
+    completed_tasks         -> completed_tasks_search
+    archive.completed_tasks -> archive.completed_tasks_search
+
+The index reads its rows through a small view that adds an `owner` column
+("u<user_id>"). Every query is anchored on that token, so a search only
+walks the doclists for the user's own rows instead of every match in the
+table. Only task_name and description are searched; updates to anything
+else (the timer columns, priority) never touch the index. The index only
+finds and orders ids: names and snippets for the page shown are read from
+the tables and highlighted here.
+
+Existing databases get the main indexes from migration 9 and the archive
+one on first attach; to rebuild them all from their tables:
+
+    python search.py --rebuild
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+
+from markupsafe import Markup, escape
+
+# (label, schema, table) in the order results are shown within a tier
+SOURCES = (
+    ("active", "main", "tasks"),
+    ("completed", "main", "completed_tasks"),
+    ("archived", "archive", "completed_tasks"),
+)
+
+_TERM = re.compile(r"\w+")
+MAX_TERMS = 8
+SNIPPET_CHARS = 160
+
+# Prefix lengths FTS5 keeps its own index for. A shorter prefix would have
+# to merge the doclists of every matching word in the whole table, so one
+# is searched as a whole word instead. A longer prefix is matched by few
+# words and is answered from the main index.
+PREFIXES = (2, 3, 4, 5, 6)
+
+
+def index_statements(table, schema=""):
+    """DDL for `table`'s search index: the source view, the FTS5 table and
+    its sync triggers. `schema` ("archive.") places them in an attached
+    database, where triggers may only refer to that database's tables."""
+    index = f"{table}_search"
+    columns = "owner, task_name, description"
+    new_values = "new.id, 'u' || new.user_id, new.task_name, new.description"
+    old_values = "'delete', old.id, 'u' || old.user_id, old.task_name, old.description"
+    return [
+        f"CREATE VIEW IF NOT EXISTS {schema}{index}_source AS "
+        f"SELECT id, 'u' || user_id AS owner, task_name, description FROM {table}",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}{index} USING fts5("
+        f"{columns}, content='{index}_source', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='{' '.join(map(str, PREFIXES))}')",
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}{index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, {columns}) VALUES ({new_values});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}{index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {columns}) VALUES ({old_values});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}{index}_update
+        AFTER UPDATE OF user_id, task_name, description ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {columns}) VALUES ({old_values});
+            INSERT INTO {index} (rowid, {columns}) VALUES ({new_values});
+        END
+        ''',
+    ]
+
+
+def rebuild_index(connection, schema, table):
+    """Re-read `table`'s index from its source view."""
+    index = f"{table}_search"
+    connection.execute(f"INSERT INTO {schema}.{index}({index}) VALUES ('rebuild')")
+
+
+def query_terms(text):
+    """The words of a search box entry, lower-cased; the last one is
+    searched as a prefix (see match_expressions)."""
+    return _TERM.findall(text.lower())[:MAX_TERMS]
+
+
+def match_expressions(user_id, terms):
+    """FTS5 queries for (all words in the name, all words anywhere).
+
+    The last word also matches as a prefix so results show up while typing,
+    once it is as long as the shortest indexed prefix. It is never cut
+    short: every hit must contain what was typed, or there would be
+    nothing to highlight. The words are quoted, so FTS5 operators in the
+    input are searched as plain text.
+    """
+    quoted = [f'"{term}"' for term in terms[:-1]]
+    last = terms[-1]
+    if len(last) < PREFIXES[0]:
+        quoted.append(f'"{last}"')
+    else:
+        quoted.append(f'"{last}"*')
+    words = " AND ".join(quoted)
+    owner = f"owner : u{int(user_id)}"
+    return f"{owner} AND {{task_name}} : ({words})", f"{owner} AND {{task_name description}} : ({words})"
+
+
+# Ranks on rowids alone: tasks with every word in the name first, then the
+# rest, newest first within each source. bm25() would need each word's
+# document count across every user's rows, which for common words costs
+# more than the whole search. Fetching all of one user's matching rowids
+# and sorting them costs about a microsecond per match instead, whatever
+# the size of the table.
+SEARCH_SQL = "SELECT source, id, MIN(tier) AS tier FROM (" + " UNION ALL ".join(
+    f"SELECT {order} AS source, rowid AS id, 0 AS tier FROM {schema}.{table}_search "
+    f"WHERE {table}_search MATCH :name UNION ALL "
+    f"SELECT {order}, rowid, 1 FROM {schema}.{table}_search WHERE {table}_search MATCH :any"
+    for order, (_label, schema, table) in enumerate(SOURCES)
+) + ") GROUP BY source, id ORDER BY tier, source, id DESC LIMIT :limit OFFSET :offset"
+
+
+def _highlighter(terms):
+    words = [re.escape(term) for term in terms]
+    words[-1] += r"\w*"
+    return re.compile(r"\b(?:" + "|".join(words) + r")\b", re.IGNORECASE)
+
+
+def marked(text, pattern, limit=None):
+    """Escape `text` and wrap the searched words in <mark>. With `limit`,
+    long text is cut to a window around the first match."""
+    if not text:
+        return Markup("")
+    if limit is not None and len(text) > limit:
+        first = pattern.search(text)
+        start = max(0, (first.start() if first else 0) - limit // 4)
+        text = ("…" if start else "") + text[start:start + limit] + ("…" if start + limit < len(text) else "")
+    out, last = [], 0
+    for match in pattern.finditer(text):
+        out += [escape(text[last:match.start()]), Markup("<mark>"), escape(match.group()), Markup("</mark>")]
+        last = match.end()
+    out.append(escape(text[last:]))
+    return Markup("").join(out)
+
+
+def search_tasks(cur, user_id, text, page=1, page_size=20):
+    """Return (results, has_next) for one page of a user's matches."""
+    terms = query_terms(text)
+    if not terms:
+        return [], False
+    name_query, any_query = match_expressions(user_id, terms)
+    cur.execute(SEARCH_SQL, {"name": name_query, "any": any_query,
+                             "limit": page_size + 1, "offset": (page - 1) * page_size})
+    hits = cur.fetchall()
+    has_next = len(hits) > page_size
+    hits = hits[:page_size]
+
+    # Only the page's rows are read back, from the tables themselves
+    rows = {}
+    for order, (_label, schema, table) in enumerate(SOURCES):
+        ids = [hit[1] for hit in hits if hit[0] == order]
+        if ids:
+            cur.execute(f"SELECT id, task_name, description FROM {schema}.{table} "
+                        f"WHERE user_id = ? AND id IN ({', '.join('?' * len(ids))})", (user_id, *ids))
+            rows.update(((order, row[0]), row) for row in cur.fetchall())
+
+    pattern = _highlighter(terms)
+    results = []
+    for order, task_id, _tier in hits:
+        row = rows.get((order, task_id))
+        if row is None:
+            continue
+        results.append({
+            "source": SOURCES[order][0],
+            "id": task_id,
+            "name": marked(row[1], pattern),
+            "snippet": marked(row[2], pattern, limit=SNIPPET_CHARS),
+        })
+    return results, has_next
+
+
+if __name__ == '__main__':
+    from archive import attach_archive
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Manage the task search indexes.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild every index from its table")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.error("nothing to do (pass --rebuild)")
+
+    from shards import data_stores
+
+    for path, archive_path in data_stores(Config.DB_PATH, Config.ARCHIVE_DB_PATH, Config.SHARD_COUNT):
+        connection = sqlite3.connect(path, isolation_level=None, timeout=Config.DB_BUSY_TIMEOUT_MS / 1000)
+        attach_archive(connection, archive_path)
+        for _label, schema, table in SOURCES:
+            start = time.perf_counter()
+            connection.execute("BEGIN IMMEDIATE")
+            rebuild_index(connection, schema, table)
+            connection.execute("COMMIT")
+            print(f"Rebuilt {path}: {schema}.{table}_search in {time.perf_counter() - start:.1f}s.")
+        connection.close()
@@ -0,0 +1,158 @@
+"""Optional sharded storage: each user's data in one of SHARD_COUNT files.
+
+SQLite lets one writer at a time into a file, so with every user in
+DB_PATH all gunicorn workers queue on the same write lock. With
+SHARD_COUNT > 0 a user's rows live in one of N shard files, picked by a
+hash of user_id, and writers for users on different shards never wait
+for each other:
+
+    taskcrafter.db                  directory: users, for signup and login
+    taskcrafter_shard0.db           tasks, completed_tasks, user_stats,
+    taskcrafter_archive_shard0.db   aggregates, rollups, search indexes...
+    ...
+
+Every shard has the full schema (the same migrations) and a copy of its
+users' rows without the password, so a request only ever touches its
+user's shard and the queries joining users to their data work as before.
+Only the auth routes read the directory. A request's connection follows
+the logged-in user (db.get_db_connection); task ids are unique per shard,
+which is all the routes need since they always filter on user_id too.
+
+An existing single-file database is split with:
+
+    python shards.py split --count 4
+
+which writes the shard files next to DB_PATH and ARCHIVE_DB_PATH and
+leaves those as they are. Start the app with SHARD_COUNT=4 afterwards;
+the count can't change once users have data in the shards.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+import zlib
+
+from init_db import migrate
+
+# Tables holding rows keyed by user_id; all of them move to the user's shard.
+# (task_logs was never written to and has no user_id.)
+USER_TABLES = ("tasks", "user_stats", "completed_tasks", "user_aggregates", "completed_rollups",
+               "task_time_events", "user_estimate_stats")
+
+
+def shard_index(user_id, count):
+    """The shard holding `user_id`'s data, 0 <= index < count."""
+    return zlib.crc32(str(int(user_id)).encode()) % count
+
+
+def _suffixed(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}_shard{index}{ext}"
+
+
+def shard_stores(db_path, archive_path, count):
+    """[(path, archive_path)] of every shard; empty when sharding is off."""
+    return [(_suffixed(db_path, i), _suffixed(archive_path, i)) for i in range(count)]
+
+
+def data_stores(db_path, archive_path, count):
+    """Every (path, archive_path) holding users' tasks: the shards, or the
+    single database when sharding is off. Maintenance scripts loop over this."""
+    return shard_stores(db_path, archive_path, count) or [(db_path, archive_path)]
+
+
+def store_for(user_id, db_path, archive_path, count):
+    """(path, archive_path) holding `user_id`'s data."""
+    if not count:
+        return db_path, archive_path
+    index = shard_index(user_id, count)
+    return _suffixed(db_path, index), _suffixed(archive_path, index)
+
+
+def copy_user(cur, user_id, username, email, created_at, created_ts):
+    """Add a signed-up user's row to their shard (without the password)."""
+    cur.execute("INSERT OR IGNORE INTO users (id, username, email, password, created_at, created_ts) "
+                "VALUES (?, ?, ?, '', ?, ?)", (user_id, username, email, created_at, created_ts))
+
+
+def _columns(connection, schema, table):
+    return ", ".join(row[1] for row in connection.execute(f"PRAGMA {schema}.table_info({table})"))
+
+
+def split(db_path, archive_path, count):
+    """Copy every user's rows from the single-file database into `count`
+    new shard files. Returns {shard path: users copied}."""
+    stores = shard_stores(db_path, archive_path, count)
+    existing = [path for store in stores for path in store if os.path.exists(path)]
+    if existing:
+        raise FileExistsError(f"shard files already exist: {', '.join(existing)}")
+
+    copied = {}
+    try:
+        for index, (path, shard_archive) in enumerate(stores):
+            copied[path] = _copy_shard(db_path, archive_path, count, index, path, shard_archive)
+    except Exception:
+        # Leave nothing half-written for the next attempt to trip over
+        for path in (path for store in stores for path in store):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+        raise
+    return copied
+
+
+def _copy_shard(db_path, archive_path, count, index, path, shard_archive):
+    from archive import attach_archive
+
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        migrate(connection)
+        connection.create_function("shard_of", 1, lambda user_id: shard_index(user_id, count),
+                                   deterministic=True)
+        attach_archive(connection, shard_archive)
+        connection.execute("ATTACH DATABASE ? AS source", (db_path,))
+        has_archive = os.path.exists(archive_path)
+        if has_archive:
+            connection.execute("ATTACH DATABASE ? AS source_archive", (archive_path,))
+
+        connection.execute("BEGIN")
+        users = connection.execute('''
+            INSERT INTO main.users (id, username, email, password, created_at, created_ts)
+            SELECT id, username, email, '', created_at, created_ts FROM source.users WHERE shard_of(id) = ?
+        ''', (index,)).rowcount
+        for table in USER_TABLES:
+            columns = _columns(connection, "main", table)
+            # The insert triggers fill the search indexes as rows arrive
+            connection.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} "
+                               f"FROM source.{table} WHERE shard_of(user_id) = ?", (index,))
+        if has_archive:
+            columns = _columns(connection, "archive", "completed_tasks")
+            connection.execute(f"INSERT INTO archive.completed_tasks ({columns}) SELECT {columns} "
+                               f"FROM source_archive.completed_tasks WHERE shard_of(user_id) = ?", (index,))
+        connection.execute("COMMIT")
+        # Only the new files: the source is left untouched
+        connection.execute("ANALYZE main")
+        connection.execute("ANALYZE archive")
+    finally:
+        connection.close()
+    return users
+
+
+if __name__ == '__main__':
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Manage sharded storage.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    split_parser = subcommands.add_parser("split", help="split DB_PATH into shard files")
+    split_parser.add_argument("--count", type=int, default=Config.SHARD_COUNT or 4)
+    args = parser.parse_args()
+
+    if args.count < 1:
+        parser.error("--count must be at least 1")
+    start = time.perf_counter()
+    copied = split(Config.DB_PATH, Config.ARCHIVE_DB_PATH, args.count)
+    for path, users in copied.items():
+        print(f"{path}: {users} users")
+    print(f"Split {Config.DB_PATH} into {args.count} shards in {time.perf_counter() - start:.1f}s. "
+          f"Start the app with SHARD_COUNT={args.count}.")
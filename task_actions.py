@@ -0,0 +1,277 @@
+"""Task state changes shared by the HTML routes, /batch_tasks and the JSON API.
+
+Each function takes the cursor of an open transaction and the acting user;
+the state changes take a list of task ids and apply to all of them with
+set-based SQL. They keep the derived per-user data in step (user_stats,
+user_aggregates, estimate statistics, data version). The caller commits,
+so a whole batch lands as one transaction.
+"""
+
+from datetime import datetime
+from math import ceil
+
+from aggregates import bump_aggregates, record_day_completed, record_day_uncompleted
+from archive import remove_archived
+from cache import bump_data_version
+from estimates import record_completed, record_uncompleted
+from timecodec import now_epoch, to_text
+
+# Upper bound on ids per call; keeps the IN (...) list well under SQLite's
+# bound-parameter limit
+MAX_BATCH = 500
+
+
+# Columns the dashboard and the JSON API show for an active task
+TASK_COLUMNS = ("id, task_name, description, estimated_time, priority, is_completed, start_ts, is_paused, "
+                "created_ts, accumulated_seconds, last_resumed_at")
+
+
+def _placeholders(ids):
+    return ", ".join("?" * len(ids))
+
+
+def _log_events(cur, user_id, rows, event, ts):
+    """Append one timer event per (task_id, elapsed_seconds) row."""
+    cur.executemany(
+        "INSERT INTO task_time_events (task_id, user_id, event, ts, elapsed_seconds) VALUES (?, ?, ?, ?, ?)",
+        [(task_id, user_id, event, ts, elapsed) for task_id, elapsed in rows])
+
+
+def _update_tasks(cur, user_id, task_ids, assignments, params=(), condition="", event=None, ts=None):
+    """UPDATE the user's tasks among task_ids that also match `condition`.
+    With `event`, each changed task gets a task_time_events row at `ts`."""
+    cur.execute(f"UPDATE tasks SET {assignments} "
+                f"WHERE user_id = ? AND id IN ({_placeholders(task_ids)}) {condition} "
+                f"RETURNING id, accumulated_seconds",
+                (*params, user_id, *task_ids))
+    changed = cur.fetchall()
+    if changed:
+        if event:
+            _log_events(cur, user_id, changed, event, ts)
+        bump_data_version(cur, user_id)
+    return len(changed)
+
+
+def elapsed_seconds(accumulated_seconds, last_resumed_at, now):
+    """Worked time of a task: the closed stretches plus the running one."""
+    if last_resumed_at is None:
+        return accumulated_seconds
+    return accumulated_seconds + max(0, now - last_resumed_at)
+
+
+def parse_task_fields(task_name, estimated_time, priority=0):
+    """Validate add/edit input. Returns (task_name, estimated_time, priority)
+    or raises ValueError with a message fit to show the user."""
+    task_name = (task_name or "").strip()
+    if not task_name:
+        raise ValueError("Task name is required.")
+    try:
+        estimated_time = int(estimated_time)
+    except (TypeError, ValueError):
+        raise ValueError("Estimated time must be a whole number of minutes.")
+    if estimated_time < 1:
+        raise ValueError("Estimated time must be at least 1 minute.")
+    try:
+        priority = int(priority or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Priority must be a whole number.")
+    return task_name, estimated_time, priority
+
+
+def get_task(cur, user_id, task_id):
+    cur.execute(f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ? AND user_id = ?", (task_id, user_id))
+    return cur.fetchone()
+
+
+def create_task(cur, user_id, task_name, description, estimated_time, priority):
+    created_ts = now_epoch()
+    cur.execute('''
+        INSERT INTO tasks (user_id, task_name, description, estimated_time, priority, is_completed,
+                           created_at, created_ts)
+        VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+    ''', (user_id, task_name, description, estimated_time, priority, to_text(created_ts), created_ts))
+    # Read before the upserts below: one that inserts moves lastrowid
+    task_id = cur.lastrowid
+    bump_aggregates(cur, user_id, active=1)
+    bump_data_version(cur, user_id)
+    return task_id
+
+
+def create_tasks(cur, user_id, rows):
+    """create_task for many (task_name, description, estimated_time,
+    priority) rows at once: one executemany and one aggregate bump.
+    Returns the number of tasks created."""
+    created_ts = now_epoch()
+    created_at = to_text(created_ts)
+    cur.executemany('''
+        INSERT INTO tasks (user_id, task_name, description, estimated_time, priority, is_completed,
+                           created_at, created_ts)
+        VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+    ''', [(user_id, task_name, description, estimated_time, priority, created_at, created_ts)
+          for task_name, description, estimated_time, priority in rows])
+    if rows:
+        bump_aggregates(cur, user_id, active=len(rows))
+        bump_data_version(cur, user_id)
+    return len(rows)
+
+
+def update_task(cur, user_id, task_id, task_name, estimated_time, priority):
+    return _update_tasks(cur, user_id, [task_id], "task_name = ?, estimated_time = ?, priority = ?",
+                         (task_name, estimated_time, priority))
+
+
+def start_tasks(cur, user_id, task_ids):
+    # Only tasks never started: a running or paused one keeps its logged time
+    start_ts = now_epoch()
+    return _update_tasks(cur, user_id, task_ids,
+                         "start_time = ?, start_ts = ?, is_paused = 0, accumulated_seconds = 0, last_resumed_at = ?",
+                         (to_text(start_ts), start_ts, start_ts), condition="AND start_ts IS NULL",
+                         event="start", ts=start_ts)
+
+
+def pause_tasks(cur, user_id, task_ids):
+    # Close the running stretch; only running tasks can pause
+    ts = now_epoch()
+    return _update_tasks(cur, user_id, task_ids,
+                         "is_paused = 1, accumulated_seconds = accumulated_seconds + MAX(0, ? - last_resumed_at), "
+                         "last_resumed_at = NULL",
+                         (ts,), condition="AND last_resumed_at IS NOT NULL", event="pause", ts=ts)
+
+
+def resume_tasks(cur, user_id, task_ids):
+    ts = now_epoch()
+    return _update_tasks(cur, user_id, task_ids, "is_paused = 0, last_resumed_at = ?", (ts,),
+                         condition="AND is_paused = 1 AND start_ts IS NOT NULL", event="resume", ts=ts)
+
+
+def delete_tasks(cur, user_id, task_ids):
+    cur.execute(f"DELETE FROM tasks WHERE user_id = ? AND id IN ({_placeholders(task_ids)}) RETURNING id",
+                (user_id, *task_ids))
+    deleted_ids = [row[0] for row in cur.fetchall()]
+    deleted = len(deleted_ids)
+    if deleted:
+        cur.execute(f"DELETE FROM task_time_events WHERE task_id IN ({_placeholders(deleted_ids)})", deleted_ids)
+        bump_aggregates(cur, user_id, active=-deleted)
+        bump_data_version(cur, user_id)
+    return deleted
+
+
+def complete_tasks(cur, user_id, task_ids):
+    """Move started tasks to completed_tasks.
+
+    Returns (completed_ids, not_started_ids); ids that don't exist or
+    belong to someone else are in neither list.
+    """
+    cur.execute(f'''
+        SELECT id, task_name, description, estimated_time, start_time, start_ts, created_at, created_ts,
+               accumulated_seconds, last_resumed_at
+        FROM tasks
+        WHERE user_id = ? AND id IN ({_placeholders(task_ids)})
+    ''', (user_id, *task_ids))
+    rows = cur.fetchall()
+    started = [row for row in rows if row['start_ts']]
+    not_started = [row['id'] for row in rows if not row['start_ts']]
+    if not started:
+        return [], not_started
+
+    # Worked time excludes pauses; it is read off the task row, not the log
+    completed_ts = now_epoch()
+    completed_at = to_text(completed_ts)
+    elapsed = {row['id']: elapsed_seconds(row['accumulated_seconds'], row['last_resumed_at'], completed_ts)
+               for row in started}
+    records = [(
+        user_id,
+        row['task_name'],
+        row['description'],
+        row['estimated_time'],
+        max(1, ceil(elapsed[row['id']] / 60)),
+        row['start_time'],
+        completed_at,
+        row['created_at'],
+        row['created_ts'],
+        row['start_ts'],
+        completed_ts,
+    ) for row in started]
+    cur.executemany('''
+        INSERT INTO completed_tasks
+        (user_id, task_name, description, estimated_time, actual_time, start_time, completed_at,
+         created_at, created_ts, start_ts, completed_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+
+    # One user_stats upsert for the whole batch
+    today = datetime.now().strftime("%Y-%m-%d")
+    completed = len(started)
+    cur.execute('''
+        INSERT INTO user_stats (user_id, date, tasks_completed)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id, date) DO UPDATE SET tasks_completed = tasks_completed + excluded.tasks_completed
+    ''', (user_id, today, completed))
+    cur.execute('SELECT tasks_completed FROM user_stats WHERE user_id = ? AND date = ?', (user_id, today))
+    day_count = cur.fetchone()[0]
+
+    completed_ids = [row['id'] for row in started]
+    cur.execute(f"DELETE FROM tasks WHERE user_id = ? AND id IN ({_placeholders(completed_ids)})",
+                (user_id, *completed_ids))
+    # Compact the timer log: a finished task keeps only its 'complete' event
+    cur.execute(f"DELETE FROM task_time_events WHERE task_id IN ({_placeholders(completed_ids)})", completed_ids)
+    _log_events(cur, user_id, elapsed.items(), "complete", completed_ts)
+    bump_aggregates(cur, user_id, active=-completed, completed=completed,
+                    estimated=sum(record[3] for record in records),
+                    actual=sum(record[4] for record in records))
+    record_day_completed(cur, user_id, today, day_count, added=completed)
+    record_completed(cur, user_id, [(record[3], record[4]) for record in records])
+    bump_data_version(cur, user_id)
+    return completed_ids, not_started
+
+
+def uncomplete_task(cur, user_id, completed_id):
+    """Move a completed task back to the active list.
+
+    Returns the new tasks.id, or None if the completed task doesn't exist
+    or belongs to someone else.
+    """
+    cur.execute('''
+        SELECT task_name, description, estimated_time, actual_time, created_at, created_ts, completed_at
+        FROM completed_tasks
+        WHERE id = ? AND user_id = ?
+    ''', (completed_id, user_id))
+    completed_task = cur.fetchone()
+    if completed_task:
+        cur.execute('DELETE FROM completed_tasks WHERE id = ? AND user_id = ?', (completed_id, user_id))
+    else:
+        # Older completions live in the archive file (see archive.py)
+        completed_task = remove_archived(cur, user_id, completed_id)
+        if completed_task is None:
+            return None
+
+    cur.execute('''
+        INSERT INTO tasks (user_id, task_name, description, estimated_time, created_at, created_ts, is_completed)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    ''', (user_id, completed_task['task_name'], completed_task['description'],
+          completed_task['estimated_time'], completed_task['created_at'], completed_task['created_ts']))
+    task_id = cur.lastrowid
+
+    # Take the completion back off its day in user_stats
+    completed_date = completed_task['completed_at'].split()[0]  # "YYYY-MM-DD"
+    cur.execute('SELECT tasks_completed FROM user_stats WHERE user_id = ? AND date = ?', (user_id, completed_date))
+    row = cur.fetchone()
+    if row:
+        if row['tasks_completed'] > 1:
+            cur.execute('''
+                UPDATE user_stats
+                SET tasks_completed = tasks_completed - 1
+                WHERE user_id = ? AND date = ?
+            ''', (user_id, completed_date))
+        else:
+            # If only 1 task existed, remove the row
+            cur.execute('DELETE FROM user_stats WHERE user_id = ? AND date = ?', (user_id, completed_date))
+
+    bump_aggregates(cur, user_id, active=1, completed=-1,
+                    estimated=-completed_task['estimated_time'],
+                    actual=-(completed_task['actual_time'] or 0))
+    if row:
+        record_day_uncompleted(cur, user_id, completed_date, row['tasks_completed'] - 1)
+    record_uncompleted(cur, user_id, completed_task['estimated_time'], completed_task['actual_time'])
+    bump_data_version(cur, user_id)
+    return task_id
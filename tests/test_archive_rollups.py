@@ -0,0 +1,99 @@
+"""Archived and hot completions land on the same local day.
+
+The trend series adds minutes from completed_tasks and completed_rollups;
+both must use the day boundary user_stats uses (the server's local day),
+or completions just after local midnight split across days and weeks
+depending on whether they have been archived yet.
+"""
+
+import sqlite3
+import time
+from datetime import date, datetime
+
+import pytest
+
+import archive
+from analytics import trend_series
+from init_db import migrate
+
+USER_ID = 1
+# A Monday: 00:30 here is still Sunday in UTC, the week before
+MONDAY = date(2025, 3, 10)
+
+
+@pytest.fixture
+def local_tz(monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Kolkata")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def cur(local_tz):
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    migrate(connection)
+    archive.attach_archive(connection, ":memory:")
+    connection.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'u', 'u@x', '')", (USER_ID,))
+    yield connection.cursor()
+    connection.close()
+
+
+def complete_at(cur, hour, minute, estimated):
+    ts = int(datetime(MONDAY.year, MONDAY.month, MONDAY.day, hour, minute).timestamp())
+    cur.execute("INSERT INTO completed_tasks (user_id, task_name, estimated_time, actual_time, completed_ts) "
+                "VALUES (?, 't', ?, ?, ?)", (USER_ID, estimated, estimated, ts))
+    cur.execute('''
+        INSERT INTO user_stats (user_id, date, tasks_completed) VALUES (?, ?, 1)
+        ON CONFLICT(user_id, date) DO UPDATE SET tasks_completed = tasks_completed + 1
+    ''', (USER_ID, MONDAY.isoformat()))
+    return ts
+
+
+def week(cur, start):
+    series = trend_series(cur, USER_ID, MONDAY)
+    return next(row for row in series["weekly"] if row["week"] == start.isoformat())
+
+
+def test_completions_either_side_of_the_cutoff_share_their_day(cur):
+    archived_ts = complete_at(cur, 0, 20, estimated=10)
+    complete_at(cur, 0, 40, estimated=30)
+    assert time.strftime("%Y-%m-%d", time.gmtime(archived_ts)) == "2025-03-09"
+
+    before = week(cur, MONDAY)
+    assert archive.archive_user(cur, USER_ID, archived_ts + 60) == 1
+    cur.execute("SELECT date, completed_count FROM completed_rollups WHERE user_id = ?", (USER_ID,))
+    assert [tuple(row) for row in cur.fetchall()] == [(MONDAY.isoformat(), 1)]
+
+    # Same numbers whether the earlier one is archived or not
+    assert week(cur, MONDAY) == before == {"week": MONDAY.isoformat(), "completed": 2,
+                                          "estimated": 40, "actual": 40}
+    assert week(cur, date(2025, 3, 3))["estimated"] == 0
+
+
+def test_unmarking_an_archived_completion_takes_it_off_its_local_day(cur):
+    ts = complete_at(cur, 0, 20, estimated=10)
+    archive.archive_user(cur, USER_ID, ts + 60)
+    cur.execute("SELECT id FROM archive.completed_tasks")
+    assert archive.remove_archived(cur, USER_ID, cur.fetchone()[0]) is not None
+    cur.execute("SELECT COUNT(*) FROM completed_rollups")
+    assert cur.fetchone()[0] == 0
+
+
+def test_rollups_keyed_by_utc_day_are_still_found_and_rebuilt(cur):
+    first = complete_at(cur, 0, 20, estimated=10)
+    complete_at(cur, 0, 25, estimated=20)
+    archive.archive_user(cur, USER_ID, first + 3600)
+    # As archive.py used to write them
+    cur.execute("UPDATE completed_rollups SET date = '2025-03-09'")
+
+    cur.execute("SELECT id FROM archive.completed_tasks ORDER BY id LIMIT 1")
+    archive.remove_archived(cur, USER_ID, cur.fetchone()[0])
+    cur.execute("SELECT date, completed_count, total_estimated FROM completed_rollups")
+    assert [tuple(row) for row in cur.fetchall()] == [("2025-03-09", 1, 20)]
+
+    assert archive.rebuild_rollups(cur.connection) == 1
+    cur.execute("SELECT date, completed_count, total_estimated FROM completed_rollups")
+    assert [tuple(row) for row in cur.fetchall()] == [(MONDAY.isoformat(), 1, 20)]
@@ -0,0 +1,196 @@
+"""MemoryRepository against SQLiteRepository.
+
+The same random sequence of writes goes to both backends, and after every
+step their reads must agree: active and completed lists, the aggregate
+counters, totals, streaks and estimate statistics. SQLite hands out ids
+differently (it reuses the highest one after a delete), so ids are
+compared through the mapping built as rows are created.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+import cache
+import repository
+import task_actions
+from archive import attach_archive
+from init_db import migrate
+from repository import MemoryRepository, SQLiteRepository
+
+USERS = (1, 2)
+START_TS = 1_743_400_000
+
+
+class Clock:
+    def __init__(self):
+        self.now = START_TS
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    for module in (task_actions, repository, cache):
+        monkeypatch.setattr(module, "now_epoch", clock)
+    return clock
+
+
+@pytest.fixture
+def backends(clock):
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    migrate(connection)
+    attach_archive(connection, ":memory:")
+    sqlite_repo, memory_repo = SQLiteRepository(connection.cursor()), MemoryRepository()
+    for user_id in USERS:
+        for repo in (sqlite_repo, memory_repo):
+            assert repo.add_user(f"u{user_id}", f"u{user_id}@x", "", created_ts=START_TS) == user_id
+    yield sqlite_repo, memory_repo
+    connection.close()
+
+
+class Parity:
+    """Drives both backends and keeps sqlite id -> memory id maps."""
+
+    def __init__(self, sqlite_repo, memory_repo, rng):
+        self.sqlite, self.memory, self.rng = sqlite_repo, memory_repo, rng
+        self.tasks = {}      # tasks.id
+        self.completed = {}  # completed_tasks.id
+
+    def task_ids(self, user_id):
+        """Some of the user's tasks, now and then with another user's or an
+        unknown id mixed in: those must be ignored by both."""
+        own = [task['id'] for task in self.sqlite.list_tasks(user_id)]
+        picked = self.rng.sample(own, min(len(own), self.rng.randint(1, 3)))
+        if self.rng.random() < 0.15:
+            other = [task_id for task_id in self.tasks if task_id not in own]
+            picked.append(self.rng.choice(other) if other else 10_000)
+        return picked
+
+    def memory_ids(self, task_ids):
+        return [self.tasks.get(task_id, 10_000) for task_id in task_ids]
+
+    def create(self, user_id):
+        fields = (f"task {len(self.tasks)}", "d", self.rng.randint(1, 300), self.rng.randint(0, 3))
+        self.tasks[self.sqlite.create_task(user_id, *fields)] = self.memory.create_task(user_id, *fields)
+
+    def create_many(self, user_id):
+        rows = [(f"bulk {len(self.tasks)}.{i}", "", self.rng.randint(1, 300), 0)
+                for i in range(self.rng.randint(0, 4))]
+        assert self.sqlite.create_tasks(user_id, rows) == self.memory.create_tasks(user_id, rows)
+        # Both hand out ascending ids, so the newest rows pair up in order
+        new_sqlite = sorted(task['id'] for task in self.sqlite.list_tasks(user_id))[-len(rows):] if rows else []
+        new_memory = sorted(task['id'] for task in self.memory.list_tasks(user_id))[-len(rows):] if rows else []
+        self.tasks.update(zip(new_sqlite, new_memory))
+
+    def update(self, user_id):
+        task_ids = self.task_ids(user_id)[:1]
+        if task_ids:
+            fields = (f"renamed {self.rng.random():.3f}", self.rng.randint(1, 300), self.rng.randint(0, 3))
+            assert (self.sqlite.update_task(user_id, task_ids[0], *fields)
+                    == self.memory.update_task(user_id, self.memory_ids(task_ids)[0], *fields))
+
+    def timer(self, user_id, action):
+        task_ids = self.task_ids(user_id)
+        method = f"{action}_tasks"
+        assert (getattr(self.sqlite, method)(user_id, task_ids)
+                == getattr(self.memory, method)(user_id, self.memory_ids(task_ids)))
+
+    def delete(self, user_id):
+        task_ids = self.task_ids(user_id)
+        assert self.sqlite.delete_tasks(user_id, task_ids) == self.memory.delete_tasks(user_id, self.memory_ids(task_ids))
+
+    def complete(self, user_id):
+        task_ids = self.task_ids(user_id)
+        done, not_started = self.sqlite.complete_tasks(user_id, task_ids)
+        memory_done, memory_not_started = self.memory.complete_tasks(user_id, self.memory_ids(task_ids))
+        assert sorted(self.memory_ids(done)) == sorted(memory_done)
+        assert sorted(self.memory_ids(not_started)) == sorted(memory_not_started)
+        if done:
+            # The clock moves every step, so the batch is the newest rows
+            new_sqlite = self.sqlite.completed_page(user_id, limit=len(done))
+            new_memory = self.memory.completed_page(user_id, limit=len(done))
+            self.completed.update((a['id'], b['id']) for a, b in zip(new_sqlite, new_memory))
+
+    def uncomplete(self, user_id):
+        rows = self.sqlite.completed_page(user_id, limit=1000)
+        if not rows:
+            return
+        completed_id = self.rng.choice(rows)['id']
+        new_id = self.sqlite.uncomplete_task(user_id, completed_id)
+        memory_new_id = self.memory.uncomplete_task(user_id, self.completed.pop(completed_id))
+        assert (new_id is None) == (memory_new_id is None)
+        self.tasks[new_id] = memory_new_id
+
+    def step(self, user_id):
+        op = self.rng.choice(["create", "create", "create_many", "update", "start", "start", "pause",
+                              "resume", "complete", "complete", "uncomplete", "delete"])
+        if op in ("start", "pause", "resume"):
+            self.timer(user_id, op)
+        else:
+            getattr(self, op)(user_id)
+
+    def translated(self, rows, ids):
+        return [{**row, 'id': ids[row['id']]} for row in rows]
+
+    def check(self):
+        for user_id in USERS:
+            sqlite_repo, memory_repo = self.sqlite, self.memory
+            assert self.translated(sqlite_repo.list_tasks(user_id), self.tasks) == memory_repo.list_tasks(user_id)
+            assert ([(self.tasks[task[0]], *task[1:]) for task in sqlite_repo.schedulable_tasks(user_id)]
+                    == memory_repo.schedulable_tasks(user_id))
+            for time_filter in (None, 'before', 'on', 'after'):
+                assert (self.translated(sqlite_repo.completed_page(user_id, time_filter=time_filter, limit=1000),
+                                        self.completed)
+                        == memory_repo.completed_page(user_id, time_filter=time_filter, limit=1000))
+            assert sqlite_repo.counters(user_id) == memory_repo.counters(user_id)
+            assert sqlite_repo.totals(user_id) == memory_repo.totals(user_id)
+            assert sqlite_repo.streak_stats(user_id) == memory_repo.streak_stats(user_id)
+            sqlite_stats, memory_stats = sqlite_repo.estimate_stats(user_id), memory_repo.estimate_stats(user_id)
+            assert sqlite_stats.keys() == memory_stats.keys()
+            for bucket, stats in sqlite_stats.items():
+                assert stats == pytest.approx(memory_stats[bucket])
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_backends_agree(backends, clock, seed):
+    rng = random.Random(seed)
+    parity = Parity(*backends, rng)
+    for _ in range(80):
+        # Always forward, so every completion batch has its own completed_ts
+        clock.now += rng.randint(1, 3600)
+        parity.step(rng.choice(USERS))
+        parity.check()
+
+
+def test_completed_pages_agree(backends, clock):
+    rng = random.Random(0)
+    parity = Parity(*backends, rng)
+    for _ in range(40):
+        parity.create(1)
+    for batch in range(8):
+        clock.now += 600
+        ids = [task['id'] for task in parity.sqlite.list_tasks(1)][:4]
+        parity.sqlite.start_tasks(1, ids)
+        parity.memory.start_tasks(1, parity.memory_ids(ids))
+        clock.now += rng.randint(60, 7200)
+        parity.sqlite.complete_tasks(1, ids)
+        parity.memory.complete_tasks(1, parity.memory_ids(ids))
+        new_sqlite, new_memory = parity.sqlite.completed_page(1, limit=4), parity.memory.completed_page(1, limit=4)
+        parity.completed.update((a['id'], b['id']) for a, b in zip(new_sqlite, new_memory))
+
+    # Keyset pages of 3, with and without a window
+    for since_ts, until_ts in ((None, None), (START_TS + 3000, START_TS + 20000)):
+        before = memory_before = None
+        while True:
+            page = parity.sqlite.completed_page(1, since_ts, until_ts, before=before, limit=3)
+            memory_page = parity.memory.completed_page(1, since_ts, until_ts, before=memory_before, limit=3)
+            assert parity.translated(page, parity.completed) == memory_page
+            if not page:
+                break
+            before = (page[-1]['completed_ts'], page[-1]['id'])
+            memory_before = (memory_page[-1]['completed_ts'], memory_page[-1]['id'])
@@ -0,0 +1,107 @@
+"""Incremental streak and best-day updates against full recomputation.
+
+Random histories of completions and unmarks go through the same path
+task_actions uses (user_stats upsert, then record_day_completed /
+record_day_uncompleted), and after every step the stored fields must equal
+STREAK_STATS_SQL, streak_fields and the day walk /profile used to do.
+"""
+
+import random
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import aggregates
+from init_db import migrate
+
+USER_ID = 1
+TODAY = date(2025, 3, 31)
+WINDOW_DAYS = 40
+
+
+@pytest.fixture
+def cur():
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    migrate(connection)
+    connection.execute("INSERT INTO users (id, username, email, password) VALUES (?, 'u', 'u@x', '')", (USER_ID,))
+    yield connection.cursor()
+    connection.close()
+
+
+def complete(cur, day, added):
+    cur.execute('''
+        INSERT INTO user_stats (user_id, date, tasks_completed) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, date) DO UPDATE SET tasks_completed = tasks_completed + excluded.tasks_completed
+    ''', (USER_ID, day, added))
+    cur.execute("SELECT tasks_completed FROM user_stats WHERE user_id = ? AND date = ?", (USER_ID, day))
+    aggregates.record_day_completed(cur, USER_ID, day, cur.fetchone()[0], added=added)
+
+
+def uncomplete(cur, day):
+    cur.execute("SELECT tasks_completed FROM user_stats WHERE user_id = ? AND date = ?", (USER_ID, day))
+    count = cur.fetchone()[0]
+    if count > 1:
+        cur.execute("UPDATE user_stats SET tasks_completed = tasks_completed - 1 WHERE user_id = ? AND date = ?",
+                    (USER_ID, day))
+    else:
+        cur.execute("DELETE FROM user_stats WHERE user_id = ? AND date = ?", (USER_ID, day))
+    aggregates.record_day_uncompleted(cur, USER_ID, day, count - 1)
+
+
+def day_counts(cur):
+    cur.execute("SELECT date, tasks_completed FROM user_stats WHERE user_id = ? ORDER BY date", (USER_ID,))
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+
+def profile_walk(counts, today):
+    """What /profile computed before the fields were stored: the run of
+    active days ending today, and the first day with the most tasks."""
+    active = {date.fromisoformat(day) for day, count in counts.items() if count > 0}
+    streak, day = 0, today
+    while day in active:
+        streak += 1
+        day -= timedelta(days=1)
+    best_day, best_count = None, 0
+    for day, count in sorted(counts.items()):
+        if count > best_count:
+            best_day, best_count = day, count
+    return streak, best_day, best_count
+
+
+def check(cur):
+    stored = aggregates._streak_row(cur, USER_ID)
+
+    cur.execute(aggregates.STREAK_STATS_SQL.format(user_filter="AND user_id = ?"), (USER_ID, USER_ID))
+    row = cur.fetchone()
+    assert stored == (tuple(row[1:]) if row else (0, 0, None, None, 0))
+
+    counts = day_counts(cur)
+    assert stored == aggregates.streak_fields(counts)
+
+    current, _longest, last_active, best_day, best_count = stored
+    streak, walk_best_day, walk_best_count = profile_walk(counts, TODAY)
+    assert (current if last_active == TODAY.isoformat() else 0) == streak
+    assert (best_day, best_count) == (walk_best_day, walk_best_count)
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_incremental_streaks_match_recomputation(cur, seed):
+    rng = random.Random(seed)
+    # Mostly recent days, so runs up to TODAY form and break often
+    days = [(TODAY - timedelta(days=offset)).isoformat() for offset in range(WINDOW_DAYS)]
+    for _ in range(60):
+        counts = day_counts(cur)
+        if counts and rng.random() < 0.4:
+            uncomplete(cur, rng.choice(sorted(counts)))
+        else:
+            day = days[min(int(rng.expovariate(0.15)), WINDOW_DAYS - 1)]
+            complete(cur, day, rng.choice((1, 1, 1, 2, 3)))
+        check(cur)
+
+
+def test_unmarking_the_last_completion_clears_everything(cur):
+    complete(cur, TODAY.isoformat(), 1)
+    uncomplete(cur, TODAY.isoformat())
+    assert aggregates._streak_row(cur, USER_ID) == (0, 0, None, None, 0)
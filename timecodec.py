@@ -0,0 +1,77 @@
+"""Timestamp encoding shared by the routes, templates and migrations.
+
+Timestamps are stored as integer UTC epoch seconds (the *_ts columns). The
+older TEXT columns ("YYYY-MM-DD HH:MM:SS", UTC) are still written next to
+them for exports and older tooling, but nothing parses them on the hot
+path any more.
+"""
+
+import calendar
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import pytz
+
+DISPLAY_TZ = "Asia/Kolkata"
+TEXT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now_epoch():
+    return int(time.time())
+
+
+def to_epoch(text):
+    """Parse a stored UTC text timestamp (with or without microseconds)."""
+    if text is None or text == "":
+        return None
+    # Fixed-width prefix: slicing is far cheaper than strptime fallbacks
+    return calendar.timegm((
+        int(text[0:4]), int(text[5:7]), int(text[8:10]),
+        int(text[11:13]), int(text[14:16]), int(text[17:19]), 0, 0, 0,
+    ))
+
+
+def to_text(ts):
+    """UTC text form of an epoch, for the legacy TEXT columns."""
+    if ts is None:
+        return None
+    return time.strftime(TEXT_FORMAT, time.gmtime(ts))
+
+
+def day_start_epoch(day):
+    """Epoch of 00:00 UTC on a date -- the same boundary the TEXT columns
+    were compared against."""
+    return calendar.timegm(day.timetuple())
+
+
+def local_day_start_epoch(day):
+    """Epoch of 00:00 server-local time on a date: where a day of
+    user_stats (keyed by datetime.now()) begins."""
+    return int(time.mktime(day.timetuple()))
+
+
+def local_date_sql(column):
+    """SQL for the server-local YYYY-MM-DD of an epoch column, the day
+    user_stats counts a completion under."""
+    return f"date({column}, 'unixepoch', 'localtime')"
+
+
+@lru_cache(maxsize=None)
+def get_tz(name):
+    return pytz.timezone(name)
+
+
+def format_epoch(ts, fmt, tz_name=DISPLAY_TZ, memo=None):
+    """Render an epoch in a display timezone.
+
+    `memo` is an optional dict (one per request) so the same timestamp and
+    format pair is only converted once per page.
+    """
+    if memo is not None:
+        key = (ts, fmt, tz_name)
+        rendered = memo.get(key)
+        if rendered is None:
+            rendered = memo[key] = datetime.fromtimestamp(ts, get_tz(tz_name)).strftime(fmt)
+        return rendered
+    return datetime.fromtimestamp(ts, get_tz(tz_name)).strftime(fmt)
@@ -0,0 +1,171 @@
+"""One writer thread per process, committing queued writes in groups.
+
+SQLite takes one writer at a time. With every gunicorn thread committing
+its own small transaction, concurrent requests queue on the file lock
+(busy_timeout) and each pays its own commit. With WRITE_QUEUE_ENABLED the
+task routes hand their write to this process's writer thread instead,
+through run_write:
+
+    new_id = run_write(create_task, user_id, name, description, estimated, priority)
+
+The writer takes whatever jobs are waiting (after the first one it waits
+up to WRITE_BATCH_WAIT_MS for more, up to WRITE_BATCH_MAX) and runs them in
+one transaction, each inside its own SAVEPOINT so a job that raises is
+rolled back alone and its exception re-raised in the request that sent it.
+run_write returns only after the group's COMMIT; the writer's connection
+uses synchronous=FULL, so that acknowledgement survives a power cut, with
+the fsync shared by the whole group.
+
+Several gunicorn workers still mean several writers; they take turns on
+the file lock as before, just far less often. With SHARD_COUNT set there
+is a writer per shard file, and a write goes to its user's.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from db import get_db_connection, get_pool, user_store
+
+_STOP = object()
+
+
+class WriteQueue:
+    """The queue and the thread draining it into group commits."""
+
+    def __init__(self, app, path=None, archive_path=None, max_batch=64, wait_ms=2.0):
+        self.app = app
+        self.path = path
+        self.archive_path = archive_path
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.pid = os.getpid()
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queue fn(cur, *args); the Future resolves after its group commits."""
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.wait
+        while len(batch) < self.max_batch:
+            try:
+                job = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if job is _STOP:
+                self._queue.put(_STOP)  # finish this batch, stop on the next
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            # A connection of its own rather than a pooled one: the settings
+            # below must never leak to a request
+            conn = get_pool(self.path, self.archive_path).connect()
+            conn.isolation_level = None
+            conn.execute("PRAGMA synchronous=FULL")
+            cur = conn.cursor()
+            try:
+                while True:
+                    batch = self._next_batch()
+                    if batch is None:
+                        break
+                    self._commit(cur, batch)
+            finally:
+                conn.close()
+
+    def _commit(self, cur, batch):
+        outcomes = []
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for _future, fn, args in batch:
+                cur.execute("SAVEPOINT job")
+                try:
+                    outcomes.append((True, fn(cur, *args)))
+                except Exception as e:
+                    cur.execute("ROLLBACK TO job")
+                    outcomes.append((False, e))
+                cur.execute("RELEASE job")
+            cur.execute("COMMIT")
+        except Exception as e:
+            if cur.connection.in_transaction:
+                cur.execute("ROLLBACK")
+            for future, _fn, _args in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.jobs += len(batch)
+        for (future, _fn, _args), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(user_id=None):
+    """This process's WriteQueue for `user_id`'s database (see
+    db.user_store), started on first use. A forked worker starts its own:
+    threads don't survive the fork."""
+    path, archive_path = user_store(user_id)
+    writer = _writers.get(path)
+    if writer is None or writer.pid != os.getpid():
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None or writer.pid != os.getpid():
+                config = current_app.config
+                writer = _writers[path] = WriteQueue(
+                    current_app._get_current_object(), path, archive_path,
+                    max_batch=config["WRITE_BATCH_MAX"], wait_ms=config["WRITE_BATCH_WAIT_MS"])
+    return writer
+
+
+def stop_writer():
+    """Drain and stop this process's writers (benchmarks and tests)."""
+    with _writers_lock:
+        for writer in _writers.values():
+            if writer.pid == os.getpid():
+                writer.close()
+        _writers.clear()
+
+
+def run_write(fn, *args):
+    """Run fn(cur, *args) as a committed write and return its result.
+
+    Through the writer thread when WRITE_QUEUE_ENABLED, otherwise on the
+    request's own connection with a commit of its own.
+    """
+    if current_app.config["WRITE_QUEUE_ENABLED"]:
+        return get_writer().submit(fn, *args).result(timeout=current_app.config["WRITE_TIMEOUT_MS"] / 1000)
+    conn = get_db_connection()
+    try:
+        result = fn(conn.cursor(), *args)
+    except Exception:
+        # Like a failed job in the writer: none of it may ride on a later commit
+        conn.rollback()
+        raise
+    conn.commit()
+    return result